@@ -3,8 +3,10 @@
 import os
 import logging
 import random
+import threading
 from pydub import AudioSegment
 from utils import get_path
+from disk_cache import dir_digest
 
 # Cần đảm bảo logging đã được cấu hình ở glue_pipeline
 logger = logging.getLogger(__name__)
@@ -20,10 +22,39 @@ VOL_INTRO = -10.0
 MAX_CROSSFADE = 2000 # 2 giây
 MIN_CROSSFADE = 100  # 100ms tối thiểu
 
-def load_audio(filepath):
+def cache_signature():
+    """Âm lượng + nội dung thư mục nhạc/SFX/intro quyết định bản mix (dùng làm khóa cache stage)."""
+    return {
+        "volumes": [VOL_VOICE, VOL_MUSIC_LOW, VOL_MUSIC_HIGH, VOL_SFX, VOL_INTRO],
+        "music": dir_digest(get_path('assets', 'background_music'), ['.mp3']),
+        "sfx": dir_digest(get_path('assets', 'sfx'), ['.mp3']),
+        "intro_outro": dir_digest(get_path('assets', 'intro_outro'), ['.mp3']),
+    }
+
+# Asset tĩnh (nhạc nền, SFX, intro/outro) đã decode -> giữ trong RAM giữa các tập (daemon mode).
+# AudioSegment là bất biến nên dùng chung an toàn giữa các thread.
+ASSET_CACHE_MAX_ITEMS = int(os.getenv("AUDIO_ASSET_CACHE_ITEMS", "32"))
+_asset_cache = {}
+_asset_lock = threading.Lock()
+
+def load_audio(filepath, cache=False):
+    """cache=True: chỉ dùng cho asset tĩnh, khóa theo (đường dẫn, mtime)."""
     try:
-        if os.path.exists(filepath):
+        if not os.path.exists(filepath):
+            return None
+        if not cache:
             return AudioSegment.from_file(filepath)
+
+        key = (os.path.realpath(filepath), os.stat(filepath).st_mtime_ns)
+        with _asset_lock:
+            audio = _asset_cache.get(key)
+        if audio is None:
+            audio = AudioSegment.from_file(filepath)
+            with _asset_lock:
+                if len(_asset_cache) >= ASSET_CACHE_MAX_ITEMS:
+                    _asset_cache.pop(next(iter(_asset_cache)))
+                _asset_cache[key] = audio
+        return audio
     except Exception as e:
         logger.error(f"⚠️ Lỗi tải file {filepath}: {e}")
     return None
@@ -70,7 +101,7 @@ def generate_dynamic_background(duration_ms):
     last_track = None
 
     for i, fpath in enumerate(bg_files):
-        track = load_audio(fpath)
+        track = load_audio(fpath, cache=True)
         if not track: continue
         last_track = track
 
@@ -151,7 +182,7 @@ def inject_sfx(mixed_audio, voice_len_ms):
 
         # Chọn SFX ngẫu nhiên (kiếm, ngựa, hét...)
         sfx_path = random.choice(sfx_files)
-        sfx = load_audio(sfx_path)
+        sfx = load_audio(sfx_path, cache=True)
         
         if sfx:
             sfx = sfx + VOL_SFX
@@ -195,7 +226,7 @@ def auto_music_sfx(raw_audio_path: str, episode_id: int):
 
         # --- LOGIC THÊM INTRO ---
         if os.path.exists(intro_path):
-            intro = load_audio(intro_path)
+            intro = load_audio(intro_path, cache=True)
             if intro:
                 intro = intro + VOL_INTRO
                 crossfade_duration = get_safe_crossfade(len(intro), len(final_audio), max_cf=1000)
@@ -204,7 +235,7 @@ def auto_music_sfx(raw_audio_path: str, episode_id: int):
 
         # --- LOGIC THÊM OUTRO ---
         if os.path.exists(outro_path):
-            outro = load_audio(outro_path)
+            outro = load_audio(outro_path, cache=True)
             if outro:
                 outro = outro + VOL_INTRO
                 crossfade_duration = get_safe_crossfade(len(final_audio), len(outro), max_cf=1000)
@@ -0,0 +1,481 @@
+# === scripts/backends.py ===
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from types import SimpleNamespace
+from utils import get_path
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# ⚙️ CHỌN BACKEND: DỊCH VỤ THẬT HAY BẢN GIẢ LẬP (LOCAL)
+# =========================================================
+# PIPELINE_BACKEND=fake          -> mọi dịch vụ dùng bản giả lập
+# FAKE_SERVICES=openai,tts       -> chỉ giả lập các dịch vụ được liệt kê
+# Dịch vụ: openai, tts (Edge TTS), sheets (Google Sheets), youtube
+
+# Độ trễ / tỉ lệ lỗi của bản giả lập (có thể chỉnh riêng: FAKE_TTS_LATENCY_MS, FAKE_OPENAI_ERROR_RATE...)
+FAKE_LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "50"))
+FAKE_ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+# Số từ mỗi lần GPT giả viết văn bản (2 lần ~ 1 kịch bản 10 phút)
+FAKE_SCRIPT_WORDS = int(os.getenv("FAKE_SCRIPT_WORDS", "900"))
+# File JSON (danh sách dict) để nạp vào Sheet giả
+FAKE_SHEET_FILE = os.getenv("FAKE_SHEET_FILE", "")
+
+# Client API dùng chung: timeout, số lần SDK tự thử lại, kích thước pool kết nối keep-alive
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT_SECONDS = 10.0
+DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "60"))
+
+
+def use_fake(service):
+    if os.getenv("PIPELINE_BACKEND", "live").lower() == "fake":
+        return True
+    selected = [s.strip().lower() for s in os.getenv("FAKE_SERVICES", "").split(",") if s.strip()]
+    return service in selected
+
+
+def _fake_setting(service, name, default):
+    return float(os.getenv(f"FAKE_{service.upper()}_{name}", default))
+
+
+class FakeServiceError(Exception):
+    """Lỗi giả lập (có status_code giống lỗi HTTP thật: 429 / 500)."""
+    def __init__(self, service, status_code):
+        super().__init__(f"[FAKE {service}] HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _fake_delay_and_errors(service):
+    """Trả về độ trễ (giây) và ném lỗi ngẫu nhiên theo cấu hình của dịch vụ."""
+    latency = _fake_setting(service, "LATENCY_MS", FAKE_LATENCY_MS) / 1000
+    error_rate = _fake_setting(service, "ERROR_RATE", FAKE_ERROR_RATE)
+    if random.random() < error_rate:
+        raise FakeServiceError(service, random.choice([429, 500]))
+    return latency * random.uniform(0.8, 1.2)
+
+
+def _simulate(service):
+    time.sleep(_fake_delay_and_errors(service))
+
+
+async def _simulate_async(service):
+    await asyncio.sleep(_fake_delay_and_errors(service))
+
+
+def _seed(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+# =========================================================
+# 🔊 AUDIO / ẢNH GIẢ (SÓNG SIN & PNG TẠM)
+# =========================================================
+def write_sine_mp3(text, output_path, words_per_minute=150):
+    """Tạo audio sóng sin xác định theo nội dung text (độ dài ~ tốc độ đọc thật)."""
+    from pydub.generators import Sine
+
+    words = max(1, len(text.split()))
+    duration_ms = int(words / words_per_minute * 60 * 1000)
+    freq = 180 + _seed(text) % 80
+    tone = Sine(freq).to_audio_segment(duration=duration_ms, volume=-18.0)
+    tone.set_frame_rate(24000).set_channels(1).export(output_path, format="mp3", bitrate="48k")
+    return duration_ms
+
+
+def write_placeholder_png(prompt, size="1792x1024"):
+    """Ảnh PNG giữ chỗ (nền tối + khối sáng bên phải giống bố cục DALL-E)."""
+    from PIL import Image, ImageDraw
+
+    width, height = (int(v) for v in size.split("x"))
+    output_path = get_path("assets", "temp", f"fake_image_{_seed(prompt):08x}.png")
+    if not os.path.exists(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        img = Image.new("RGB", (width, height), (20, 20, 28))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse((int(width * 0.6), int(height * 0.15), int(width * 0.9), int(height * 0.85)), fill=(150, 120, 90))
+        img.save(output_path, format="PNG")
+    return output_path
+
+
+# =========================================================
+# 🤖 OPENAI GIẢ (CHAT / IMAGES / AUDIO)
+# =========================================================
+_FAKE_WORDS = (
+    "the empire rose from ashes and steel while a young ruler watched the horizon "
+    "burn with ambition armies marched through rain and legend whispered his name "
+    "in every city history would never forget the price of that glory"
+).split()
+
+
+def fake_text(prompt, words):
+    """Văn bản giả xác định theo prompt (các đoạn cách nhau bằng dòng trống)."""
+    rng = random.Random(_seed(prompt))
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        n = min(remaining, rng.randint(60, 110))
+        sentences = []
+        left = n
+        while left > 0:
+            k = min(left, rng.randint(8, 18))
+            sentence = " ".join(rng.choice(_FAKE_WORDS) for _ in range(k))
+            sentences.append(sentence.capitalize() + rng.choice([".", ".", "!", "?"]))
+            left -= k
+        paragraphs.append(" ".join(sentences))
+        remaining -= n
+    return "\n\n".join(paragraphs)
+
+
+def _fake_chat_content(prompt, json_mode):
+    if not json_mode:
+        return fake_text(prompt, FAKE_SCRIPT_WORDS)
+    if "chapters" in prompt:
+        return json.dumps({
+            "title": "The Untold Story",
+            "description": "00:00 Intro\n02:00 Rise\n05:00 Fall\n08:00 Legacy",
+            "tags": ["history", "documentary"],
+            "chapters": ["Origins", "The Rise", "The Fall", "Hidden Secrets", "Legacy"],
+        })
+    if "shorts" in prompt:
+        return json.dumps({"shorts": [
+            {"title": f"Fact #{i + 1}", "content": fake_text(f"{prompt}{i}", 120)} for i in range(5)
+        ]})
+    return json.dumps({})
+
+
+def _chat_response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _chat_stream(content, pieces=40):
+    """Giống stream=True của SDK: trả từng mẩu text qua choices[0].delta.content."""
+    words = content.split(" ")
+    step = max(1, len(words) // pieces)
+    delay = _fake_delay_and_errors("openai") / pieces
+    for i in range(0, len(words), step):
+        time.sleep(delay)
+        piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+class _FakeChatCompletions:
+    def create(self, model, messages, response_format=None, temperature=None, stream=False, **kwargs):
+        _simulate("openai")
+        prompt = messages[-1]["content"]
+        json_mode = bool(response_format) and response_format.get("type") == "json_object"
+        content = _fake_chat_content(prompt, json_mode)
+        return _chat_stream(content) if stream else _chat_response(content)
+
+
+class _FakeImages:
+    def generate(self, model, prompt, size="1792x1024", **kwargs):
+        _simulate("openai")
+        path = write_placeholder_png(prompt, size)
+        return SimpleNamespace(data=[SimpleNamespace(url=f"file://{path}", b64_json=None)])
+
+
+class _FakeSpeechResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def stream_to_file(self, output_path):
+        write_sine_mp3(self.text, output_path)
+
+
+class _FakeSpeech:
+    def create(self, model, voice, input, **kwargs):
+        _simulate("openai")
+        return _FakeSpeechResponse(input)
+
+
+class FakeOpenAI:
+    """Giả lập đúng các phần SDK OpenAI mà pipeline dùng."""
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=_FakeChatCompletions())
+        self.images = _FakeImages()
+        self.audio = SimpleNamespace(speech=_FakeSpeech())
+
+
+# =========================================================
+# 🔌 REGISTRY CLIENT DÙNG CHUNG (1 BẢN / PROCESS)
+# =========================================================
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(name, factory):
+    """
+    Trả về client `name` của process hiện tại, tạo bằng factory() ở lần gọi đầu.
+    Khóa gồm cả pid: process con (fork) không dùng lại pool kết nối của process cha.
+    """
+    key = (os.getpid(), name)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+    return client
+
+
+def _build_openai_client(api_key):
+    import httpx
+    from openai import OpenAI
+
+    # Pool keep-alive dùng chung cho mọi chat / images / TTS -> không bắt tay TLS lại mỗi đoạn
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=60,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+    )
+    return OpenAI(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+
+def openai_client():
+    """
+    Client OpenAI (thật hoặc giả). Thiếu OPENAI_API_KEY -> None.
+    Client thật được tạo 1 lần cho mỗi API key trong mỗi process rồi dùng lại.
+    """
+    if use_fake("openai"):
+        return shared_client("openai:fake", FakeOpenAI)
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("❌ Thiếu OPENAI_API_KEY.")
+        return None
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return shared_client(f"openai:{key_id}", lambda: _build_openai_client(api_key))
+
+
+# =========================================================
+# 🎙️ EDGE TTS GIẢ
+# =========================================================
+class FakeCommunicate:
+    """Giống edge_tts.Communicate: save() ghi audio sóng sin; stream() kèm sự kiện WordBoundary."""
+    def __init__(self, text, voice, **kwargs):
+        self.text = text
+        self.voice = voice
+
+    async def save(self, output_path):
+        await _simulate_async("tts")
+        await asyncio.to_thread(write_sine_mp3, self.text, output_path)
+
+    async def stream(self):
+        await _simulate_async("tts")
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
+        os.close(fd)
+        try:
+            duration_ms = await asyncio.to_thread(write_sine_mp3, self.text, tmp_path)
+            with open(tmp_path, "rb") as f:
+                data = f.read()
+        finally:
+            os.remove(tmp_path)
+
+        # Chia đều thời lượng cho các từ (đơn vị 100ns như Edge)
+        words = self.text.split()
+        step = duration_ms * 10_000 / max(1, len(words))
+        for i, word in enumerate(words):
+            yield {"type": "WordBoundary", "offset": int(i * step), "duration": int(step * 0.9),
+                   "text": word.strip(".,!?;:\"'()")}
+        yield {"type": "audio", "data": data}
+
+
+def supports_rate(service):
+    """Backend TTS thật nhận tham số tốc độ (Edge rate / OpenAI speed); bản giả thì bỏ qua."""
+    return not use_fake(service)
+
+
+def edge_communicate(text, voice, **kwargs):
+    if use_fake("tts"):
+        return FakeCommunicate(text, voice, **kwargs)
+    import edge_tts
+    try:
+        # edge-tts >= 7 mặc định chỉ gửi SentenceBoundary -> xin mốc thời gian từng từ
+        return edge_tts.Communicate(text, voice, boundary="WordBoundary", **kwargs)
+    except TypeError:
+        # edge-tts 6.x: không có tham số boundary, luôn gửi WordBoundary
+        return edge_tts.Communicate(text, voice, **kwargs)
+
+
+# =========================================================
+# 📋 GOOGLE SHEETS GIẢ (TRONG BỘ NHỚ)
+# =========================================================
+_DEFAULT_FAKE_ROWS = [
+    {"ID": 9001, "Name": "Genghis Khan", "CoreTheme": "Conquest", "ContentInput": "", "ImageFolder": "", "Status": "pending"},
+    {"ID": 9002, "Name": "Cleopatra", "CoreTheme": "Power", "ContentInput": "", "ImageFolder": "", "Status": "pending"},
+    {"ID": 9003, "Name": "Napoleon", "CoreTheme": "Ambition", "ContentInput": "", "ImageFolder": "", "Status": "done"},
+]
+
+
+class FakeWorksheet:
+    """Worksheet trong bộ nhớ: dòng 1 là header, dữ liệu bắt đầu từ dòng 2 (giống gspread)."""
+    def __init__(self, records):
+        self.header = list(records[0].keys()) if records else ["ID", "Name", "Status"]
+        self.rows = [[r.get(h, "") for h in self.header] for r in records]
+
+    def _cell_ref(self, row, col):
+        return self.rows[row - 2], col - 1
+
+    def get_all_records(self):
+        _simulate("sheets")
+        return [dict(zip(self.header, r)) for r in self.rows]
+
+    def find(self, value):
+        _simulate("sheets")
+        if value in self.header:
+            return SimpleNamespace(row=1, col=self.header.index(value) + 1, value=value)
+        for i, r in enumerate(self.rows):
+            if value in r:
+                return SimpleNamespace(row=i + 2, col=r.index(value) + 1, value=value)
+        return None
+
+    def cell(self, row, col):
+        _simulate("sheets")
+        if row == 1:
+            return SimpleNamespace(row=row, col=col, value=self.header[col - 1])
+        r, c = self._cell_ref(row, col)
+        return SimpleNamespace(row=row, col=col, value=r[c])
+
+    def row_values(self, row):
+        _simulate("sheets")
+        values = self.header if row == 1 else self.rows[row - 2]
+        # Giống gspread: bỏ các ô trống ở cuối dòng
+        values = list(values)
+        while values and values[-1] in ("", None):
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        _simulate("sheets")
+        return [self.header[col - 1]] + [r[col - 1] for r in self.rows]
+
+    def batch_get(self, ranges):
+        """Chỉ hỗ trợ vùng 1 dòng bắt đầu từ cột A (VD: 'A5:F5')."""
+        _simulate("sheets")
+        out = []
+        for rng in ranges:
+            row = int("".join(ch for ch in rng.split(":")[0] if ch.isdigit()))
+            values = list(self.rows[row - 2]) if 2 <= row < len(self.rows) + 2 else []
+            out.append([values] if values else [])
+        return out
+
+    def update_cell(self, row, col, value):
+        _simulate("sheets")
+        r, c = self._cell_ref(row, col)
+        r[c] = value
+
+    def batch_update(self, data):
+        """Chỉ hỗ trợ vùng 1 ô dạng A1 (VD: 'F5') - đủ cho pipeline."""
+        _simulate("sheets")
+        for item in data:
+            letters = "".join(ch for ch in item["range"] if ch.isalpha())
+            row = int("".join(ch for ch in item["range"] if ch.isdigit()))
+            col = 0
+            for ch in letters.upper():
+                col = col * 26 + ord(ch) - 64
+            r, c = self._cell_ref(row, col)
+            r[c] = item["values"][0][0]
+
+
+class FakeSheetClient:
+    _worksheet = None
+
+    def open_by_key(self, key):
+        _simulate("sheets")
+        if FakeSheetClient._worksheet is None:
+            records = _DEFAULT_FAKE_ROWS
+            if FAKE_SHEET_FILE and os.path.exists(FAKE_SHEET_FILE):
+                with open(FAKE_SHEET_FILE, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+            FakeSheetClient._worksheet = FakeWorksheet(records)
+        return SimpleNamespace(get_worksheet=lambda index: FakeSheetClient._worksheet)
+
+
+# =========================================================
+# 📺 YOUTUBE GIẢ (SINK: ĐỌC HẾT FILE RỒI BỎ)
+# =========================================================
+class _FakeUploadRequest:
+    def __init__(self, media_body, chunk_size=8 * 1024 * 1024):
+        self.media_body = media_body
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def next_chunk(self):
+        total = self.media_body.size() or 0
+        if self.offset == 0:
+            _simulate("youtube")
+        if self.offset < total:
+            length = min(self.chunk_size, total - self.offset)
+            self.media_body.getbytes(self.offset, length)
+            self.offset += length
+        if self.offset >= total:
+            return None, {"id": f"fake_{_seed(str(total) + str(time.time())):08x}"}
+        return SimpleNamespace(progress=lambda: self.offset / total), None
+
+
+class _FakeMedia:
+    """Thay MediaFileUpload (không cần googleapiclient): đọc thẳng từ file."""
+    def __init__(self, path):
+        self.path = path
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def getbytes(self, begin, length):
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            return f.read(length)
+
+
+class FakeYouTube:
+    def media_upload(self, path, **_kwargs):
+        return _FakeMedia(path)
+
+    def videos(self):
+        return SimpleNamespace(insert=lambda part, body, media_body: _FakeUploadRequest(media_body))
+
+    def thumbnails(self):
+        def _set(videoId, media_body):
+            return SimpleNamespace(execute=lambda: _simulate("youtube") or {"videoId": videoId})
+        return SimpleNamespace(set=_set)
+
+
+# =========================================================
+# 🌐 TẢI FILE QUA HTTP (HỖ TRỢ file:// CHO BẢN GIẢ LẬP)
+# =========================================================
+def _build_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def http_session():
+    """requests.Session dùng chung (keep-alive) cho các lần tải file."""
+    return shared_client("http", _build_http_session)
+
+
+def http_get_bytes(url, timeout=DOWNLOAD_TIMEOUT_SECONDS):
+    if url.startswith("file://"):
+        with open(url[len("file://"):], "rb") as f:
+            return f.read()
+    response = http_session().get(url, timeout=(HTTP_CONNECT_TIMEOUT_SECONDS, timeout))
+    response.raise_for_status()
+    return response.content
@@ -0,0 +1,221 @@
+# === scripts/benchmark_media.py ===
+"""
+Benchmark các stage media (TTS assembly, mix nhạc, render video dài, render short, thumbnail)
+trên dữ liệu tổng hợp. Không gọi API thật: TTS dùng backend giả lập (sóng sin).
+
+Chạy:  python scripts/benchmark_media.py --durations 1,10,30
+Kết quả lưu ở outputs/benchmarks/history.jsonl; lần chạy chậm hơn baseline quá ngưỡng
+sẽ bị đánh dấu REGRESSION và script thoát với mã 1.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import statistics
+from datetime import datetime
+from utils import get_path, setup_environment, cleanup_temp_files
+import profiler
+import backends
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BENCH_DIR = get_path("assets", "temp", "bench")
+HISTORY_PATH = get_path("outputs", "benchmarks", "history.jsonl")
+
+ALL_STAGES = ["tts_assembly", "mix", "render_long", "render_short", "thumbnail"]
+# Stage không phụ thuộc độ dài narration -> chỉ chạy 1 lần / lần benchmark
+FIXED_STAGES = {"render_short", "thumbnail"}
+SHORT_SECONDS = 45
+# Số lần chạy gần nhất dùng làm baseline (trung vị)
+BASELINE_RUNS = 5
+
+
+# =========================================================
+# 🧪 TẠO DỮ LIỆU TỔNG HỢP
+# =========================================================
+def make_narration(minutes):
+    """Audio narration giả dài `minutes` phút (tạo 1 lần, dùng lại giữa các lần chạy)."""
+    from pydub.generators import Sine
+
+    path = os.path.join(BENCH_DIR, f"narration_{minutes}m.mp3")
+    if not os.path.exists(path):
+        total_ms = int(minutes * 60 * 1000)
+        # Tạo 1 phút rồi lặp lại (tránh sinh nguyên khối 30 phút ở 44.1kHz)
+        minute = Sine(220).to_audio_segment(duration=60 * 1000, volume=-18.0).set_frame_rate(24000).set_channels(1)
+        audio = minute * (total_ms // 60000) + minute[:total_ms % 60000]
+        audio.export(path, format="mp3", bitrate="48k")
+    return path
+
+
+def make_script(minutes, name):
+    """Kịch bản giả ~150 từ/phút."""
+    path = os.path.join(BENCH_DIR, f"{name}.txt")
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(backends.fake_text(name, int(minutes * 150)))
+    return path
+
+
+def make_fixtures(durations):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    return {
+        "image": backends.write_placeholder_png("benchmark character"),
+        "narrations": {m: make_narration(m) for m in durations},
+        "scripts": {m: make_script(m, f"script_{m}m") for m in durations},
+        "short_audio": make_narration(SHORT_SECONDS / 60),
+        "short_script": make_script(SHORT_SECONDS / 60, "short_script"),
+    }
+
+
+def audio_seconds(path):
+    from pydub.utils import mediainfo
+    try:
+        return float(mediainfo(path)["duration"])
+    except Exception:
+        return None
+
+
+# =========================================================
+# ⏱️ CÁC CASE BENCHMARK
+# =========================================================
+def run_case(stage_name, minutes, fx):
+    """Chạy 1 stage, trả về (đường dẫn output, số giây media đầu ra hoặc None)."""
+    bench_id = f"bench_{minutes}m" if minutes else "bench"
+
+    if stage_name == "tts_assembly":
+        from create_tts import create_tts
+        out = create_tts(fx["scripts"][minutes], bench_id, "long")
+        return out, audio_seconds(out) if out else None
+
+    if stage_name == "mix":
+        from auto_music_sfx import auto_music_sfx
+        out = auto_music_sfx(fx["narrations"][minutes], bench_id)
+        return out, audio_seconds(out) if out else None
+
+    if stage_name == "render_long":
+        from create_video import create_video
+        out = create_video(fx["narrations"][minutes], bench_id, image_path=fx["image"], title_text="Benchmark Episode")
+        return out, audio_seconds(fx["narrations"][minutes]) if out else None
+
+    if stage_name == "render_short":
+        from create_shorts import create_shorts
+        with open(fx["short_script"], encoding="utf-8") as f:
+            text = f.read()
+        out = create_shorts(fx["short_audio"], text, f"{bench_id}_1", "Benchmark", "Benchmark Hook", fx["image"])
+        return out, min(SHORT_SECONDS, 60) if out else None
+
+    if stage_name == "thumbnail":
+        from create_thumbnail import add_text_to_thumbnail
+        out = add_text_to_thumbnail(fx["image"], "BENCHMARK EPISODE", os.path.join(BENCH_DIR, "thumb.jpg"))
+        return out, None
+
+    raise ValueError(f"Stage không hỗ trợ: {stage_name}")
+
+
+def measure(stage_name, minutes, fx):
+    prof = profiler.start_run(f"bench_{stage_name}")
+    with prof.stage(stage_name):
+        out, media_s = run_case(stage_name, minutes, fx)
+    record = prof.report()["stages"][stage_name]
+
+    result = {
+        "stage": stage_name,
+        "minutes": minutes,
+        "ok": bool(out),
+        "wall_s": record["wall_s"],
+        "cpu_s": round(record["cpu_s"] + record["children_cpu_s"], 3),
+        "peak_rss_mb": record["peak_rss_mb"],
+        "media_s": media_s,
+        # Realtime factor: số giây media đầu ra / 1 giây wall time (càng cao càng nhanh)
+        "rtf": round(media_s / record["wall_s"], 3) if media_s and record["wall_s"] else None,
+    }
+    if out and os.path.isfile(out) and not out.startswith(BENCH_DIR):
+        os.remove(out)
+    # File trung gian theo ID (chunk TTS, .align.json, char_blend, nền Shorts...) -> dọn như tập thật
+    cleanup_temp_files(f"bench_{minutes}m" if minutes else "bench")
+    return result
+
+
+# =========================================================
+# 📈 LƯU LỊCH SỬ & PHÁT HIỆN REGRESSION
+# =========================================================
+def load_history():
+    if not os.path.exists(HISTORY_PATH):
+        return []
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(results, history, threshold):
+    """So sánh với trung vị các lần chạy trước (cùng stage + độ dài)."""
+    regressions = []
+    for r in results:
+        if not r["ok"]:
+            continue
+        past = [
+            h for run in history[-BASELINE_RUNS:] for h in run["results"]
+            if h["stage"] == r["stage"] and h["minutes"] == r["minutes"] and h["ok"]
+        ]
+        if not past:
+            continue
+        if r["rtf"] is not None and all(h.get("rtf") for h in past):
+            baseline = statistics.median(h["rtf"] for h in past)
+            slower = r["rtf"] < baseline * (1 - threshold)
+            detail = f"RTF {r['rtf']:.2f} < baseline {baseline:.2f}"
+        else:
+            baseline = statistics.median(h["wall_s"] for h in past)
+            slower = r["wall_s"] > baseline * (1 + threshold)
+            detail = f"wall {r['wall_s']:.2f}s > baseline {baseline:.2f}s"
+        if slower:
+            regressions.append(f"{r['stage']} ({r['minutes']} phút): {detail}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các stage media")
+    parser.add_argument("--durations", default="1,10,30", help="Độ dài narration (phút), VD: 1,10,30")
+    parser.add_argument("--stages", default=",".join(ALL_STAGES), help=f"Các stage: {','.join(ALL_STAGES)}")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Ngưỡng chậm hơn baseline (0.15 = 15%%)")
+    parser.add_argument("--no-save", action="store_true", help="Không ghi kết quả vào lịch sử")
+    args = parser.parse_args()
+
+    # Không gọi dịch vụ thật: TTS giả lập, không độ trễ mạng
+    os.environ["FAKE_SERVICES"] = "openai,tts"
+    # Fixture cố định -> cache chunk TTS sẽ trúng từ lần chạy thứ 2, đo sai thời gian TTS
+    os.environ["TTS_CHUNK_CACHE"] = "0"
+    os.environ.setdefault("FAKE_TTS_LATENCY_MS", "0")
+    os.environ.setdefault("FAKE_OPENAI_LATENCY_MS", "0")
+
+    setup_environment()
+    durations = [float(d) if "." in d else int(d) for d in args.durations.split(",") if d.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    fx = make_fixtures(durations)
+
+    results = []
+    for stage_name in stages:
+        for minutes in ([None] if stage_name in FIXED_STAGES else durations):
+            logger.info(f"⏱️ Benchmark {stage_name} ({minutes or '-'} phút)...")
+            r = measure(stage_name, minutes, fx)
+            results.append(r)
+            rtf = f"RTF x{r['rtf']:.2f}" if r["rtf"] else "RTF -"
+            logger.info(f"   -> {r['wall_s']:.2f}s | {rtf} | RSS {r['peak_rss_mb']:.0f}MB | ok={r['ok']}")
+
+    history = load_history()
+    regressions = find_regressions(results, history, args.threshold)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"at": datetime.now().isoformat(timespec="seconds"), "results": results}) + "\n")
+
+    for line in regressions:
+        logger.error(f"🐢 REGRESSION: {line}")
+    if regressions:
+        sys.exit(1)
+    logger.info("✅ Không phát hiện regression.")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ from moviepy.editor import (
     TextClip, CompositeVideoClip, CompositeAudioClip, concatenate_audioclips, vfx
 )
 from utils import get_path
+from disk_cache import file_digest
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,17 @@ SHORTS_HEIGHT = 1920
 SHORTS_SIZE = (SHORTS_WIDTH, SHORTS_HEIGHT)
 MAX_DURATION = 60 
 
+def cache_signature(episode_id):
+    """Kích thước + assets nền/nhạc quyết định short đầu ra (dùng làm khóa cache stage)."""
+    return {
+        "size": list(SHORTS_SIZE),
+        "max_duration": MAX_DURATION,
+        "assets": [file_digest(get_path('assets', *parts)) for parts in (
+            ('background_music', 'loop_1.mp3'), ('images', 'bg_short_epic.png'),
+            ('images', f"{episode_id.split('_')[0]}_bg.png"),
+        )],
+    }
+
 # =========================================================
 # 🎨 HÀM XỬ LÝ BACKGROUND HYBRID (9:16) - FIX HIỂN THỊ
 # =========================================================
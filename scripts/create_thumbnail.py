@@ -1,8 +1,10 @@
 # === scripts/create_thumbnail.py ===
 import os
 import logging
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 from utils import get_path
+from disk_cache import file_digest
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,18 @@ def find_font(font_name="Impact.ttf"):
     # Fallback font hệ thống Linux
     return 'DejaVuSans-Bold' 
 
+@lru_cache(maxsize=8)
+def load_font(font_path, size):
+    """Font đã parse được giữ lại giữa các lần tạo thumbnail (daemon mode)."""
+    try:
+        return ImageFont.truetype(font_path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+def cache_signature():
+    """Font quyết định thumbnail đầu ra (dùng làm khóa cache stage)."""
+    return {"font": file_digest(get_path('assets', 'fonts', 'Impact.ttf'))}
+
 def add_text_to_thumbnail(image_path, text_content, output_path):
     """
     Thêm text vào Thumbnail (Chữ Vàng, không có hộp đỏ)
@@ -29,10 +43,7 @@ def add_text_to_thumbnail(image_path, text_content, output_path):
         
         # Cỡ chữ lớn
         target_font_size = 90
-        try:
-            font = ImageFont.truetype(font_path, target_font_size)
-        except:
-            font = ImageFont.load_default()
+        font = load_font(font_path, target_font_size)
 
         text_content = text_content.upper() 
 
@@ -5,11 +5,20 @@ import asyncio
 import textwrap
 import random
 import re
+import json
 import time
-from openai import OpenAI
+import wave
+import subprocess
+import numpy as np
+import threading
+import collections
 from pydub import AudioSegment
-import edge_tts
 from utils import get_path
+import backends
+import profiler
+import tts_cache
+from rate_limiter import get_limiter
+from status_reporter import report_progress
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +41,56 @@ USE_OPENAI_BACKUP = True
 SPEED_MULTIPLIER_LONG = 1.10
 SPEED_MULTIPLIER_SHORT = 1.15
 
+# Hedging: đoạn chưa xong sau p95 độ trễ gần đây -> gửi thêm 1 request dự phòng
+TTS_HEDGE = os.getenv("TTS_HEDGE", "1") == "1"
+# "edge": giọng Edge khác; "openai": OpenAI TTS (tốn tiền nhưng khác hạ tầng)
+HEDGE_BACKEND = os.getenv("TTS_HEDGE_BACKEND", "edge")
+HEDGE_PERCENTILE = 95
+# Chưa đủ mẫu độ trễ -> chờ mặc định; không bao giờ hedge sớm hơn mức tối thiểu
+HEDGE_MIN_SAMPLES = 5
+HEDGE_DEFAULT_SECONDS = 20.0
+HEDGE_MIN_SECONDS = 3.0
+
+def speed_for(mode="long"):
+    return SPEED_MULTIPLIER_LONG if mode == "long" else SPEED_MULTIPLIER_SHORT
+
+def cache_signature(mode="long"):
+    """Cấu hình giọng đọc quyết định audio đầu ra (dùng làm khóa cache stage)."""
+    return {
+        "voices": EDGE_VOICES,
+        "openai_backup": USE_OPENAI_BACKUP,
+        "speed": speed_for(mode),
+        # Tốc độ áp dụng lúc TTS (giữ cao độ giọng), không còn tăng frame_rate sau khi ghép
+        "speed_method": "synthesis",
+        # Kèm file alignment (.align.json) để cắt Shorts từ audio video dài
+        "alignment": 1,
+        # Audio giả (sóng sin) không bao giờ bị lần chạy thật dùng lại
+        "fake": [backends.use_fake("tts"), backends.use_fake("openai")],
+    }
+
+def edge_rate(speed):
+    """Hệ số tốc độ -> tham số rate của Edge TTS, VD: 1.15 -> '+15%'."""
+    return f"{round((speed - 1) * 100):+d}%"
+
+# =========================================================
+# ⏱️ ĐỘ TRỄ GẦN ĐÂY CỦA TỪNG ĐOẠN (CHO HEDGING)
+# =========================================================
+_chunk_latencies = collections.deque(maxlen=50)
+_chunk_latencies_lock = threading.Lock()
+
+def record_chunk_latency(seconds):
+    with _chunk_latencies_lock:
+        _chunk_latencies.append(seconds)
+
+def hedge_delay():
+    """Ngưỡng hedging (giây): p95 độ trễ 50 đoạn gần nhất."""
+    with _chunk_latencies_lock:
+        samples = sorted(_chunk_latencies)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_SECONDS
+    idx = min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))
+    return max(HEDGE_MIN_SECONDS, samples[idx])
+
 # =========================================================
 # 🧹 MODULE 1: LÀM SẠCH KỊCH BẢN
 # =========================================================
@@ -57,25 +116,141 @@ def clean_text_for_tts(text):
 # =========================================================
 # 🎙️ MODULE 2: EDGE TTS (XỬ LÝ TỪNG CHUNK)
 # =========================================================
-async def _generate_edge_one_chunk(text, output_path):
+def _words_path(audio_path):
+    """File tạm chứa mốc thời gian từng từ (WordBoundary) của 1 chunk."""
+    return audio_path + ".words.json"
+
+def _remove_chunk(audio_path):
+    for path in (audio_path, _words_path(audio_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _move_chunk(src, dst):
+    os.replace(src, dst)
+    if os.path.exists(_words_path(src)):
+        os.replace(_words_path(src), _words_path(dst))
+    elif os.path.exists(_words_path(dst)):
+        os.remove(_words_path(dst))
+
+def _pop_words(audio_path):
+    """Đọc + xóa file mốc thời gian của chunk. None nếu backend không trả WordBoundary."""
+    path = _words_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(path)
+
+async def _edge_request(text, output_path, voice, speed=1.0, retry=False):
+    """
+    1 request Edge TTS (qua limiter chung). True nếu file có dữ liệu (>100 byte).
+    Ghi kèm mốc thời gian từng từ (sự kiện WordBoundary, đơn vị 100ns) ra file .words.json.
+    """
+    words = []
+    async with get_limiter("edge_tts").slot_async():
+        with profiler.api_call("edge_tts", retry=retry):
+            communicate = backends.edge_communicate(text, voice, rate=edge_rate(speed))
+            with open(output_path, "wb") as f:
+                async for event in communicate.stream():
+                    if event["type"] == "audio":
+                        f.write(event["data"])
+                    elif event["type"] == "WordBoundary":
+                        words.append({
+                            "word": event["text"],
+                            "start": round(event["offset"] / 1e7, 3),
+                            "end": round((event["offset"] + event["duration"]) / 1e7, 3),
+                        })
+    if not (os.path.exists(output_path) and os.path.getsize(output_path) > 100):
+        return False
+    if words:
+        with open(_words_path(output_path), "w", encoding="utf-8") as f:
+            json.dump(words, f, ensure_ascii=False)
+    return True
+
+async def _hedge_request(text, output_path, voice, speed):
+    """Request dự phòng cho đoạn bị chậm: giọng Edge khác, hoặc OpenAI nếu HEDGE_BACKEND=openai."""
+    if HEDGE_BACKEND == "openai" and USE_OPENAI_BACKUP:
+        return await asyncio.to_thread(_generate_openai_one_chunk, text, output_path, speed)
+    other_voices = [v for v in EDGE_VOICES if v != voice] or EDGE_VOICES
+    return await _edge_request(text, output_path, random.choice(other_voices), speed, retry=True)
+
+async def _edge_hedged(text, output_path, voice, attempt, speed=1.0):
+    """
+    Gửi request chính; quá hedge_delay() giây chưa xong -> gửi thêm 1 request dự phòng,
+    lấy kết quả nào về trước (thành công), hủy request còn lại.
+    Request chính lỗi trước khi hedge -> ném Exception như cũ (vòng retry bên ngoài xử lý).
+    """
+    starts = {}
+    primary = asyncio.ensure_future(_edge_request(text, output_path, voice, speed, retry=attempt > 0))
+    starts[primary] = time.monotonic()
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay() if TTS_HEDGE else None)
+    if done:
+        ok = primary.result()
+        if ok:
+            record_chunk_latency(time.monotonic() - starts[primary])
+        return ok
+
+    # Đoạn chậm hơn p95 gần đây -> gửi request dự phòng (file riêng, đổi tên nếu thắng)
+    logger.info(f"🐢 Đoạn TTS chậm quá {hedge_delay():.1f}s -> gửi request dự phòng ({HEDGE_BACKEND})...")
+    root, ext = os.path.splitext(output_path)
+    hedge_path = f"{root}_hedge{ext}"
+    hedge = asyncio.ensure_future(_hedge_request(text, hedge_path, voice, speed))
+    starts[hedge] = time.monotonic()
+    pending = {primary: output_path, hedge: hedge_path}
+
+    winner = None
+    primary_elapsed = None
+    try:
+        while pending and winner is None:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = pending.pop(task)
+                if task is primary:
+                    primary_elapsed = time.monotonic() - starts[primary]
+                try:
+                    ok = task.result()
+                except Exception as e:
+                    logger.warning(f"⚠️ Request TTS {'dự phòng' if task is hedge else 'chính'} lỗi: {e}")
+                    ok = False
+                if ok and winner is None:
+                    winner = task, path
+    finally:
+        # Hủy request thua cuộc và dọn file dở dang của nó
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for path in pending.values():
+            _remove_chunk(path)
+
+    # Luôn ghi thời gian của request chính, kể cả khi nó thua / lỗi / bị hủy (khi đó là mẫu bị chặn
+    # dưới, >= ngưỡng hedge): bỏ qua các mẫu chậm thì p95 tụt dần và hedging ngày càng nhiều
+    record_chunk_latency(primary_elapsed if primary_elapsed is not None else time.monotonic() - starts[primary])
+
+    if winner is None:
+        return False
+    task, path = winner
+    if task is hedge:
+        logger.info("🏁 Request dự phòng về trước -> dùng kết quả dự phòng.")
+        _move_chunk(path, output_path)
+    else:
+        _remove_chunk(hedge_path)
+    return True
+
+async def _generate_edge_one_chunk(text, output_path, speed=1.0):
     """
-    Sinh 1 đoạn audio ngắn. 
+    Sinh 1 đoạn audio ngắn (đọc sẵn ở tốc độ `speed`). 
     Tự động thử lại (Retry) và đổi giọng (Rotate Voice) nếu lỗi.
+    Tốc độ gửi request do limiter chung của Edge quyết định (giảm tốc khi bị 429);
+    đoạn bị treo lâu bất thường được gửi thêm request dự phòng (hedging).
     """
     # Thử tối đa 3 lần cho mỗi đoạn
     for attempt in range(3):
         voice = random.choice(EDGE_VOICES)
         try:
-            # Thêm độ trễ ngẫu nhiên để tránh bị chặn
-            await asyncio.sleep(random.uniform(0.5, 1.5))
-            
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(output_path)
-            
-            # [CHECK QUAN TRỌNG] File có tồn tại và có dữ liệu (>1KB) không?
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 100:
-                return True 
-            
+            if await _edge_hedged(text, output_path, voice, attempt, speed):
+                return True
         except Exception as e:
             logger.warning(f"⚠️ EdgeTTS Chunk Lỗi (Lần {attempt+1}): {e}")
             
@@ -84,17 +259,17 @@ async def _generate_edge_one_chunk(text, output_path):
 # =========================================================
 # 💎 MODULE 3: OPENAI TTS (FALLBACK CHO TỪNG CHUNK)
 # =========================================================
-def _generate_openai_one_chunk(text, output_path):
+def _generate_openai_one_chunk(text, output_path, speed=1.0):
     if not USE_OPENAI_BACKUP: return False
     
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key: return False
+    client = backends.openai_client()
+    if not client: return False
 
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.audio.speech.create(
-            model="tts-1", voice="onyx", input=text
-        )
+        with get_limiter("openai.tts").slot(), profiler.api_call("openai.tts"):
+            response = client.audio.speech.create(
+                model="tts-1", voice="onyx", input=text, speed=speed
+            )
         response.stream_to_file(output_path)
         return True
     except Exception as e:
@@ -104,9 +279,330 @@ def _generate_openai_one_chunk(text, output_path):
 # =========================================================
 # 🚀 MAIN FUNCTION: XỬ LÝ GHÉP CHUNK (BẤT TỬ)
 # =========================================================
-def create_tts(script_path, episode_id, mode="long"):
+CHUNK_CHARS = 800
+# Định dạng PCM chung khi ghép (Edge / OpenAI TTS đều trả về 24kHz mono)
+PCM_RATE = 24000
+# Độ dài khung time-stretch (~43ms ở 24kHz): đủ dài để giữ cao độ giọng nam trầm
+STRETCH_FRAME = 1024
+# Độ lệch tối đa khi dò khớp pha giữa 2 khung (~10ms)
+STRETCH_TOLERANCE = 256
+# Số đoạn TTS chạy đồng thời trong 1 event loop (1 = tuần tự như cũ)
+TTS_CONCURRENCY = max(1, int(os.getenv("TTS_CONCURRENCY", "4")))
+# Shorts là trích đoạn kịch bản dài -> cắt từ audio video dài thay vì TTS lại
+SLICE_SHORTS_FROM_LONG = os.getenv("SLICE_SHORTS_FROM_LONG", "1") == "1"
+# Khoảng đệm (giây) trước từ đầu / sau từ cuối khi cắt
+SLICE_PAD_SECONDS = 0.15
+
+def split_into_chunks(text):
+    """
+    Chia thành các đoạn nhỏ 800 ký tự để không bao giờ bị Timeout.
+    Chia theo từng đoạn văn trước -> sửa 1 đoạn văn không làm lệch ranh giới các chunk khác
+    (cache từng chunk theo nội dung vẫn trúng), streaming và đọc cả file cho cùng kết quả.
+    """
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        chunks.extend(textwrap.wrap(clean_text_for_tts(paragraph), width=CHUNK_CHARS, break_long_words=False))
+    return chunks
+
+def chunk_signature(speed=1.0):
+    """Cấu hình quyết định audio của 1 chunk (khóa cache từng chunk)."""
+    return {
+        "backend": "fake" if backends.use_fake("tts") else "edge",
+        "voices": EDGE_VOICES,
+        "openai_backup": ("fake" if backends.use_fake("openai") else "tts-1", "onyx") if USE_OPENAI_BACKUP else None,
+        "rate": edge_rate(speed),
+    }
+
+async def _synthesize_chunk(chunk, chunk_file, i, speed=1.0):
+    """
+    TTS 1 đoạn (cache, Edge, rồi OpenAI dự phòng) ở tốc độ `speed`.
+    Trả về dict {file, speed (tốc độ backend đã áp dụng), words (mốc thời gian hoặc None), text},
+    hoặc None nếu lỗi.
+    """
+    # Đoạn này đã đọc ở lần chạy trước (cùng text + cấu hình giọng) -> dùng lại
+    key = tts_cache.chunk_key(chunk, chunk_signature(speed))
+    cached = tts_cache.fetch(key, chunk_file)
+    if cached is not None:
+        return {"file": chunk_file, "speed": cached.get("speed", speed), "words": cached.get("words"), "text": chunk}
+
+    # A. Thử EdgeTTS trước
+    success = await _generate_edge_one_chunk(chunk, chunk_file, speed)
+    applied = speed if backends.supports_rate("tts") else 1.0
+
+    # B. Nếu Edge lỗi, thử OpenAI (client đồng bộ -> chạy trong thread, không chặn event loop)
+    if not success:
+        logger.warning(f"⚠️ Chuyển sang OpenAI Backup cho đoạn {i}...")
+        success = await asyncio.to_thread(_generate_openai_one_chunk, chunk, chunk_file, speed)
+        applied = speed if backends.supports_rate("openai") else 1.0
+
+    if success and os.path.exists(chunk_file):
+        words = _pop_words(chunk_file)
+        # Ghi cache trong thread (put() còn dọn entry cũ -> quét thư mục cache)
+        await asyncio.to_thread(tts_cache.store, key, chunk_file, {"speed": applied, "words": words})
+        return {"file": chunk_file, "speed": applied, "words": words, "text": chunk}
+    logger.error(f"💀 BỎ QUA ĐOẠN {i} (Không tạo được Audio): '{chunk[:20]}...'")
+    return None
+
+async def _synthesize_all(chunks, episode_id, mode, total=None):
+    """
+    TTS mọi đoạn trong 1 event loop, tối đa TTS_CONCURRENCY đoạn cùng lúc.
+    `chunks` là list, hoặc iterator chặn chờ (streaming) -> đọc trong thread để event loop
+    vẫn chạy các đoạn đã nhận. Trả về list kết quả _synthesize_chunk (None = đoạn lỗi) theo đúng thứ tự.
+    """
+    semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+    speed = speed_for(mode)
+    finished = 0
+
+    async def _one(i, chunk):
+        nonlocal finished
+        # Tên chunk gồm cả mode để TTS video dài và shorts chạy song song không ghi đè nhau
+        chunk_file = get_path("assets", "temp", f"{episode_id}_{mode}_part_{i}.mp3")
+        async with semaphore:
+            result = await _synthesize_chunk(chunk, chunk_file, i, speed)
+        finished += 1
+        if mode == "long":
+            report_progress("TTS", f"{finished}/{total or '?'}")
+        # Log tiến độ mỗi 5 đoạn để biết không bị treo
+        if finished % 5 == 1:
+            logger.info(f"   ...Đã xong {finished}/{total or '?'} đoạn")
+        return result
+
+    tasks = []
+    iterator = iter(chunks)
+    blocking = not isinstance(chunks, (list, tuple))
+    i = 0
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, None) if blocking else next(iterator, None)
+            if chunk is None:
+                break
+            if len(chunk) >= 2:
+                tasks.append(asyncio.ensure_future(_one(i, chunk)))
+            i += 1
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # Kịch bản lỗi giữa chừng -> hủy các đoạn đang đọc, xóa file đã / đang tạo
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for n in range(i + 1):
+            _remove_chunk(get_path("assets", "temp", f"{episode_id}_{mode}_part_{n}.mp3"))
+        raise
+
+def _load_chunk(chunk_file, i):
+    try:
+        segment = AudioSegment.from_file(chunk_file)
+        # Dọn rác ngay lập tức để nhẹ RAM
+        os.remove(chunk_file)
+        return segment
+    except Exception as e:
+        logger.error(f"❌ Lỗi ghép file audio đoạn {i}: {e}")
+        return None
+
+def time_stretch(samples, speed, frame=STRETCH_FRAME, tolerance=STRETCH_TOLERANCE):
+    """
+    Tăng/giảm tốc độ đọc giữ nguyên cao độ (WSOLA: cửa sổ Hann chồng 50%, mỗi khung được
+    dịch tối đa ±tolerance mẫu cho khớp pha với khung trước) cho PCM int16 mono.
+    Chỉ việc dò vị trí khung là vòng lặp (mỗi vòng 1 np.correlate); cắt khung + overlap-add
+    vector hóa bằng numpy. Chỉ dùng cho backend không có tham số tốc độ.
+    """
+    hop_out = frame // 2
+    hop_in = hop_out * speed
+    n_frames = int((len(samples) - frame) / hop_in) + 1
+    if abs(speed - 1) < 1e-3 or n_frames < 2:
+        return samples
+
+    # Đệm 2 đầu để khung nào cũng dò được đủ ±tolerance
+    x = np.pad(samples.astype(np.float32), (tolerance, tolerance + frame))
+    positions = np.empty(n_frames, dtype=np.int64)
+    positions[0] = tolerance
+    for k in range(1, n_frames):
+        # Đoạn "đáng lẽ đi tiếp" sau khung trước -> tìm vị trí gần k*hop_in giống nó nhất
+        natural = x[positions[k - 1] + hop_out: positions[k - 1] + frame]
+        base = tolerance + int(round(k * hop_in))
+        search = x[base - tolerance: base + tolerance + hop_out]
+        positions[k] = base - tolerance + int(np.argmax(np.correlate(search, natural, mode="valid")))
+
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)
+    frames = x[positions[:, None] + np.arange(frame)[None, :]] * window
+
+    # Chồng 50%: block k của output = nửa đầu khung k + nửa sau khung k-1 (Hann tuần hoàn cộng = 1)
+    out = np.zeros((n_frames + 1, hop_out), dtype=np.float32)
+    out[:-1] += frames[:, :hop_out]
+    out[1:] += frames[:, hop_out:]
+    return np.clip(out.ravel(), -32768, 32767).astype(np.int16)
+
+def _estimate_words(text, seconds):
+    """Backend không có WordBoundary (OpenAI): chia thời lượng chunk cho các từ theo độ dài từ."""
+    tokens = text.split()
+    weights = np.array([len(t) + 1 for t in tokens], dtype=np.float64)
+    edges = np.concatenate([[0.0], np.cumsum(weights)]) / max(weights.sum(), 1) * seconds
+    return [{"word": t, "start": float(edges[k]), "end": float(edges[k + 1])} for k, t in enumerate(tokens)]
+
+def _assemble_chunks(chunk_results, wav_path, speed=1.0):
+    """
+    Giải mã lần lượt từng chunk và ghi nối tiếp vào 1 file WAV (PCM 16-bit mono):
+    RAM chỉ giữ 1 chunk tại 1 thời điểm, thời gian tăng tuyến tính theo độ dài tập
+    (thay cho `combined += segment` chép lại cả bộ đệm mỗi lần).
+    Chunk từ backend chưa áp dụng tốc độ -> time_stretch riêng chunk đó.
+    Trả về (độ dài ms, alignment: list {word, start, end} theo giây trên toàn bộ audio).
+    """
+    frames = 0
+    alignment = []
+    with wave.open(wav_path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(PCM_RATE)
+        for i, result in enumerate(chunk_results):
+            if result is None:
+                continue
+            segment = _load_chunk(result["file"], i)
+            if segment is None:
+                continue
+            segment = segment.set_frame_rate(PCM_RATE).set_channels(1).set_sample_width(2)
+            samples = np.frombuffer(segment.raw_data, dtype=np.int16)
+            applied = result["speed"]
+            if abs(speed / applied - 1) > 1e-3:
+                samples = time_stretch(samples, speed / applied)
+
+            # Mốc thời gian của chunk -> dời theo vị trí chunk (và co giãn nếu vừa time_stretch)
+            offset = frames / PCM_RATE
+            seconds = len(samples) / PCM_RATE
+            words = result.get("words")
+            scale = applied / speed
+            if not words:
+                words, scale = _estimate_words(result["text"], seconds), 1.0
+            for w in words:
+                alignment.append({
+                    "word": w["word"],
+                    "start": round(offset + min(w["start"] * scale, seconds), 3),
+                    "end": round(offset + min(w["end"] * scale, seconds), 3),
+                })
+
+            out.writeframes(samples.tobytes())
+            frames += len(samples)
+    return frames * 1000 // PCM_RATE, alignment
+
+def _synthesize_chunks(chunks, episode_id, mode, total=None):
+    """
+    TTS các đoạn từ `chunks` (list hoặc iterator đang được đổ dữ liệu vào) song song,
+    rồi ghép đúng thứ tự + hậu kỳ + xuất file. total=None: chưa biết tổng số đoạn (streaming).
+    """
+    chunk_results = asyncio.run(_synthesize_all(chunks, episode_id, mode, total))
+
+    # C. Ghép theo thứ tự kịch bản (bỏ qua đoạn lỗi) vào 1 file WAV tạm
+    wav_path = get_path("assets", "temp", f"{episode_id}_{mode}_narration.wav")
+    try:
+        duration_ms, alignment = _assemble_chunks(chunk_results, wav_path, speed_for(mode))
+        return _finalize_audio(wav_path, duration_ms, episode_id, mode, alignment)
+    finally:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+
+def _output_path(episode_id, mode):
+    # Mỗi short có file riêng (short_1, short_2...) vì các short được tạo song song
+    suffix = "long" if mode == "long" else mode
+    output_dir = get_path("data", "audio")
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{episode_id}_{suffix}.mp3")
+
+def alignment_path(audio_path):
+    """File mốc thời gian từng từ đi kèm audio: data/audio/{ID}_long.align.json"""
+    return os.path.splitext(audio_path)[0] + ".align.json"
+
+def _finalize_audio(wav_path, duration_ms, episode_id, mode, alignment=None):
+    # 4. Kiểm tra kết quả
+    if duration_ms < 5000: # Nếu tổng file < 5 giây là lỗi
+        logger.error("❌ HỦY TASK: Audio quá ngắn hoặc lỗi toàn bộ.")
+        return None
+
+    # 5. Tốc độ đọc đã áp dụng lúc TTS từng chunk -> không cần hậu kỳ tăng tốc cả file
+
+    # 6. Xuất file kết quả
+    output_path = _output_path(episode_id, mode)
+
+    # Xuất file mp3 bitrate chuẩn (dùng cùng ffmpeg mà pydub đang dùng)
+    cmd = [AudioSegment.converter, "-y", "-loglevel", "error", "-i", wav_path, "-b:a", "192k", output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.error(f"❌ ffmpeg không xuất được audio: {result.stderr.strip()[-500:]}")
+        return None
+
+    # 7. Alignment từng từ (Shorts cắt thẳng từ audio này thay vì TTS lại)
+    if alignment:
+        with open(alignment_path(output_path), "w", encoding="utf-8") as f:
+            json.dump({"speed": speed_for(mode), "duration": duration_ms / 1000, "words": alignment}, f, ensure_ascii=False)
+    logger.info(f"✅ TTS Hoàn tất: {output_path} (Độ dài: {duration_ms/1000/60:.1f} phút)")
+
+    return output_path
+
+# =========================================================
+# ✂️ MODULE 5: CẮT SHORTS TỪ AUDIO VIDEO DÀI (KHÔNG TTS LẠI)
+# =========================================================
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def find_span(words, text):
+    """
+    Vị trí (từ đầu, từ cuối) trong alignment đọc đúng nguyên văn `text` (so theo chữ + số,
+    bỏ dấu câu / hoa thường), hoặc None nếu kịch bản short không phải trích đoạn của video dài.
+    """
+    flat = [(token, k) for k, w in enumerate(words) for token in _tokens(w["word"])]
+    target = _tokens(clean_text_for_tts(text))
+    n = len(target)
+    if not target or n > len(flat):
+        return None
+    tokens = [token for token, _ in flat]
+    for start in range(len(tokens) - n + 1):
+        if tokens[start] == target[0] and tokens[start:start + n] == target:
+            return flat[start][1], flat[start + n - 1][1]
+    return None
+
+def slice_from_long(text, long_audio_path, episode_id, mode):
+    """
+    Short là trích đoạn nguyên văn của kịch bản dài -> cắt đúng đoạn đó từ audio video dài
+    (theo alignment từng từ), chỉnh tốc độ giữ cao độ (atempo) về tốc độ của Shorts.
+    Trả về đường dẫn audio, hoặc None nếu không cắt được (gọi TTS như cũ).
+    """
+    align_file = alignment_path(long_audio_path)
+    if not os.path.exists(long_audio_path) or not os.path.exists(align_file):
+        return None
+    with open(align_file, "r", encoding="utf-8") as f:
+        alignment = json.load(f)
+    words = alignment.get("words") or []
+    span = find_span(words, text)
+    if span is None:
+        logger.info(f"ℹ️ [{mode}] Kịch bản không khớp nguyên văn video dài -> TTS riêng.")
+        return None
+
+    first, last = span
+    # Đệm 1 chút hơi thở 2 đầu nhưng không lấn sang từ bên cạnh
+    prev_end = words[first - 1]["end"] if first > 0 else 0.0
+    next_start = words[last + 1]["start"] if last + 1 < len(words) else alignment.get("duration", words[last]["end"])
+    start = max((prev_end + words[first]["start"]) / 2, words[first]["start"] - SLICE_PAD_SECONDS)
+    end = min((words[last]["end"] + next_start) / 2, words[last]["end"] + SLICE_PAD_SECONDS)
+
+    tempo = speed_for(mode) / alignment.get("speed", speed_for("long"))
+    duration = (end - start) / tempo
+    if duration < 5: # Giống create_tts: audio < 5 giây là lỗi
+        return None
+
+    output_path = _output_path(episode_id, mode)
+    fade = min(0.05, duration / 4)
+    filters = f"atempo={tempo:.4f},afade=t=in:d={fade:.3f},afade=t=out:st={duration - fade:.3f}:d={fade:.3f}"
+    cmd = [AudioSegment.converter, "-y", "-loglevel", "error", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+           "-i", long_audio_path, "-filter:a", filters, "-b:a", "192k", output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.warning(f"⚠️ [{mode}] ffmpeg không cắt được audio video dài: {result.stderr.strip()[-300:]}")
+        return None
+    logger.info(f"✂️ [{mode}] Cắt từ audio video dài {start:.1f}s-{end:.1f}s (x{tempo:.3f}), không cần TTS.")
+    return output_path
+
+def create_tts(script_path, episode_id, mode="long", long_audio_path=None):
     """
     Hàm chính: Đọc script -> Chia nhỏ -> Xử lý từng phần -> Ghép lại
+    long_audio_path (Shorts): audio video dài đã có alignment -> cắt thẳng nếu kịch bản khớp.
     """
     try:
         # 1. Đọc file Script
@@ -117,76 +613,39 @@ def create_tts(script_path, episode_id, mode="long"):
         with open(script_path, "r", encoding="utf-8") as f:
             raw_text = f.read()
 
+        if long_audio_path and mode != "long" and SLICE_SHORTS_FROM_LONG:
+            sliced = slice_from_long(raw_text, long_audio_path, episode_id, mode)
+            if sliced:
+                return sliced
+
         # 2. Chia nhỏ văn bản (Chunking) - AN TOÀN TUYỆT ĐỐI
-        # Chia thành các đoạn nhỏ 800 ký tự để không bao giờ bị Timeout
-        full_text = clean_text_for_tts(raw_text)
-        chunks = textwrap.wrap(full_text, width=800, break_long_words=False)
+        chunks = split_into_chunks(raw_text)
         
         if not chunks: return None
 
         logger.info(f"🎙️ Bắt đầu TTS: {len(chunks)} đoạn (Mode: {mode})...")
 
-        # Khởi tạo file Audio rỗng
-        combined = AudioSegment.empty()
-        
-        # 3. Vòng lặp xử lý từng đoạn (Tuần tự)
-        for i, chunk in enumerate(chunks):
-            if len(chunk) < 2: continue
-            
-            chunk_file = get_path("assets", "temp", f"{episode_id}_part_{i}.mp3")
-            
-            # A. Thử EdgeTTS trước
-            success = asyncio.run(_generate_edge_one_chunk(chunk, chunk_file))
-            
-            # B. Nếu Edge lỗi, thử OpenAI
-            if not success:
-                logger.warning(f"⚠️ Chuyển sang OpenAI Backup cho đoạn {i}...")
-                success = _generate_openai_one_chunk(chunk, chunk_file)
-            
-            # C. Ghép vào file tổng
-            if success and os.path.exists(chunk_file):
-                try:
-                    segment = AudioSegment.from_file(chunk_file)
-                    combined += segment
-                    # Dọn rác ngay lập tức để nhẹ RAM
-                    os.remove(chunk_file)
-                    
-                    # Log tiến độ mỗi 5 đoạn để biết không bị treo
-                    if i % 5 == 0:
-                        logger.info(f"   ...Đã xong {i+1}/{len(chunks)} đoạn")
-                except Exception as e:
-                    logger.error(f"❌ Lỗi ghép file audio đoạn {i}: {e}")
-            else:
-                logger.error(f"💀 BỎ QUA ĐOẠN {i} (Không tạo được Audio): '{chunk[:20]}...'")
+        # 3. TTS từng đoạn + ghép + xuất file
+        return _synthesize_chunks(chunks, episode_id, mode, total=len(chunks))
 
-        # 4. Kiểm tra kết quả
-        if len(combined) < 5000: # Nếu tổng file < 5 giây là lỗi
-            logger.error("❌ HỦY TASK: Audio quá ngắn hoặc lỗi toàn bộ.")
-            return None
+    except Exception as e:
+        logger.error(f"❌ Lỗi nghiêm trọng trong create_tts: {e}", exc_info=True)
+        return None
 
-        # 5. Xử lý hậu kỳ: Tăng tốc độ đọc (Speed Up)
-        speed = SPEED_MULTIPLIER_LONG if mode == "long" else SPEED_MULTIPLIER_SHORT
-        
-        if speed != 1.0:
-            logger.info(f"⏩ Tăng tốc audio: x{speed}")
-            rate = combined.frame_rate
-            combined = combined._spawn(combined.raw_data, overrides={
-                "frame_rate": int(rate * speed)
-            }).set_frame_rate(rate)
-
-        # 6. Xuất file kết quả
-        suffix = "long" if mode == "long" else "short"
-        output_dir = get_path("data", "audio")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        output_path = os.path.join(output_dir, f"{episode_id}_{suffix}.mp3")
-        
-        # Xuất file mp3 bitrate chuẩn
-        combined.export(output_path, format="mp3", bitrate="192k")
-        logger.info(f"✅ TTS Hoàn tất: {output_path} (Độ dài: {len(combined)/1000/60:.1f} phút)")
-        
-        return output_path
+def create_tts_streaming(paragraphs, episode_id, mode="long"):
+    """
+    TTS trong lúc kịch bản còn đang được viết: `paragraphs` là iterator trả về từng
+    đoạn văn (chặn chờ khi chưa có đoạn mới). Mỗi đoạn được chia <= 800 ký tự và bắt đầu đọc ngay
+    (song song với các đoạn trước), nên audio đầu tiên có sau vài giây thay vì chờ cả kịch bản.
+    Iterator ném Exception (kịch bản lỗi) -> hủy, trả về None.
+    """
+    def _chunks():
+        for paragraph in paragraphs:
+            yield from split_into_chunks(paragraph)
 
+    try:
+        logger.info(f"🎙️ Bắt đầu TTS streaming (Mode: {mode})...")
+        return _synthesize_chunks(_chunks(), episode_id, mode)
     except Exception as e:
-        logger.error(f"❌ Lỗi nghiêm trọng trong create_tts: {e}", exc_info=True)
+        logger.error(f"❌ Lỗi TTS streaming: {e}", exc_info=True)
         return None
@@ -3,6 +3,7 @@ import logging
 import os
 import numpy as np
 import math
+from functools import lru_cache
 from PIL import Image, ImageEnhance, ImageFilter, ImageDraw, ImageChops
 import PIL.Image
 
@@ -19,16 +20,42 @@ from moviepy.editor import (
     CompositeVideoClip, TextClip, vfx
 )
 from utils import get_path
+from disk_cache import file_digest
+from status_reporter import render_progress_logger
 
 logger = logging.getLogger(__name__)
 
 OUTPUT_WIDTH = 1280
 OUTPUT_HEIGHT = 720
 
+@lru_cache(maxsize=8)
+def _load_resized_image(path, height, mtime_ns):
+    """Ảnh overlay tĩnh (mic, logo) đã resize -> RGBA array, giữ lại giữa các tập (daemon mode)."""
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+        width = max(1, round(img.width * height / img.height))
+        arr = np.array(img.resize((width, height), PIL.Image.ANTIALIAS))
+    arr.setflags(write=False)
+    return arr
+
+def load_overlay_clip(path, height, duration):
+    arr = _load_resized_image(path, height, os.stat(path).st_mtime_ns)
+    return ImageClip(arr, transparent=True).set_duration(duration)
+
+def cache_signature(episode_id):
+    """Kích thước + assets nền/mic/logo quyết định video đầu ra (dùng làm khóa cache stage)."""
+    return {
+        "size": [OUTPUT_WIDTH, OUTPUT_HEIGHT],
+        "assets": [file_digest(get_path('assets', *parts)) for parts in (
+            ('images', f"{episode_id}_bg.png"), ('images', 'default_background.png'),
+            ('video', 'long_background.mp4'), ('images', 'microphone.png'), ('images', 'logo.png'),
+        )],
+    }
+
 # ============================================================
 # 🎨 HÀM 1: XỬ LÝ ẢNH NHÂN VẬT (PHỦ KÍN 16:9 & SIÊU MỜ VIỀN)
 # ============================================================
-def create_static_overlay_image(char_path, width=OUTPUT_WIDTH, height=OUTPUT_HEIGHT):
+def create_static_overlay_image(char_path, episode_id, width=OUTPUT_WIDTH, height=OUTPUT_HEIGHT):
     logger.info("   (LOG-BG): Xử lý nhân vật AI (Phủ kín 16:9 & Ultra Soft Blend)...")
     final_overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
     
@@ -66,7 +93,8 @@ def create_static_overlay_image(char_path, width=OUTPUT_WIDTH, height=OUTPUT_HEI
         except Exception as e:
             logger.error(f"❌ Lỗi Pillow xử lý nhân vật: {e}")
 
-    overlay_path = get_path('assets', 'temp', "char_blend_full.png")
+    # File riêng cho từng tập (nhiều tập có thể render song song)
+    overlay_path = get_path('assets', 'temp', f"{episode_id}_char_blend.png")
     os.makedirs(os.path.dirname(overlay_path), exist_ok=True)
     final_overlay.save(overlay_path, format="PNG") 
     return overlay_path
@@ -115,7 +143,7 @@ def create_video(audio_path, episode_id, image_path=None, title_text=""):
         # Đường dẫn assets
         custom_bg = get_path('assets', 'images', f"{episode_id}_bg.png")
         static_bg_path = custom_bg if os.path.exists(custom_bg) else get_path('assets', 'images', 'default_background.png')
-        char_overlay_path = create_static_overlay_image(image_path)
+        char_overlay_path = create_static_overlay_image(image_path, episode_id)
         base_video_path = get_path('assets', 'video', 'long_background.mp4') 
         
         # Tạo nền tổng hợp
@@ -137,7 +165,7 @@ def create_video(audio_path, episode_id, image_path=None, title_text=""):
         # 🎙️ LỚP MICROPHONE (Tăng x1.5 -> Cao 225px + Rung động)
         mic_f = get_path('assets', 'images', 'microphone.png')
         if os.path.exists(mic_f):
-            mic_clip = ImageClip(mic_f).set_duration(duration).resize(height=225)
+            mic_clip = load_overlay_clip(mic_f, 225, duration)
             # Animation rung nhẹ lên xuống
             mic_pos = lambda t: ('center', (OUTPUT_HEIGHT - 240) + 4 * math.sin(2 * math.pi * 0.5 * t))
             mic_clip = mic_clip.set_position(mic_pos)
@@ -146,7 +174,7 @@ def create_video(audio_path, episode_id, image_path=None, title_text=""):
         # 🏷️ LỚP LOGO (Tăng x1.5 -> Cao 120px + Nhịp thở)
         logo_f = get_path('assets', 'images', 'logo.png')
         if os.path.exists(logo_f):
-            logo_clip = ImageClip(logo_f).set_duration(duration).resize(height=120)
+            logo_clip = load_overlay_clip(logo_f, 120, duration)
             l_pos_x = OUTPUT_WIDTH - logo_clip.w - 40
             l_pos_y = OUTPUT_HEIGHT - logo_clip.h - 40
             # Hiệu ứng nhịp thở mượt mà dùng .fl()
@@ -161,7 +189,8 @@ def create_video(audio_path, episode_id, image_path=None, title_text=""):
         
         final_video.write_videofile(
             output_path, fps=15, codec="libx264", audio_codec="aac", 
-            preset="ultrafast", threads=4, ffmpeg_params=["-crf", "26"], logger='bar' 
+            preset="ultrafast", threads=4, ffmpeg_params=["-crf", "26"],
+            logger=render_progress_logger("render")
         )
         
         final_video.close()
@@ -0,0 +1,204 @@
+# === scripts/disk_cache.py ===
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import uuid
+from utils import get_path
+
+logger = logging.getLogger(__name__)
+
+# Quét lại toàn bộ cache sau mỗi N lần put (tổng dung lượng đếm trong RAM có thể lệch
+# do process khác cùng ghi vào cache, VD: process render shorts)
+RESCAN_EVERY_PUTS = 200
+# Khi dọn: xóa tới mức này của max_bytes để còn chỗ trống, không phải quét lại ở mỗi put
+EVICT_TARGET_RATIO = 0.9
+
+# Bộ nhớ tạm hash file: (đường dẫn, size, mtime) -> sha256
+_DIGEST_MEMO = {}
+_DIGEST_LOCK = threading.Lock()
+
+
+# =========================================================
+# 🔑 HÀM HỖ TRỢ TẠO KHÓA (CONTENT-ADDRESSED)
+# =========================================================
+def make_key(*parts):
+    """Tạo khóa sha256 ổn định từ các phần tử JSON được (dict, list, str, số...)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def file_digest(path):
+    """Hash nội dung file (có nhớ tạm theo size + mtime). Trả về None nếu không có file."""
+    if not path or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    memo_key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    with _DIGEST_LOCK:
+        if memo_key in _DIGEST_MEMO:
+            return _DIGEST_MEMO[memo_key]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _DIGEST_LOCK:
+        _DIGEST_MEMO[memo_key] = digest
+    return digest
+
+
+def dir_digest(path, exts=None):
+    """Hash toàn bộ file trong 1 thư mục (VD: nhạc nền, SFX). Thư mục không có -> None."""
+    if not path or not os.path.isdir(path):
+        return None
+    entries = []
+    for name in sorted(os.listdir(path)):
+        if exts and not name.lower().endswith(tuple(exts)):
+            continue
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            entries.append((name, file_digest(full)))
+    return make_key(entries)
+
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in os.scandir(path) if f.is_file())
+
+
+# =========================================================
+# 💾 CACHE TRÊN ĐĨA (GIỚI HẠN DUNG LƯỢNG + LRU)
+# =========================================================
+class DiskCache:
+    """
+    Cache trên đĩa tại data/cache/<name>/.
+    Mỗi entry là 1 thư mục chứa meta.json (giá trị JSON) và các file blob.
+    Khi vượt quá max_bytes, entry ít được dùng nhất (LRU theo mtime của meta.json) bị xóa.
+    Tổng dung lượng được cộng dồn mỗi lần put -> chỉ quét thư mục cache khi vượt giới hạn
+    (hoặc định kỳ mỗi RESCAN_EVERY_PUTS lần), put không phải O(số entry).
+    """
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.root = get_path("data", "cache", name)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total = None
+        self._puts_since_scan = 0
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def blob_path(self, key, name):
+        return os.path.join(self._entry_dir(key), name)
+
+    def get(self, key):
+        """
+        Trả về meta dict {"value": ..., "files": {...}} nếu entry còn hợp lệ, ngược lại None.
+        Entry hợp lệ = meta.json đọc được và mọi blob còn đủ, đúng kích thước.
+        """
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            for blob, size in meta.get("files", {}).items():
+                if os.path.getsize(os.path.join(entry, blob)) != size:
+                    raise ValueError(f"Blob sai kích thước: {blob}")
+            # Đánh dấu vừa dùng (LRU)
+            os.utime(meta_path, None)
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Cache '{self.name}' entry hỏng, bỏ qua: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True)
+        return meta
+
+    def put(self, key, value=None, files=None):
+        """
+        Lưu entry. files: {tên blob: đường dẫn file nguồn} (file được COPY vào cache,
+        không dùng hardlink vì ffmpeg/pydub ghi đè file output tại chỗ).
+        """
+        tmp_dir = os.path.join(self.root, ".tmp", uuid.uuid4().hex)
+        try:
+            os.makedirs(tmp_dir)
+            sizes = {}
+            for blob, src in (files or {}).items():
+                dst = os.path.join(tmp_dir, blob)
+                shutil.copyfile(src, dst)
+                sizes[blob] = os.path.getsize(dst)
+
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"value": value, "files": sizes, "created": time.time()}, f, ensure_ascii=False)
+
+            new_size = _dir_size(tmp_dir)
+            entry = self._entry_dir(key)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            old_size = 0
+            if os.path.exists(entry):
+                old_size = _dir_size(entry)
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp_dir, entry)
+        except Exception as e:
+            logger.warning(f"⚠️ Không ghi được cache '{self.name}': {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        with self._lock:
+            self._puts_since_scan += 1
+            if self._total is not None:
+                self._total += new_size - old_size
+            need_scan = (self._total is None or self._total > self.max_bytes
+                         or self._puts_since_scan >= RESCAN_EVERY_PUTS)
+        if need_scan:
+            self.evict()
+        return True
+
+    def evict(self):
+        """Khi tổng dung lượng > max_bytes: xóa các entry cũ nhất tới còn ~EVICT_TARGET_RATIO giới hạn."""
+        with self._lock:
+            entries = []
+            total = 0
+            if not os.path.isdir(self.root):
+                return
+            for shard in os.scandir(self.root):
+                if not shard.is_dir() or shard.name.startswith("."):
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        size = _dir_size(entry.path)
+                        last_used = os.stat(os.path.join(entry.path, "meta.json")).st_mtime
+                    except OSError:
+                        continue
+                    entries.append((last_used, size, entry.path))
+                    total += size
+
+            target = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TARGET_RATIO
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                logger.info(f"🗑️ Cache '{self.name}': xóa entry cũ {os.path.basename(path)[:12]}")
+            self._total = total
+            self._puts_since_scan = 0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,184 @@
+# === scripts/extractive_shorts.py ===
+import os
+import re
+import logging
+from utils import get_path
+
+logger = logging.getLogger(__name__)
+
+# Ngân sách 1 short: < 60 giây sau khi tăng tốc x1.15 (~150 từ/phút) -> giữ dư 1 chút
+SHORT_MAX_WORDS = 140
+SHORT_MIN_WORDS = 60
+NUM_SHORTS = 5
+
+# =========================================================
+# 🏷️ 5 GÓC ĐỘ (GIỐNG PROMPT LLM): TỪ KHÓA + TIÊU ĐỀ
+# =========================================================
+ANGLES = [
+    {
+        "name": "hook",
+        "words": {"never", "secret", "secrets", "shocking", "truth", "nobody", "no", "one", "first", "only",
+                  "impossible", "mystery", "hidden", "unknown", "strange", "incredible", "million", "millions",
+                  "imagine", "what", "why", "how", "you"},
+        "title": "The Truth About {name}",
+    },
+    {
+        "name": "wisdom",
+        "words": {"lesson", "lessons", "learn", "learned", "wisdom", "wise", "teach", "taught", "must",
+                  "always", "believe", "patience", "discipline", "power", "knowledge", "mind", "rule", "rules"},
+        "title": "{name}'s Greatest Lesson",
+    },
+    {
+        "name": "tragedy",
+        "words": {"death", "died", "dead", "die", "betrayed", "betrayal", "war", "blood", "murder", "murdered",
+                  "lost", "tragic", "tragedy", "scandal", "exile", "executed", "execution", "poison", "fell",
+                  "fall", "ruin", "ashes", "burn", "burned", "grief", "cruel", "massacre"},
+        "title": "The Dark Side of {name}",
+    },
+    {
+        "name": "quote",
+        "words": {"said", "says", "wrote", "declared", "words", "spoke", "told", "replied", "famous",
+                  "proclaimed", "whispered", "shouted", "once"},
+        "title": "{name} In Their Own Words",
+    },
+    {
+        "name": "legacy",
+        "words": {"legacy", "remember", "remembered", "today", "centuries", "history", "forever", "still",
+                  "influence", "modern", "world", "changed", "empire", "future", "generations", "legend"},
+        "title": "How {name} Changed History",
+    },
+]
+
+_SENTENCE_RE = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"'”’)]))\s+")
+_WORD_RE = re.compile(r"[A-Za-z']+")
+
+
+# =========================================================
+# ✂️ TÁCH CÂU + CHẤM ĐIỂM (ĐẶC TRƯNG TEXT RẺ TIỀN)
+# =========================================================
+def split_sentences(text):
+    sentences = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        sentences.extend(s.strip() for s in _SENTENCE_RE.split(paragraph) if s.strip())
+    return sentences
+
+
+def _score_sentence(sentence, position, total):
+    """Điểm của 1 câu theo từng góc độ (dict tên góc -> điểm)."""
+    words = [w.lower() for w in _WORD_RE.findall(sentence)]
+    n = max(1, len(words))
+    counts = {a["name"]: sum(1 for w in words if w in a["words"]) for a in ANGLES}
+    has_number = bool(re.search(r"\d", sentence))
+    has_quote = bool(re.search(r"[\"“”]", sentence))
+    relative = position / max(1, total - 1)
+
+    return {
+        # Câu hỏi / cảm thán / con số / ngắn gọn -> mở đầu gây sốc
+        "hook": counts["hook"] / n * 10 + sentence.endswith("?") * 1.5 + sentence.endswith("!") * 1.0
+                + has_number * 0.8 + (n <= 14) * 0.5,
+        "wisdom": counts["wisdom"] / n * 12,
+        "tragedy": counts["tragedy"] / n * 12,
+        # Lời trích dẫn trực tiếp là tín hiệu mạnh nhất
+        "quote": counts["quote"] / n * 8 + has_quote * 3.0,
+        # Di sản thường nằm ở cuối kịch bản
+        "legacy": counts["legacy"] / n * 10 + relative * 1.0,
+    }
+
+
+def _windows(sentence_words, max_words, min_words):
+    """Mọi cửa sổ câu liên tiếp (start, end) có tổng số từ trong [min_words, max_words]."""
+    n = len(sentence_words)
+    for start in range(n):
+        total = 0
+        for end in range(start, n):
+            total += sentence_words[end]
+            if total > max_words:
+                break
+            if total >= min_words:
+                yield start, end + 1
+
+
+# =========================================================
+# 🚀 HÀM CHÍNH: CHỌN 5 ĐOẠN KHÔNG CHỒNG LẤN
+# =========================================================
+def select_windows(text, num_shorts=NUM_SHORTS, max_words=SHORT_MAX_WORDS, min_words=SHORT_MIN_WORDS):
+    """
+    Trả về danh sách (góc độ, [câu...]) theo thứ tự góc độ. Mỗi góc nhận 1 cửa sổ câu liên tiếp
+    (<= max_words từ), các cửa sổ không chồng lấn nhau. Xét toàn bộ kịch bản.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    sentence_words = [len(s.split()) for s in sentences]
+    scores = [_score_sentence(s, i, len(sentences)) for i, s in enumerate(sentences)]
+
+    # Kịch bản quá ngắn so với ngân sách -> nới điều kiện tối thiểu
+    min_words = min(min_words, max(1, sum(sentence_words) // (num_shorts * 2)))
+    candidates = list(_windows(sentence_words, max_words, min_words))
+
+    def _window_score(name, start, end):
+        values = [scores[i][name] for i in range(start, end)]
+        # Câu mạnh nhất làm "neo" + điểm trung bình cả đoạn + thưởng nhẹ cho đoạn dài gần đủ 60 giây
+        score = max(values) + sum(values) / len(values)
+        score += 0.5 * sum(sentence_words[start:end]) / max_words
+        # Câu đầu tiên quyết định người xem có lướt qua hay không
+        return score + scores[start]["hook"] * 0.25
+
+    # Tham lam toàn cục: mỗi vòng chọn cặp (góc độ, cửa sổ) điểm cao nhất trong các góc còn lại
+    # -> góc có tín hiệu mạnh (VD: trích dẫn) không bị góc đứng trước "cướp" mất đoạn hay nhất
+    taken = [False] * len(sentences)
+    remaining = ANGLES[:num_shorts]
+    chosen = {}
+    while remaining:
+        best = None
+        for angle in remaining:
+            for start, end in candidates:
+                if any(taken[start:end]):
+                    continue
+                score = _window_score(angle["name"], start, end)
+                if best is None or score > best[0]:
+                    best = (score, angle, start, end)
+        if best is None:
+            break
+        _, angle, start, end = best
+        for i in range(start, end):
+            taken[i] = True
+        chosen[angle["name"]] = (angle, sentences[start:end])
+        remaining = [a for a in remaining if a is not angle]
+
+    # Giữ thứ tự góc độ như prompt LLM (short 1 = hook ... short 5 = legacy)
+    return [chosen[a["name"]] for a in ANGLES if a["name"] in chosen]
+
+
+def extract_shorts(data, long_script_path):
+    """
+    Thay thế split_long_script_to_5_shorts không cần gọi GPT: ghi cùng các file
+    {ID}_short_{n}.txt / {ID}_short_{n}_title.txt và trả về cùng cấu trúc.
+    """
+    try:
+        with open(long_script_path, "r", encoding="utf-8") as f:
+            full_text = f.read()
+
+        logger.info("✂️ Đang chọn 5 Shorts từ kịch bản (extractive, không gọi GPT)...")
+        picks = select_windows(full_text)
+        if not picks:
+            logger.error("❌ Kịch bản không đủ nội dung để cắt Shorts.")
+            return None
+
+        name = data.get("Name") or "History"
+        output_list = []
+        for i, (angle, sentences) in enumerate(picks):
+            idx = i + 1
+            s_path = get_path("data", "episodes", f"{data['ID']}_short_{idx}.txt")
+            t_path = get_path("data", "episodes", f"{data['ID']}_short_{idx}_title.txt")
+            os.makedirs(os.path.dirname(s_path), exist_ok=True)
+            with open(s_path, "w", encoding="utf-8") as f: f.write(" ".join(sentences))
+            with open(t_path, "w", encoding="utf-8") as f: f.write(angle["title"].format(name=name))
+            output_list.append({"index": idx, "script": s_path, "title": t_path})
+        return output_list
+    except Exception as e:
+        logger.error(f"❌ Lỗi extract_shorts: {e}")
+        return None
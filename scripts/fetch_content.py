@@ -1,10 +1,10 @@
 import os
 import json
-import gspread
 import logging
 import hashlib
 from dotenv import load_dotenv
 from utils import get_path
+import backends
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -14,6 +14,10 @@ def generate_hash(text: str) -> str:
 
 def authenticate_google_sheet():
     load_dotenv()
+    # Sheet giả lập trong bộ nhớ (PIPELINE_BACKEND=fake / FAKE_SERVICES=sheets)
+    if backends.use_fake("sheets"):
+        return backends.FakeSheetClient()
+
     # Ưu tiên đọc nội dung JSON từ biến môi trường (GitHub Actions)
     creds_content = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON_CONTENT')
     
@@ -26,6 +30,7 @@ def authenticate_google_sheet():
         return None
         
     try:
+        import gspread
         if creds_content.strip().startswith('{'):
             creds_dict = json.loads(creds_content)
             return gspread.service_account_from_dict(creds_dict)
@@ -38,56 +43,149 @@ def authenticate_google_sheet():
         logger.error(f"❌ Lỗi Auth Sheet: {e}")
         return None
 
-def fetch_content():
+def open_worksheet():
+    """Mở worksheet đầu tiên của Google Sheet nhiệm vụ. Lỗi -> None."""
     gc = authenticate_google_sheet()
-    sheet_id = os.getenv('GOOGLE_SHEET_ID')
+    sheet_id = os.getenv('GOOGLE_SHEET_ID') or ("fake" if backends.use_fake("sheets") else None)
     
     if not gc or not sheet_id: return None
 
     try:
         sh = gc.open_by_key(sheet_id)
-        ws = sh.get_worksheet(0)
-        records = ws.get_all_records()
-        
-        target_row = None
-        row_idx = -1
-
-        for i, row in enumerate(records):
-            if row.get('Status', '').strip().lower() == 'pending':
-                target_row = row
-                row_idx = i + 2 
-                break
-        
-        if not target_row:
+        return sh.get_worksheet(0)
+    except Exception as e:
+        logger.error(f"❌ Lỗi mở Sheet: {e}")
+        return None
+
+def col_to_a1(row, col):
+    """(5, 6) -> 'F5' (không cần import gspread.utils)."""
+    letters = ""
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return f"{letters}{row}"
+
+def read_header(ws):
+    """Chỉ đọc dòng header (1 request, không tải cả Sheet)."""
+    return [str(h).strip() for h in ws.row_values(1)]
+
+def get_status_col(ws, header=None):
+    try:
+        header = header if header is not None else read_header(ws)
+        return header.index("Status") + 1
+    except Exception:
+        return 6
+
+def update_cells(ws, updates):
+    """
+    Ghi nhiều ô trong 1 request: updates = [(row, col, value), ...].
+    Dùng batch_update theo vùng A1 thay cho update_cell từng ô (tiết kiệm quota Sheets API).
+    """
+    if not updates:
+        return
+    ws.batch_update([
+        {"range": col_to_a1(row, col), "values": [[value]]}
+        for row, col, value in updates
+    ])
+
+def list_pending_rows(ws, status_col=None):
+    """
+    Trả về danh sách số dòng có Status 'pending', theo đúng thứ tự trong Sheet.
+    Chỉ tải cột Status (1 request) thay vì get_all_records() cả Sheet.
+    """
+    status_col = status_col or get_status_col(ws)
+    statuses = ws.col_values(status_col)
+    return [
+        i + 1 for i, value in enumerate(statuses)
+        if i > 0 and str(value).strip().lower() == 'pending'
+    ]
+
+def read_id_rows(ws, header=None):
+    """
+    {ID tập: [số dòng, ...]} từ cột ID (1 request).
+    Dùng để tìm lại dòng của 1 tập khi Sheet bị chèn / xóa dòng (số dòng không cố định).
+    """
+    header = header if header is not None else read_header(ws)
+    if "ID" not in header:
+        return {}
+    rows = {}
+    for i, value in enumerate(ws.col_values(header.index("ID") + 1)):
+        episode_id = str(value).strip()
+        if i > 0 and episode_id:
+            rows.setdefault(episode_id, []).append(i + 1)
+    return rows
+
+def read_row(ws, row_idx, header):
+    """Đọc đúng 1 dòng -> dict theo header (gspread bỏ các ô trống ở cuối dòng)."""
+    values = ws.row_values(row_idx)
+    values += [""] * (len(header) - len(values))
+    return dict(zip(header, values))
+
+def read_rows(ws, row_indices, header):
+    """Đọc nhiều dòng trong 1 request (batch_get) -> {row_idx: dict theo header}."""
+    if not row_indices:
+        return {}
+    last_col = col_to_a1(1, len(header))[:-1]
+    ranges = ws.batch_get([f"A{r}:{last_col}{r}" for r in row_indices])
+    rows = {}
+    for row_idx, value_range in zip(row_indices, ranges):
+        values = list(value_range[0]) if value_range else []
+        values += [""] * (len(header) - len(values))
+        rows[row_idx] = dict(zip(header, values))
+    return rows
+
+def claim_task(ws, row_idx, col_idx, header):
+    """
+    Nhận 1 dòng: đánh dấu PROCESSING và trả về task đã chuẩn hóa.
+    Chỉ tải dòng được nhận; Status đọc kèm trong dòng đó để kiểm tra lại ngay trước khi nhận
+    (tránh lấy trùng dòng đã bị worker khác nhận).
+    """
+    row = read_row(ws, row_idx, header)
+    current = row.get(header[col_idx - 1]) if col_idx <= len(header) else None
+    if str(current or '').strip().lower() != 'pending':
+        logger.info(f"ℹ️ Dòng {row_idx} đã được nhận bởi worker khác ({current}).")
+        return None
+
+    # Cập nhật Status -> PROCESSING
+    update_cells(ws, [(row_idx, col_idx, 'PROCESSING')])
+    return build_task(row, row_idx, col_idx, ws)
+
+def build_task(row, row_idx, col_idx, ws):
+    """Chuẩn hóa 1 dòng Sheet (dict theo header) thành task cho pipeline."""
+    # Tạo Hash & Folder Assets
+    hash_src = f"{row.get('Name')}{row.get('ContentInput')}"
+    text_hash = generate_hash(hash_src)
+    os.makedirs(get_path('assets', text_hash), exist_ok=True)
+
+    # MAPPING DỮ LIỆU CHUẨN
+    return {
+        'data': {
+            'ID': row.get('ID'),
+            'Name': row.get('Name'),
+            'Core Theme': row.get('CoreTheme', ''),     # Sửa lỗi tên cột
+            'Content/Input': row.get('ContentInput', ''), # Sửa lỗi tên cột
+            'ImageFolder': row.get('ImageFolder', ''),
+            'text_hash': text_hash,
+        },
+        'row_idx': row_idx,
+        'col_idx': col_idx,
+        'worksheet': ws
+    }
+
+def fetch_content():
+    """Nhận dòng 'pending' đầu tiên trong Sheet."""
+    ws = open_worksheet()
+    if not ws: return None
+
+    try:
+        header = read_header(ws)
+        col_idx = get_status_col(ws, header)
+        pending = list_pending_rows(ws, col_idx)
+        if not pending:
             logger.info("ℹ️ Không có task 'pending'.")
             return None
 
-        # Tạo Hash & Folder Assets
-        hash_src = f"{target_row.get('Name')}{target_row.get('ContentInput')}"
-        text_hash = generate_hash(hash_src)
-        os.makedirs(get_path('assets', text_hash), exist_ok=True)
-
-        # Cập nhật Status -> PROCESSING
-        try:
-            col_idx = ws.find("Status").col
-        except:
-            col_idx = 6
-        ws.update_cell(row_idx, col_idx, 'PROCESSING')
-        
-        # MAPPING DỮ LIỆU CHUẨN
-        return {
-            'data': {
-                'ID': target_row.get('ID'),
-                'Name': target_row.get('Name'),
-                'Core Theme': target_row.get('CoreTheme', ''),     # Sửa lỗi tên cột
-                'Content/Input': target_row.get('ContentInput', ''), # Sửa lỗi tên cột
-                'ImageFolder': target_row.get('ImageFolder', ''),
-                'text_hash': text_hash,
-            },
-            'row_idx': row_idx,
-            'col_idx': col_idx,
-            'worksheet': ws
-        }
+        return claim_task(ws, pending[0], col_idx, header)
 
     except Exception as e:
         logger.error(f"❌ Lỗi Fetch: {e}")
@@ -1,9 +1,10 @@
 # === scripts/generate_image.py ===
 import os
 import logging
-import requests
-from openai import OpenAI
 from utils import get_path
+import backends
+import profiler
+from rate_limiter import get_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +13,24 @@ MODEL = "dall-e-3"
 # Kích thước 16:9 (Landscape) chuẩn cho Video Youtube
 DEFAULT_SIZE = "1792x1024" 
 
+def build_image_prompt(character_name):
+    """Prompt tối ưu "Negative Space" (Để chừa chỗ cho text hiển thị)."""
+    return f"""
+        A hyper-realistic, cinematic portrait of {character_name}. 8k resolution, 
+        gritty historical documentary atmosphere, dramatic lighting.
+
+        CRITICAL COMPOSITION RULES:
+        1. The character MUST be positioned on the FAR RIGHT side of the frame (Rule of Thirds).
+        2. The LEFT SIDE (at least 60% of the image) must be EMPTY, DARK, or VAST LANDSCAPE (Negative Space) for text overlay.
+        3. Lighting: Strong, dramatic 'Rembrandt lighting' hitting the face from the right. The left side must be in deep shadow or mist.
+        4. No text, no logos, no borders.
+        """
+
+def cache_signature(character_name):
+    """Các input quyết định ảnh đầu ra (dùng làm khóa cache stage)."""
+    return {"model": MODEL, "size": DEFAULT_SIZE, "prompt": build_image_prompt(character_name),
+            "fake": backends.use_fake("openai")}
+
 def generate_character_image(character_name, episode_id):
     """
     Gọi DALL-E 3 để tạo ảnh nhân vật.
@@ -29,42 +48,32 @@ def generate_character_image(character_name, episode_id):
             logger.info(f"✅ Ảnh đã tồn tại (Skip DALL-E): {output_path}")
             return output_path
 
-        # 3. Kiểm tra API Key
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            logger.error("❌ Thiếu OPENAI_API_KEY.")
+        # 3. Lấy client OpenAI (thật / giả lập), thiếu API Key -> None
+        client = backends.openai_client()
+        if not client:
             return None
 
-        client = OpenAI(api_key=api_key)
-
         # 4. Prompt tối ưu "Negative Space" (Để chừa chỗ cho text hiển thị)
-        prompt = f"""
-        A hyper-realistic, cinematic portrait of {character_name}. 8k resolution, 
-        gritty historical documentary atmosphere, dramatic lighting.
-
-        CRITICAL COMPOSITION RULES:
-        1. The character MUST be positioned on the FAR RIGHT side of the frame (Rule of Thirds).
-        2. The LEFT SIDE (at least 60% of the image) must be EMPTY, DARK, or VAST LANDSCAPE (Negative Space) for text overlay.
-        3. Lighting: Strong, dramatic 'Rembrandt lighting' hitting the face from the right. The left side must be in deep shadow or mist.
-        4. No text, no logos, no borders.
-        """
+        prompt = build_image_prompt(character_name)
 
         logger.info(f"🎨 Đang gọi DALL-E 3 vẽ: {character_name}...")
 
         # 5. Gọi API OpenAI
-        response = client.images.generate(
-            model=MODEL,
-            prompt=prompt,
-            size=DEFAULT_SIZE,
-            quality="standard",
-            n=1,
-        )
+        with get_limiter("openai.images").slot(), profiler.api_call("openai.images"):
+            response = client.images.generate(
+                model=MODEL,
+                prompt=prompt,
+                size=DEFAULT_SIZE,
+                quality="standard",
+                n=1,
+            )
 
         image_url = response.data[0].url
         
         # 6. Tải ảnh về và lưu
         if image_url:
-            img_data = requests.get(image_url).content
+            with profiler.api_call("http.download"):
+                img_data = backends.http_get_bytes(image_url)
             
             # Đảm bảo thư mục tồn tại (Fix lỗi No such file)
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -2,71 +2,318 @@
 import os
 import logging
 import json
-from openai import OpenAI
+import queue
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from utils import get_path
+import backends
+import profiler
+import llm_cache
+from rate_limiter import get_limiter
+from extractive_shorts import extract_shorts, SHORT_MAX_WORDS
 
 logger = logging.getLogger(__name__)
 MODEL = "gpt-4o-mini"
 
-# ============================================================
-#  📝 HÀM HỖ TRỢ GỌI GPT (HELPER)
-# ============================================================
-def call_gpt(client, prompt, json_mode=True):
-    response_format = {"type": "json_object"} if json_mode else {"type": "text"}
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        response_format=response_format,
-        temperature=0.7
-    )
-    return response.choices[0].message.content
+# "sequential" (mặc định): 2 nửa kịch bản nối tiếp nhau (prompt / cấu trúc như cũ)
+# "fanout": viết song song từng chương theo đề cương (độ trễ ~ 1 request) - bật bằng SCRIPT_MODE=fanout
+SCRIPT_MODE = os.getenv("SCRIPT_MODE", "sequential")
+# Số chương viết song song tối đa
+CHAPTER_WORKERS = int(os.getenv("SCRIPT_CHAPTER_WORKERS", "5"))
+# Tổng độ dài mục tiêu của kịch bản (chia đều cho các chương)
+TARGET_WORDS = 1800
+# Cách cắt 5 Shorts: "llm" (GPT, dự phòng bằng extractive khi lỗi) hoặc "extractive" (offline)
+SHORTS_SPLITTER = os.getenv("SHORTS_SPLITTER", "llm")
 
 # ============================================================
-#  🚀 HÀM CHÍNH: TẠO KỊCH BẢN SIÊU DÀI (MULTI-STAGE)
+#  🧾 PROMPT TEMPLATES (cũng là một phần khóa cache của stage script)
 # ============================================================
-def generate_long_script(data):
-    try:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key: return None
-        client = OpenAI(api_key=api_key)
-
-        name = data.get("Name")
-        theme = data.get("Core Theme")
-        
-        logger.info(f"🧠 BẮT ĐẦU QUY TRÌNH TẠO KỊCH BẢN 10 PHÚT+: {name}...")
-
-        # --- BƯỚC 1: TẠO METADATA & ĐỀ CƯƠNG ---
-        logger.info("   (Step 1/3): Generating SEO Metadata & Chapters...")
-        meta_prompt = f"""
+META_PROMPT = """
         Subject: {name}. Theme: {theme}.
         TASK: Create high-CTR Title, SEO Description (with timestamps), Tags, and a 5-part Outline.
         OUTPUT JSON: {{"title": "...", "description": "...", "tags": [], "chapters": ["Part 1 name", "Part 2 name", ...]}}
         """
-        meta_json = json.loads(call_gpt(client, meta_prompt))
 
-        # --- BƯỚC 2: VIẾT CHI TIẾT NỬA ĐẦU (INTRO, PART 1, PART 2) ---
-        logger.info("   (Step 2/3): Writing Detailed Part 1, 2, 3 (Deep Dive)...")
-        p1_prompt = f"""
+PART_1_PROMPT = """
         Subject: {name}. Context: {theme}. 
-        TASK: Write the first half of a documentary script (Intro, {meta_json['chapters'][0]}, {meta_json['chapters'][1]}).
+        TASK: Write the first half of a documentary script (Intro, {chapter_1}, {chapter_2}).
         REQUIREMENT: Write at least 900 words. Focus on sensory details, atmosphere, and deep history.
         OUTPUT: Plain text narration only.
         """
-        part_1_text = call_gpt(client, p1_prompt, json_mode=False)
 
-        # --- BƯỚC 3: VIẾT CHI TIẾT NỬA SAU (PART 3, 4, OUTRO) ---
-        logger.info("   (Step 3/3): Writing Detailed Part 4, 5 & Legacy...")
-        p2_prompt = f"""
+PART_2_PROMPT = """
         Subject: {name}. 
-        TASK: Write the second half of the documentary script based on the following context: {part_1_text[-500:]}.
-        Write for {meta_json['chapters'][2]}, {meta_json['chapters'][3]}, and a powerful Outro.
+        TASK: Write the second half of the documentary script based on the following context: {context}.
+        Write for {chapter_3}, {chapter_4}, and a powerful Outro.
         REQUIREMENT: Write at least 900 words. Focus on analysis, hidden secrets, and lasting legacy.
         OUTPUT: Plain text narration only.
         """
-        part_2_text = call_gpt(client, p2_prompt, json_mode=False)
 
-        # --- KẾT HỢP DỮ LIỆU ---
-        full_script = part_1_text + "\n\n" + part_2_text
+OUTLINE_PROMPT = """
+        Subject: {name}. Theme: {theme}.
+        TASK: Create high-CTR Title, SEO Description (with timestamps), Tags, and a 5-chapter Outline.
+        Chapter 1 opens with the Intro, chapter 5 ends with a powerful Outro about the lasting legacy.
+        Each chapter needs a 2-3 sentence summary of exactly what it covers, so chapters do not overlap.
+        OUTPUT JSON: {{"title": "...", "description": "...", "tags": [], "chapters": [{{"name": "...", "summary": "..."}}]}}
+        """
+
+CHAPTER_PROMPT = """
+        Subject: {name}. Context: {theme}.
+        FULL OUTLINE:
+{outline}
+        TASK: Write chapter {number} of {total} of a documentary script: "{chapter}".
+        This chapter covers: {summary}
+        Previous chapter (already written by someone else, do not repeat it): {previous}
+        Next chapter (do not cover it, end with a natural transition into it): {next}
+        {role}
+        REQUIREMENT: Write at least {words} words. Focus on sensory details, atmosphere, deep history and analysis.
+        OUTPUT: Plain text narration only. No chapter headings.
+        """
+
+SHORTS_PROMPT = """
+        Source Text: "{source}"
+        TASK: Extract 5 viral Short segments (< 60s) from the text. 
+        Angles: 1. Shocking Hook, 2. Wisdom/Lesson, 3. Tragedy/Controversy, 4. Epic Quote, 5. Legacy.
+        OUTPUT JSON: {{"shorts": [{{"title": "...", "content": "..."}}]}}
+        """
+
+def cache_signature(kind="long"):
+    """
+    Model + prompt quyết định kịch bản đầu ra (dùng làm khóa cache stage).
+    Kèm cờ backend giả lập -> kịch bản giả không bao giờ bị lần chạy thật dùng lại.
+    """
+    fake = backends.use_fake("openai")
+    if kind == "shorts":
+        if SHORTS_SPLITTER == "extractive":
+            return {"splitter": SHORTS_SPLITTER, "max_words": SHORT_MAX_WORDS}
+        return {"model": MODEL, "prompts": [SHORTS_PROMPT], "fake": fake}
+    if SCRIPT_MODE == "fanout":
+        return {"model": MODEL, "mode": SCRIPT_MODE, "words": TARGET_WORDS, "prompts": [OUTLINE_PROMPT, CHAPTER_PROMPT],
+                "fake": fake}
+    return {"model": MODEL, "prompts": [META_PROMPT, PART_1_PROMPT, PART_2_PROMPT], "fake": fake}
+
+# ============================================================
+#  📝 HÀM HỖ TRỢ GỌI GPT (HELPER)
+# ============================================================
+def call_gpt(client, prompt, json_mode=True, temperature=0.7, use_cache=True):
+    """
+    Gọi chat completion. Response được lưu trên đĩa theo (model, prompt, temperature,
+    response_format): chạy lại cùng tập không tốn thêm thời gian / token.
+    temperature=None: dùng mặc định của API. use_cache=False: luôn gọi mạng.
+    """
+    response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+
+    def _request():
+        kwargs = {"temperature": temperature} if temperature is not None else {}
+        with get_limiter("openai.chat").slot(), profiler.api_call("openai.chat"):
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format,
+                **kwargs
+            )
+        return response.choices[0].message.content
+
+    # Backend giả lập có khóa riêng -> không bao giờ trả nội dung giả cho lần chạy thật
+    backend = "fake" if backends.use_fake("openai") else "openai"
+    return llm_cache.cached_completion([backend, MODEL, prompt, temperature, response_format], _request, use_cache=use_cache)
+
+# ============================================================
+#  🌊 STREAMING: NHẬN TỪNG ĐOẠN VĂN KHI RESPONSE ĐANG VỀ
+# ============================================================
+def stream_gpt(client, prompt, temperature=0.7, use_cache=True):
+    """
+    Giống call_gpt(json_mode=False) nhưng yield từng mẩu text khi response đang về.
+    Dùng chung cache với call_gpt: trúng cache -> yield toàn bộ response 1 lần.
+    """
+    response_format = {"type": "text"}
+    backend = "fake" if backends.use_fake("openai") else "openai"
+    key_inputs = [backend, MODEL, prompt, temperature, response_format]
+
+    cached = llm_cache.lookup(key_inputs, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    kwargs = {"temperature": temperature} if temperature is not None else {}
+    # Giữ slot của limiter suốt thời gian nhận stream (request vẫn đang chiếm kết nối)
+    with get_limiter("openai.chat").slot(), profiler.api_call("openai.chat"):
+        stream = client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            response_format=response_format,
+            stream=True,
+            **kwargs
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    llm_cache.store(key_inputs, "".join(parts), use_cache)
+
+def iter_paragraphs(deltas):
+    """Gom các mẩu text thành đoạn văn hoàn chỉnh (ngăn cách bằng dòng trống)."""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        while "\n\n" in buffer:
+            paragraph, buffer = buffer.split("\n\n", 1)
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+def _write_text(client, prompt, on_paragraph=None):
+    """Viết 1 phần kịch bản. on_paragraph: nhận từng đoạn văn ngay khi xong (chế độ streaming)."""
+    if on_paragraph is None:
+        return call_gpt(client, prompt, json_mode=False)
+    paragraphs = []
+    for paragraph in iter_paragraphs(stream_gpt(client, prompt)):
+        paragraphs.append(paragraph)
+        on_paragraph(paragraph)
+    return "\n\n".join(paragraphs)
+
+_CHAPTER_DONE = object()
+
+def _merge_in_order(client, prompts, pool, on_paragraph):
+    """
+    Các chương được stream song song, nhưng on_paragraph nhận đoạn văn đúng thứ tự đề cương:
+    đoạn của chương 1 được chuyển tiếp ngay, đoạn của các chương sau được giữ trong hàng đợi
+    riêng cho tới khi các chương trước đã xong.
+    """
+    queues = [queue.Queue() for _ in prompts]
+
+    def _stream_chapter(prompt, q):
+        try:
+            _write_text(client, prompt, on_paragraph=q.put)
+            q.put(_CHAPTER_DONE)
+        except Exception as e:
+            q.put(e)
+
+    for prompt, q in zip(prompts, queues):
+        pool.submit(contextvars.copy_context().run, _stream_chapter, prompt, q)
+
+    texts = []
+    for q in queues:
+        paragraphs = []
+        while True:
+            item = q.get()
+            if item is _CHAPTER_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            paragraphs.append(item)
+            on_paragraph(item)
+        texts.append("\n\n".join(paragraphs))
+    return texts
+
+# ============================================================
+#  🌿 CHẾ ĐỘ FAN-OUT: ĐỀ CƯƠNG -> VIẾT SONG SONG TỪNG CHƯƠNG
+# ============================================================
+def _normalize_chapters(chapters):
+    """Chương có thể là chuỗi (đề cương cũ) hoặc {"name", "summary"}."""
+    normalized = []
+    for ch in chapters or []:
+        if isinstance(ch, dict):
+            normalized.append({"name": str(ch.get("name", "")).strip(), "summary": str(ch.get("summary", "")).strip()})
+        elif str(ch).strip():
+            normalized.append({"name": str(ch).strip(), "summary": ""})
+    return normalized
+
+def build_chapter_prompt(name, theme, chapters, i):
+    """Prompt cho chương i: kèm cả đề cương + tóm tắt 2 chương kề bên để nối mạch."""
+    total = len(chapters)
+    ch = chapters[i]
+    outline = "\n".join(
+        f"        {n + 1}. {c['name']}: {c['summary']}" for n, c in enumerate(chapters)
+    )
+    if total == 1:
+        role = "This is the whole script: open with a gripping Intro and close with a powerful Outro."
+    elif i == 0:
+        role = "This is the opening chapter: start with a gripping Intro hook."
+    elif i == total - 1:
+        role = "This is the final chapter: finish with a powerful Outro about the lasting legacy."
+    else:
+        role = ""
+    prev_ch = chapters[i - 1] if i > 0 else None
+    next_ch = chapters[i + 1] if i < total - 1 else None
+    return CHAPTER_PROMPT.format(
+        name=name, theme=theme, outline=outline,
+        number=i + 1, total=total, chapter=ch["name"], summary=ch["summary"] or ch["name"],
+        previous=f"{prev_ch['name']} - {prev_ch['summary']}" if prev_ch else "none (this is the first chapter)",
+        next=f"{next_ch['name']} - {next_ch['summary']}" if next_ch else "none (this is the last chapter)",
+        role=role, words=max(150, TARGET_WORDS // total),
+    )
+
+def _write_chapters_fanout(client, name, theme, meta_json, on_paragraph=None):
+    chapters = _normalize_chapters(meta_json.get("chapters"))
+    if not chapters:
+        raise ValueError("Đề cương không có chương nào.")
+
+    logger.info(f"   (Step 2/2): Viết song song {len(chapters)} chương...")
+    prompts = [build_chapter_prompt(name, theme, chapters, i) for i in range(len(chapters))]
+    with ThreadPoolExecutor(max_workers=max(1, min(CHAPTER_WORKERS, len(chapters))), thread_name_prefix="chapter") as pool:
+        if on_paragraph is not None:
+            return "\n\n".join(_merge_in_order(client, prompts, pool, on_paragraph))
+        # Mỗi request chạy trong bản sao context (profiler ghi độ trễ vào đúng stage)
+        futures = [
+            pool.submit(contextvars.copy_context().run, call_gpt, client, prompt, False)
+            for prompt in prompts
+        ]
+        # Ghép đúng thứ tự đề cương (không theo thứ tự hoàn thành)
+        texts = [fut.result().strip() for fut in futures]
+    return "\n\n".join(texts)
+
+def _write_halves_sequential(client, name, theme, meta_json, on_paragraph=None):
+    chapters = [c["name"] for c in _normalize_chapters(meta_json.get("chapters"))]
+
+    # --- BƯỚC 2: VIẾT CHI TIẾT NỬA ĐẦU (INTRO, PART 1, PART 2) ---
+    logger.info("   (Step 2/3): Writing Detailed Part 1, 2, 3 (Deep Dive)...")
+    p1_prompt = PART_1_PROMPT.format(
+        name=name, theme=theme,
+        chapter_1=chapters[0], chapter_2=chapters[1]
+    )
+    part_1_text = _write_text(client, p1_prompt, on_paragraph)
+
+    # --- BƯỚC 3: VIẾT CHI TIẾT NỬA SAU (PART 3, 4, OUTRO) ---
+    logger.info("   (Step 3/3): Writing Detailed Part 4, 5 & Legacy...")
+    p2_prompt = PART_2_PROMPT.format(
+        name=name, context=part_1_text[-500:],
+        chapter_3=chapters[2], chapter_4=chapters[3]
+    )
+    part_2_text = _write_text(client, p2_prompt, on_paragraph)
+    return part_1_text + "\n\n" + part_2_text
+
+# ============================================================
+#  🚀 HÀM CHÍNH: TẠO KỊCH BẢN SIÊU DÀI (MULTI-STAGE)
+# ============================================================
+def generate_long_script(data, on_paragraph=None):
+    """
+    Tạo kịch bản dài + metadata. on_paragraph (tùy chọn): hàm nhận từng đoạn văn theo đúng
+    thứ tự ngay khi GPT viết xong đoạn đó (stream) -> TTS có thể bắt đầu trước khi có cả kịch bản.
+    """
+    try:
+        client = backends.openai_client()
+        if not client: return None
+
+        name = data.get("Name")
+        theme = data.get("Core Theme")
+        
+        logger.info(f"🧠 BẮT ĐẦU QUY TRÌNH TẠO KỊCH BẢN 10 PHÚT+: {name} (mode: {SCRIPT_MODE})...")
+
+        # --- BƯỚC 1: TẠO METADATA & ĐỀ CƯƠNG ---
+        logger.info("   (Step 1): Generating SEO Metadata & Chapters...")
+        outline_template = OUTLINE_PROMPT if SCRIPT_MODE == "fanout" else META_PROMPT
+        meta_prompt = outline_template.format(name=name, theme=theme)
+        meta_json = json.loads(call_gpt(client, meta_prompt))
+
+        # --- BƯỚC 2+: VIẾT NỘI DUNG ---
+        if SCRIPT_MODE == "fanout":
+            full_script = _write_chapters_fanout(client, name, theme, meta_json, on_paragraph)
+        else:
+            full_script = _write_halves_sequential(client, name, theme, meta_json, on_paragraph)
         word_count = len(full_script.split())
         logger.info(f"📊 TỔNG ĐỘ DÀI: {word_count} từ (~{word_count/150:.1f} phút)")
 
@@ -93,27 +340,28 @@ def generate_long_script(data):
 #  ✂️ HÀM CHIA 5 SHORTS (GIỮ NGUYÊN PIPELINE)
 # ============================================================
 def split_long_script_to_5_shorts(data, long_script_path):
+    # Cắt offline theo đặc trưng text: không gọi mạng, xét toàn bộ kịch bản
+    if SHORTS_SPLITTER == "extractive":
+        return extract_shorts(data, long_script_path)
+
+    shorts = _split_shorts_llm(data, long_script_path)
+    if not shorts:
+        logger.warning("⚠️ Cắt Shorts bằng GPT thất bại -> dùng bộ cắt extractive.")
+        return extract_shorts(data, long_script_path)
+    return shorts
+
+def _split_shorts_llm(data, long_script_path):
     # Logic cũ của bạn rất ổn, giữ nguyên để đảm bảo an toàn cho Pipeline
     try:
-        api_key = os.getenv("OPENAI_API_KEY")
-        client = OpenAI(api_key=api_key)
+        client = backends.openai_client()
+        if not client: return None
         with open(long_script_path, "r", encoding="utf-8") as f:
             full_text = f.read()
 
         logger.info("✂️ Đang chia nhỏ kịch bản khổng lồ thành 5 Shorts đa góc độ...")
 
-        prompt = f"""
-        Source Text: "{full_text[:7000]}"
-        TASK: Extract 5 viral Short segments (< 60s) from the text. 
-        Angles: 1. Shocking Hook, 2. Wisdom/Lesson, 3. Tragedy/Controversy, 4. Epic Quote, 5. Legacy.
-        OUTPUT JSON: {{"shorts": [{{"title": "...", "content": "..."}}]}}
-        """
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        res_json = json.loads(response.choices[0].message.content)
+        prompt = SHORTS_PROMPT.format(source=full_text[:7000])
+        res_json = json.loads(call_gpt(client, prompt, temperature=None))
         shorts_data = res_json.get("shorts", [])
 
         output_list = []
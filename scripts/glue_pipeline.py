@@ -3,6 +3,15 @@
 import logging
 import sys
 import os
+import json
+import signal
+import argparse
+import queue
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from time import sleep
 from datetime import datetime, timedelta # <--- Import thư viện thời gian
 
@@ -12,51 +21,110 @@ project_root = os.path.dirname(current_dir)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-# Import các module chức năng
-from utils import setup_environment, get_path, cleanup_temp_files
-from fetch_content import fetch_content
-from generate_script import generate_long_script, split_long_script_to_5_shorts
-from auto_music_sfx import auto_music_sfx
-from create_tts import create_tts
-from create_video import create_video
-from create_shorts import create_shorts
-from upload_youtube import upload_video
-
-# Import module xử lý hình ảnh
-try:
-    from generate_image import generate_character_image
-    from create_thumbnail import add_text_to_thumbnail
-except ImportError:
-    logging.warning("⚠️ Module tạo ảnh/thumbnail chưa được cài đặt đầy đủ.")
-    generate_character_image = None
-    add_text_to_thumbnail = None
+# Import các module nhẹ (chỉ thư viện chuẩn) -> lần poll "không có task" kết thúc ngay
+from utils import setup_environment, get_path, cleanup_temp_files, lazy_import
+from fetch_content import fetch_content, open_worksheet, read_header, list_pending_rows, get_status_col, claim_task, update_cells, build_task, read_id_rows
+from upload_queue import UploadQueue
+from stage_graph import Stage, run_stage_graph
+from stage_cache import run_cached, cache_stats
+from llm_cache import llm_cache_stats
+from rate_limiter import limiter_stats
+from tts_cache import tts_cache_stats
+import profiler
+from disk_cache import file_digest
+from status_reporter import (
+    get_reporter, bind as bind_reporter, report_progress, close_all as close_reporters,
+    ForwardingReporter, forward_events,
+)
+
+# Các module media / API nặng (moviepy, pydub, openai, googleapiclient...) chỉ import khi dùng lần đầu
+generate_long_script = lazy_import("generate_script", "generate_long_script")
+split_long_script_to_5_shorts = lazy_import("generate_script", "split_long_script_to_5_shorts")
+script_signature = lazy_import("generate_script", "cache_signature")
+auto_music_sfx = lazy_import("auto_music_sfx", "auto_music_sfx")
+mix_signature = lazy_import("auto_music_sfx", "cache_signature")
+create_tts = lazy_import("create_tts", "create_tts")
+create_tts_streaming = lazy_import("create_tts", "create_tts_streaming")
+tts_signature = lazy_import("create_tts", "cache_signature")
+tts_alignment_path = lazy_import("create_tts", "alignment_path")
+create_video = lazy_import("create_video", "create_video")
+video_signature = lazy_import("create_video", "cache_signature")
+create_shorts = lazy_import("create_shorts", "create_shorts")
+shorts_signature = lazy_import("create_shorts", "cache_signature")
+
+# Module xử lý hình ảnh (không bắt buộc: thiếu module -> bỏ qua bước ảnh/thumbnail)
+generate_character_image = lazy_import("generate_image", "generate_character_image", optional=True)
+image_signature = lazy_import("generate_image", "cache_signature", optional=True)
+add_text_to_thumbnail = lazy_import("create_thumbnail", "add_text_to_thumbnail", optional=True)
+thumb_signature = lazy_import("create_thumbnail", "cache_signature", optional=True)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Số stage chạy song song trong 1 tập (ảnh, script, TTS, render, shorts...)
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "4"))
+# Số process render Shorts song song (0 = tự tính theo số CPU, 1 = tuần tự)
+SHORTS_WORKERS = int(os.getenv("SHORTS_WORKERS", "0"))
+# Số tập chạy song song ở chế độ --drain (0 = tự tính theo số CPU)
+DRAIN_WORKERS = int(os.getenv("DRAIN_WORKERS", "0"))
+
+# Đọc TTS ngay trong lúc GPT còn đang viết kịch bản (stream từng đoạn văn)
+STREAM_TTS = os.getenv("STREAM_TTS", "0") == "1"
+# Nhận task qua hàng đợi SQLite có lease (task_queue.py) thay vì nhận trực tiếp trên Sheet
+USE_TASK_QUEUE = os.getenv("TASK_QUEUE", "0") == "1"
+# Chu kỳ poll Sheet ở chế độ --daemon (giây)
+DAEMON_POLL_SECONDS = int(os.getenv("DAEMON_POLL_SECONDS", "300"))
+DAEMON_HEALTH_FILE = get_path("data", "daemon_health.json")
+
+# Các stage của video dài theo thứ tự: stage nào lỗi -> tập bị đánh dấu FAILED
+LONG_PATH_STAGES = ("script", "image", "tts_long", "mix", "render_long", "thumbnail", "upload_long")
+
+# Số tập đang chạy song song (drain mode) -> chia CPU cho process pool shorts
+_episode_workers = 1
+# Process con chạy tập (episode_pool): queue gửi trạng thái / tiến độ về process cha
+_parent_events = None
+# Được set khi nhận SIGTERM/SIGINT ở chế độ daemon: tập đang chạy làm nốt, không nhận tập mới
+_stop_event = threading.Event()
+
 
 # =========================================================
 #  HÀM HỖ TRỢ CẬP NHẬT TRẠNG THÁI GOOGLE SHEET
 # =========================================================
-def safe_update_status(ws, row_idx, col_idx, status):
-    """Cập nhật trạng thái lên Sheet một cách an toàn."""
+def sheet_reporter(ws, status_col):
+    """Status reporter của worksheet (ghi Sheet qua các hàm của fetch_content)."""
+    return get_reporter(ws, status_col, read_header, update_cells)
+
+
+def episode_rows(ws, episode_ids):
+    """{ID tập: dòng hiện tại} -> reporter theo ID ghi đúng dòng dù Sheet bị chèn / xóa dòng."""
+    id_rows = read_id_rows(ws)
+    return {eid: id_rows[eid][0] for eid in episode_ids if eid in id_rows}
+
+
+def safe_update_status(reporter, key, status):
+    """
+    Cập nhật trạng thái lên Sheet một cách an toàn. Không gọi mạng trực tiếp:
+    status reporter ghi nền theo lô (gộp cùng tiến độ), nên không chặn pipeline.
+    """
     try:
-        if not ws: return
-        if col_idx and isinstance(col_idx, int):
-            ws.update_cell(row_idx, col_idx, status)
+        if reporter:
+            reporter.set_status(key, status)
     except Exception as e:
         logger.warning(f"⚠️ Không thể cập nhật Google Sheet: {e}")
 
 
 # =========================================================
-#  XỬ LÝ TỪNG VIDEO SHORTS (TUẦN TỰ + HẸN GIỜ)
+#  XỬ LÝ TỪNG VIDEO SHORTS (TTS + RENDER)
 # =========================================================
-def process_one_short_sequential(short_cfg, data, background_image_path, publish_time):
+def render_one_short(short_cfg, data, background_image_path, long_audio_path=None):
     """
-    Xử lý 1 video short và upload với chế độ hẹn giờ (Scheduled).
+    Tạo TTS và dựng 1 video short. Việc upload (hẹn giờ) do UploadQueue đảm nhận.
+    long_audio_path: audio video dài (kèm alignment) -> short trích nguyên văn được cắt thẳng, không TTS lại.
+    Trả về {"index", "video_path", "metadata"} hoặc None nếu lỗi.
     """
     idx = short_cfg["index"]
-    logger.info(f"▶️ [SHORT {idx}/5] Đang xử lý...")
+    eid = str(data["ID"])
+    logger.info(f"▶️ [SHORT {idx}] Đang xử lý...")
 
     try:
         # 1. Đọc nội dung script và tiêu đề
@@ -64,61 +132,338 @@ def process_one_short_sequential(short_cfg, data, background_image_path, publish
         title_content = open(short_cfg["title"], encoding="utf-8").read().strip()
 
         # 2. Tạo giọng đọc (TTS)
-        tts_audio = create_tts(short_cfg["script"], data["ID"], f"short_{idx}")
+        tts_audio = run_cached(
+            "tts_short", [eid, idx, script_content, tts_signature("short"), file_digest(long_audio_path)],
+            lambda: create_tts(short_cfg["script"], data["ID"], f"short_{idx}", long_audio_path=long_audio_path)
+        )
         if not tts_audio:
             logger.error(f"❌ Short {idx}: Lỗi tạo TTS.")
-            return False
+            return None
 
         # 3. Dựng Video (Dọc 9:16)
-        video_path = create_shorts(
-            audio_path=tts_audio,
-            text_script=script_content, 
-            episode_id=f"{data['ID']}_{idx}",
-            character_name=data["Name"],
-            hook_title=title_content,
-            custom_image_path=background_image_path 
+        short_id = f"{data['ID']}_{idx}"
+        video_path = run_cached(
+            "render_short",
+            [short_id, file_digest(tts_audio), script_content, title_content,
+             file_digest(background_image_path), shorts_signature(short_id)],
+            lambda: create_shorts(
+                audio_path=tts_audio,
+                text_script=script_content, 
+                episode_id=short_id,
+                character_name=data["Name"],
+                hook_title=title_content,
+                custom_image_path=background_image_path 
+            )
         )
 
         if not video_path:
             logger.error(f"❌ Short {idx}: Lỗi dựng video.")
-            return False
+            return None
 
-        # 4. Upload lên YouTube (HẸN GIỜ)
+        # 4. Metadata upload YouTube
         upload_meta = {
             "Title": f"{title_content} #Shorts",
             "Summary": f"Subscribe for more history facts about {data['Name']}!\n\n#shorts #history #facts",
             "Tags": ["shorts", "history", "facts", "education"]
         }
-        
-        logger.info(f"📅 Short {idx} sẽ công chiếu lúc: {publish_time} (Server Time)")
-        
-        # Gọi hàm upload với tham số publish_at
-        result = upload_video(video_path, upload_meta, publish_at=publish_time)
-        
-        if result == "FAILED":
-            logger.error(f"❌ Short {idx}: Upload thất bại.")
-            return False
-            
-        logger.info(f"✅ [SHORT {idx}/5] ĐÃ LÊN LỊCH THÀNH CÔNG!")
-        return True
+
+        logger.info(f"✅ [SHORT {idx}] ĐÃ RENDER XONG.")
+        return {"index": idx, "video_path": video_path, "metadata": upload_meta}
 
     except Exception as e:
         logger.error(f"❌ Short {idx} Crash: {e}", exc_info=True)
-        return False
+        return None
 
 
 # =========================================================
-#  LUỒNG CHÍNH (MAIN PIPELINE)
+#  XỬ LÝ SONG SONG 5 SHORTS (PROCESS POOL)
 # =========================================================
-def main():
-    setup_environment()
-    
-    # 1. Lấy nhiệm vụ từ Google Sheet
-    task = fetch_content()
-    if not task:
-        logger.info("💤 Không có nhiệm vụ 'pending'. Hệ thống nghỉ.")
-        return
+def get_shorts_workers(n_shorts):
+    """Số process render shorts: theo env SHORTS_WORKERS, mặc định theo số CPU."""
+    if SHORTS_WORKERS > 0:
+        return max(1, min(SHORTS_WORKERS, n_shorts))
+    # Mỗi lần render moviepy/ffmpeg đã dùng ~2 core -> chia đôi số CPU,
+    # rồi chia tiếp cho số tập đang chạy song song (drain mode)
+    return max(1, min(n_shorts, (os.cpu_count() or 1) // 2 // _episode_workers))
+
+
+def render_one_short_profiled(short_cfg, data, background_image_path, long_audio_path=None):
+    """Chạy render_one_short trong process con, kèm số liệu profiler để gộp về tiến trình cha."""
+    prof = profiler.start_run(f"short_{short_cfg['index']}")
+    with prof.stage(f"short_{short_cfg['index']}"):
+        rendered = render_one_short(short_cfg, data, background_image_path, long_audio_path)
+    return {"rendered": rendered, "profile": prof.report()["stages"]}
+
+
+def get_short_publish_time(start_schedule_time, i):
+    # Short 1 (i=0): start_time + 0 (Tức là T+2h, cùng lúc Video dài)
+    # Short 2 (i=1): start_time + 22h ...
+    return start_schedule_time + timedelta(hours=i * 22)
+
+
+def run_shorts(shorts_list, data, background_image_path, start_schedule_time, uploads, long_audio_path=None):
+    """
+    Chạy TTS + Render cho các shorts trên process pool, short nào xong thì
+    đưa ngay vào hàng đợi upload (hẹn giờ theo thứ tự short).
+    Mỗi short chạy độc lập: 1 short lỗi không ảnh hưởng các short khác.
+    Trả về số short đã render và xếp hàng upload.
+    """
+    workers = get_shorts_workers(len(shorts_list))
+    publish_times = {
+        short_cfg["index"]: get_short_publish_time(start_schedule_time, i)
+        for i, short_cfg in enumerate(shorts_list)
+    }
+
+    finished = [0]
+
+    def _report_done():
+        finished[0] += 1
+        report_progress("shorts", f"{finished[0]}/{len(shorts_list)}")
+
+    def _enqueue(rendered):
+        idx = rendered["index"]
+        logger.info(f"📅 Short {idx} sẽ công chiếu lúc: {publish_times[idx]} (Server Time)")
+        uploads.submit(f"short_{idx}", rendered["video_path"], rendered["metadata"], publish_at=publish_times[idx])
+
+    # Chế độ tuần tự (máy yếu / SHORTS_WORKERS=1)
+    if workers <= 1:
+        success_count = 0
+        for short_cfg in shorts_list:
+            with profiler.stage(f"shorts/short_{short_cfg['index']}"):
+                rendered = render_one_short(short_cfg, data, background_image_path, long_audio_path)
+            _report_done()
+            if rendered:
+                _enqueue(rendered)
+                success_count += 1
+            logger.info("⏳ Nghỉ 5 giây để hồi phục tài nguyên...")
+            sleep(5)
+        return success_count
+
+    logger.info(f"⚡ Render {len(shorts_list)} Shorts song song trên {workers} process...")
+    success_count = 0
+    # 'spawn' an toàn hơn 'fork' khi tiến trình cha đang chạy nhiều thread (stage graph)
+    ctx = multiprocessing.get_context("spawn")
+    prof = profiler.current_run()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(render_one_short_profiled, short_cfg, data, background_image_path, long_audio_path): short_cfg["index"]
+            for short_cfg in shorts_list
+        }
+
+        for fut in as_completed(futures):
+            try:
+                outcome = fut.result()
+                if prof:
+                    prof.add_stage_records(outcome["profile"], prefix="shorts/")
+                rendered = outcome["rendered"]
+                if rendered:
+                    _enqueue(rendered)
+                    success_count += 1
+            except Exception as e:
+                logger.error(f"❌ Short {futures[fut]} Crash (process): {e}")
+            _report_done()
+    return success_count
+
+
+# =========================================================
+#  STREAMING: KỊCH BẢN -> TTS CHẠY CHỒNG LÊN NHAU
+# =========================================================
+_STREAM_END = object()
+_STREAM_ABORT = object()
+
+
+def generate_script_streaming(data, eid):
+    """
+    Viết kịch bản và đưa từng đoạn văn (đúng thứ tự) cho TTS ngay khi GPT viết xong.
+    Trả về (kết quả generate_long_script, Future của file audio video dài).
+    Kịch bản lỗi -> TTS bị hủy (Future trả về None).
+    """
+    paragraphs = queue.Queue()
+
+    def _paragraph_iter():
+        while True:
+            item = paragraphs.get()
+            if item is _STREAM_END:
+                return
+            if item is _STREAM_ABORT:
+                raise RuntimeError("Kịch bản lỗi giữa chừng, hủy TTS streaming.")
+            yield item
 
+    def _tts():
+        with profiler.stage("tts_stream"):
+            return create_tts_streaming(_paragraph_iter(), eid, "long")
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-tts")
+    tts_future = pool.submit(contextvars.copy_context().run, _tts)
+    pool.shutdown(wait=False)
+
+    long_res = None
+    try:
+        long_res = generate_long_script(data, on_paragraph=paragraphs.put)
+    finally:
+        paragraphs.put(_STREAM_END if long_res else _STREAM_ABORT)
+    return long_res, tts_future
+
+
+# =========================================================
+#  ĐỒ THỊ STAGE CỦA 1 TẬP (CHẠY SONG SONG THEO PHỤ THUỘC)
+# =========================================================
+def build_episode_stages(data, start_schedule_time, uploads):
+    """
+    Khai báo các stage của 1 tập cùng input/output của chúng.
+    Các stage không phụ thuộc nhau (VD: ảnh DALL-E và kịch bản GPT,
+    TTS shorts và render video dài) sẽ được chạy chồng lên nhau.
+    Mỗi stage được cache theo nội dung input (xem stage_cache.run_cached):
+    chạy lại 1 tập bị FAILED sẽ bỏ qua các stage đã có kết quả.
+    """
+    eid = str(data.get('ID'))
+    text_hash = data.get("text_hash")
+    # STREAM_TTS: Future của TTS đã chạy song song với stage script (chỉ khi script không lấy từ cache)
+    streamed = {}
+
+    # 1.1 Tạo ảnh minh họa (DALL-E 3)
+    def stage_image(_):
+        return run_cached(
+            "image", [eid, image_signature(data.get("Name"))],
+            lambda: generate_character_image(data.get("Name"), eid)
+        )
+
+    # 1.2 Tạo kịch bản chi tiết (Long Script)
+    def stage_script(_):
+        logger.info("📝 Đang viết kịch bản chi tiết...")
+
+        def _generate():
+            if not STREAM_TTS:
+                return generate_long_script(data)
+            long_res, streamed["tts"] = generate_script_streaming(data, eid)
+            return long_res
+
+        long_res = run_cached(
+            "script", [eid, text_hash, data.get("Name"), data.get("Core Theme"), script_signature("long")],
+            _generate
+        )
+        if not long_res:
+            raise Exception("Lỗi tạo kịch bản.")
+        return long_res
+
+    # 2.1 Tạo giọng đọc video dài
+    def stage_tts_long(r):
+        logger.info("🔊 Đang tạo giọng đọc (TTS)...")
+        script_path = r["script"]["script_path"]
+        tts_future = streamed.pop("tts", None)
+        if tts_future:
+            # TTS đã chạy song song với lúc viết kịch bản -> chỉ chờ phần còn lại
+            logger.info("🌊 Chờ TTS streaming hoàn tất...")
+        synthesize = tts_future.result if tts_future else (lambda: create_tts(script_path, eid, "long"))
+
+        def _with_alignment():
+            # Trả kèm file alignment -> stage cache lưu / khôi phục cả 2 file (Shorts cắt audio theo nó)
+            audio_path = synthesize()
+            if not audio_path:
+                return None
+            align_path = tts_alignment_path(audio_path)
+            return {"audio": audio_path, "alignment": align_path if os.path.exists(align_path) else None}
+
+        outputs = run_cached("tts_long", [eid, file_digest(script_path), tts_signature("long")], _with_alignment)
+        long_audio_path = outputs["audio"] if outputs else None
+        if not long_audio_path:
+            logger.error("❌ Lỗi: Không tạo được TTS cho video dài.")
+        return long_audio_path
+
+    # 2.2 Ghép nhạc nền
+    def stage_mix(r):
+        if not r["tts_long"]:
+            return None
+        logger.info("🎵 Đang phối nhạc nền...")
+        return run_cached(
+            "mix", [eid, file_digest(r["tts_long"]), mix_signature()],
+            lambda: auto_music_sfx(r["tts_long"], eid)
+        )
+
+    # 2.3 Dựng Video
+    def stage_render_long(r):
+        if not r["mix"]:
+            return None
+        logger.info("🎥 Đang Render Video...")
+        return run_cached(
+            "render_long",
+            [eid, file_digest(r["mix"]), file_digest(r["image"]), data.get("Name"), video_signature(eid)],
+            lambda: create_video(
+                audio_path=r["mix"],
+                episode_id=eid,
+                image_path=r["image"],
+                title_text=data.get("Name")
+            )
+        )
+
+    # 2.4 Tạo Thumbnail
+    def stage_thumbnail(r):
+        img_path = r["image"]
+        if not img_path:
+            return None
+        thumb_path = get_path("outputs", "thumbnails", f"{eid}_thumb.jpg")
+        return run_cached(
+            "thumbnail", [eid, file_digest(img_path), data.get("Name"), thumb_signature()],
+            lambda: add_text_to_thumbnail(img_path, data.get("Name").upper(), thumb_path)
+        )
+
+    # 2.5 Upload Video Dài (HẸN GIỜ: T + 2H) - chạy nền, không chặn render shorts
+    def stage_upload_long(r):
+        long_video_path = r["render_long"]
+        if not r["tts_long"]:
+            return None
+        if long_video_path and os.path.exists(long_video_path):
+            logger.info(f"📅 Long Video sẽ công chiếu lúc: {start_schedule_time}")
+            uploads.submit(
+                "long",
+                long_video_path,
+                r["script"]["metadata"],
+                thumbnail_path=r["thumbnail"],
+                publish_at=start_schedule_time
+            )
+            return "QUEUED"
+        logger.error("❌ Lỗi: Không tìm thấy file video dài để upload.")
+        return None
+
+    # 3.1 Cắt kịch bản Shorts
+    def stage_split_shorts(r):
+        logger.info("📱 === BẮT ĐẦU XỬ LÝ 5 SHORTS ===")
+        script_path = r["script"]["script_path"]
+        return run_cached(
+            "split_shorts", [eid, file_digest(script_path), script_signature("shorts")],
+            lambda: split_long_script_to_5_shorts(data, script_path)
+        )
+
+    # 3.2 Xử lý Shorts (HẸN GIỜ: +2H, +24H, +46H...)
+    def stage_shorts(r):
+        shorts_list = r["split_shorts"]
+        if not shorts_list:
+            logger.error("❌ Không thể cắt kịch bản Shorts.")
+            return 0
+
+        success_count = run_shorts(shorts_list, data, r["image"], start_schedule_time, uploads, r["tts_long"])
+        logger.info(f"✅ Đã render và xếp hàng upload {success_count}/{len(shorts_list)} Shorts.")
+        return success_count
+
+    return [
+        Stage("image", stage_image),
+        Stage("script", stage_script),
+        Stage("tts_long", stage_tts_long, deps=["script"]),
+        Stage("mix", stage_mix, deps=["tts_long"]),
+        Stage("render_long", stage_render_long, deps=["mix", "image"]),
+        Stage("thumbnail", stage_thumbnail, deps=["image"]),
+        Stage("upload_long", stage_upload_long, deps=["render_long", "thumbnail", "script", "tts_long"]),
+        Stage("split_shorts", stage_split_shorts, deps=["script"]),
+        # Shorts cắt audio từ video dài (chỉ TTS riêng khi kịch bản short không khớp nguyên văn)
+        Stage("shorts", stage_shorts, deps=["split_shorts", "image", "tts_long"]),
+    ]
+
+
+# =========================================================
+#  XỬ LÝ 1 TẬP (1 DÒNG TRONG SHEET)
+# =========================================================
+def process_task(task):
+    """Chạy toàn bộ pipeline cho 1 task đã được nhận. Trả về trạng thái cuối (DONE/FAILED)."""
     data = task["data"]
     row_idx = task["row_idx"]
     col_idx = task["col_idx"]
@@ -129,7 +474,17 @@ def main():
     text_hash = data.get("text_hash")
 
     logger.info(f"🚀 BẮT ĐẦU TASK ID={eid} | Name={data.get('Name')}")
-    safe_update_status(ws, row_idx, col_idx, 'PROCESSING')
+    prof = profiler.start_run(eid)
+    prof.meta.update({"episode_id": eid, "name": data.get("Name")})
+    # Trạng thái + tiến độ (TTS x/y, render %, shorts x/5) của tập này đi qua 1 reporter.
+    # task["reporter"] = (reporter, khóa) khi chạy trong process con / hàng đợi (chỉ ghi tiến độ, khóa theo ID)
+    if task.get("reporter"):
+        reporter, report_key = task["reporter"]
+    else:
+        reporter = sheet_reporter(ws, col_idx) if ws and isinstance(col_idx, int) else None
+        report_key = row_idx
+    bind_reporter(reporter, report_key)
+    safe_update_status(reporter, report_key, 'PROCESSING')
 
     # =====================================================
     # 🕒 TÍNH TOÁN LỊCH TRÌNH CÔNG CHIẾU (SCHEDULING)
@@ -143,112 +498,374 @@ def main():
 
     try:
         # =========================================================
-        # GIAI ĐOẠN 1: TẠO ASSETS (ẢNH & SCRIPT)
-        # =========================================================
-        
-        # 1.1 Tạo ảnh minh họa (DALL-E 3)
-        img_path = None
-        if generate_character_image:
-            img_path = generate_character_image(data.get("Name"), eid)
-        else:
-            logger.warning("⚠️ Bỏ qua bước tạo ảnh (Module thiếu).")
-
-        # 1.2 Tạo kịch bản chi tiết (Long Script)
-        logger.info("📝 Đang viết kịch bản chi tiết...")
-        long_res = generate_long_script(data)
-        if not long_res:
-            raise Exception("Lỗi tạo kịch bản.")
-
-        # =========================================================
-        # GIAI ĐOẠN 2: XỬ LÝ VIDEO DÀI (HẸN GIỜ: T + 2H)
+        # CHẠY ĐỒ THỊ STAGE (ẢNH / SCRIPT / VIDEO DÀI / SHORTS)
         # =========================================================
-        logger.info("🎬 === BẮT ĐẦU XỬ LÝ VIDEO DÀI ===")
+        uploads = UploadQueue(f"uploads-{eid}")
+        stages = build_episode_stages(data, start_schedule_time, uploads)
+        try:
+            results, errors = run_stage_graph(stages, max_workers=STAGE_WORKERS)
+        finally:
+            # Chỉ báo trạng thái cuối khi hàng đợi upload đã chạy hết
+            logger.info("⏳ Chờ hàng đợi upload hoàn tất...")
+            upload_results = uploads.drain()
 
-        # 2.1 Tạo giọng đọc
-        logger.info("🔊 Đang tạo giọng đọc (TTS)...")
-        long_audio_path = create_tts(long_res["script_path"], eid, "long")
-        
-        if long_audio_path:
-            # 2.2 Ghép nhạc nền
-            logger.info("🎵 Đang phối nhạc nền...")
-            final_audio_path = auto_music_sfx(long_audio_path, eid)
-            
-            # 2.3 Dựng Video
-            logger.info("🎥 Đang Render Video...")
-            long_video_path = create_video(
-                audio_path=final_audio_path, 
-                episode_id=eid,
-                image_path=img_path, 
-                title_text=data.get("Name")
-            )
-
-            # 2.4 Tạo Thumbnail
-            thumb_path = None
-            if add_text_to_thumbnail and img_path:
-                thumb_path = get_path("outputs", "thumbnails", f"{eid}_thumb.jpg")
-                add_text_to_thumbnail(img_path, data.get("Name").upper(), thumb_path)
-
-            # 2.5 Upload Video Dài (HẸN GIỜ)
-            if long_video_path and os.path.exists(long_video_path):
-                logger.info(f"📅 Long Video sẽ công chiếu lúc: {start_schedule_time}")
-                
-                upload_video(
-                    long_video_path, 
-                    long_res["metadata"], 
-                    thumbnail_path=thumb_path,
-                    publish_at=start_schedule_time # <--- TRUYỀN THỜI GIAN VÀO
-                )
-                logger.info("✅ VIDEO DÀI ĐÃ LÊN LỊCH.")
-            else:
-                logger.error("❌ Lỗi: Không tìm thấy file video dài để upload.")
-        else:
-            logger.error("❌ Lỗi: Không tạo được TTS cho video dài.")
+        # Lỗi ở nhánh video dài, kể cả upload video dài thất bại -> cả tập FAILED để lần sau
+        # chạy lại (bản tuần tự cũ vẫn báo DONE khi upload lỗi); chỉ lỗi ở nhánh Shorts mới được bỏ qua
+        for name in LONG_PATH_STAGES:
+            if name in errors:
+                raise errors[name]
 
-        # =========================================================
-        # GIAI ĐOẠN 3: XỬ LÝ SHORTS (HẸN GIỜ: +2H, +6H, +10H...)
-        # =========================================================
-        logger.info("📱 === BẮT ĐẦU XỬ LÝ 5 SHORTS ===")
-        
-        shorts_list = split_long_script_to_5_shorts(data, long_res["script_path"])
-        
-        if shorts_list:
-            success_count = 0
-            
-            for i, short_cfg in enumerate(shorts_list):
-                # Tính toán thời gian cho từng Short
-                # Short 1 (i=0): start_time + 0 (Tức là T+2h, cùng lúc Video dài)
-                # Short 2 (i=1): start_time + 4h
-                # Short 3 (i=2): start_time + 8h
-                # ...
-                hours_offset = i * 22
-                short_publish_time = start_schedule_time + timedelta(hours=hours_offset)
-                
-                # Gọi hàm xử lý (truyền thêm tham số thời gian)
-                result = process_one_short_sequential(short_cfg, data, img_path, short_publish_time)
-                
-                if result: 
-                    success_count += 1
-                
-                logger.info("⏳ Nghỉ 5 giây để hồi phục tài nguyên...")
-                sleep(5)
-            
-            logger.info(f"✅ Hoàn thành và Lên lịch cho {success_count}/5 Shorts.")
-        else:
-            logger.error("❌ Không thể cắt kịch bản Shorts.")
+        if "long" not in upload_results:
+            raise Exception("Video dài không được xếp hàng upload.")
+        if upload_results["long"] == "FAILED":
+            raise Exception("Upload video dài thất bại.")
+        shorts_ok = sum(1 for k, v in upload_results.items() if k.startswith("short_") and v != "FAILED")
+        logger.info(f"📊 Upload: video dài = {upload_results.get('long', 'không có')}, shorts = {shorts_ok} thành công.")
 
         # =========================================================
         # KẾT THÚC
         # =========================================================
-        safe_update_status(ws, row_idx, col_idx, 'DONE')
+        safe_update_status(reporter, report_key, 'DONE')
         
         logger.info("🧹 Đang dọn dẹp file tạm...")
         cleanup_temp_files(eid, text_hash)
         
-        logger.info("🎉 QUY TRÌNH HOÀN TẤT! 🎉")
+        logger.info(f"🎉 QUY TRÌNH HOÀN TẤT (ID={eid})! 🎉")
+        status = 'DONE'
+
+    except Exception as e:
+        logger.error(f"❌ LỖI NGHIÊM TRỌNG TRONG PIPELINE (ID={eid}): {e}", exc_info=True)
+        safe_update_status(reporter, report_key, 'FAILED')
+        status = 'FAILED'
+
+    # Báo cáo hiệu năng từng stage (JSON) nằm cạnh các output
+    prof.meta.update({"status": status, "stage_cache": cache_stats(), "llm_cache": llm_cache_stats(),
+                      "tts_chunks": tts_cache_stats(), "rate_limits": limiter_stats()})
+    prof.write_report(get_path("outputs", "reports", f"{eid}_run_report.json"))
+    return status
+
+
+# =========================================================
+#  CHẾ ĐỘ DRAIN: XỬ LÝ HẾT CÁC DÒNG PENDING TRONG 1 LẦN CHẠY
+# =========================================================
+def get_drain_workers():
+    if DRAIN_WORKERS > 0:
+        return DRAIN_WORKERS
+    # Mỗi tập đã tự dùng nhiều core (render + process pool shorts)
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def _init_episode_process(events, episode_workers):
+    global _parent_events, _episode_workers
+    _parent_events = events
+    _episode_workers = episode_workers
+    # Tắt daemon do process cha quyết định (chờ tập đang chạy xong) -> process con bỏ qua tín hiệu
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
+
+def process_task_in_child(task, report_key):
+    """Chạy process_task trong process con của episode_pool: trạng thái / tiến độ gửi về process cha."""
+    return process_task(dict(task, reporter=(ForwardingReporter(_parent_events), report_key)))
+
+
+@contextmanager
+def episode_pool(workers, reporter):
+    """
+    Pool process 'spawn' chạy các tập song song (mỗi tập 1 process, bên trong vẫn có
+    stage graph nhiều thread + process pool shorts) -> mix / render moviepy của các tập
+    không tranh nhau 1 GIL. Chỉ process cha giữ worksheet: sự kiện trạng thái từ
+    process con được chuyển sang `reporter`. workers <= 1 -> None (chạy ngay trong process,
+    giữ client / asset đã nạp "ấm" giữa các lần poll của daemon).
+    """
+    if workers <= 1:
+        yield None
+        return
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.Queue()
+    pump = threading.Thread(target=forward_events, args=(events, reporter), name="episode-events", daemon=True)
+    pump.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_episode_process, initargs=(events, workers)) as pool:
+            yield pool
+    finally:
+        # Pool đã đóng hẳn (process con đã đẩy hết sự kiện) -> dừng vòng chuyển tiếp
+        events.put(None)
+        pump.join()
+
+
+def run_episode(pool, task, report_key, reporter):
+    """Chạy 1 tập trên episode_pool (hoặc ngay trong process nếu pool=None). Process con chết -> FAILED."""
+    if pool is None:
+        return process_task(task)
+    try:
+        # Worksheet (client gspread) không gửi sang process con được
+        return pool.submit(process_task_in_child, dict(task, worksheet=None, reporter=None), report_key).result()
     except Exception as e:
-        logger.error(f"❌ LỖI NGHIÊM TRỌNG TRONG PIPELINE: {e}", exc_info=True)
-        safe_update_status(ws, row_idx, col_idx, 'FAILED')
+        logger.error(f"❌ Process chạy tập {report_key} bị lỗi: {e}", exc_info=True)
+        safe_update_status(reporter, report_key, 'FAILED')
+        return 'FAILED'
+
+
+def drain(max_workers=None, use_queue=None):
+    """
+    Nhận lần lượt các dòng 'pending' (theo thứ tự trong Sheet) và chạy chúng
+    trên pool gồm `max_workers` tập song song (mỗi tập 1 process, xem episode_pool).
+    Mỗi tập có file tạm và trạng thái riêng.
+    """
+    global _episode_workers
+
+    if use_queue if use_queue is not None else USE_TASK_QUEUE:
+        return drain_queue(max_workers)
+
+    ws = open_worksheet()
+    if not ws:
+        return {}
+
+    # Chỉ đọc header + cột Status; từng dòng được tải khi nhận
+    header = read_header(ws)
+    col_idx = get_status_col(ws, header)
+    pending = list_pending_rows(ws, col_idx)
+    if not pending:
+        logger.info("💤 Không có nhiệm vụ 'pending'. Hệ thống nghỉ.")
+        return {}
+
+    workers = max(1, min(max_workers or get_drain_workers(), len(pending)))
+    _episode_workers = workers
+    logger.info(f"🚰 DRAIN MODE: {len(pending)} dòng pending, {workers} tập song song.")
+
+    def _claim_and_process(row_idx):
+        # Đang tắt daemon -> không nhận thêm dòng mới (dòng vẫn giữ 'pending')
+        if _stop_event.is_set():
+            return 'SKIPPED'
+        # Chỉ nhận dòng khi có worker rảnh -> dòng chưa tới lượt vẫn để 'pending'
+        try:
+            task = claim_task(ws, row_idx, col_idx, header)
+        except Exception as e:
+            logger.error(f"❌ Không nhận được dòng {row_idx}: {e}")
+            return 'FAILED'
+        if not task:
+            return 'SKIPPED'
+        return run_episode(processes, task, row_idx, reporter)
+
+    reporter = sheet_reporter(ws, col_idx)
+    outcomes = {}
+    try:
+        # Thread ở process cha chỉ nhận dòng + chờ kết quả; tập chạy trong process riêng
+        with episode_pool(workers, reporter) as processes, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="episode") as pool:
+            futures = {pool.submit(_claim_and_process, row_idx): row_idx for row_idx in pending}
+            for fut in as_completed(futures):
+                outcomes[futures[fut]] = fut.result()
+    finally:
+        # Worksheet chỉ dùng trong lần drain này -> dừng luôn thread ghi trạng thái của nó
+        close_reporters()
+    done = sum(1 for v in outcomes.values() if v == 'DONE')
+    logger.info(f"🏁 DRAIN XONG: {done}/{len(outcomes)} tập thành công.")
+    return outcomes
+
+
+def drain_queue(max_workers=None):
+    """
+    Giống drain() nhưng nhận task qua hàng đợi SQLite (lease có hạn + heartbeat):
+    nhiều process / máy dùng chung file DB không bao giờ nhận trùng 1 dòng,
+    và dòng của worker bị chết sẽ được nhận lại khi lease hết hạn.
+    """
+    global _episode_workers
+    from task_queue import TaskQueue, default_owner
+
+    ws = open_worksheet()
+    if not ws:
+        return {}
+
+    task_queue = TaskQueue()
+    col_idx = get_status_col(ws)
+    task_queue.sync_from_sheet(ws)
+    available = task_queue.stats().get("pending", 0)
+    if not available:
+        logger.info("💤 Hàng đợi không có task 'pending'. Hệ thống nghỉ.")
+        task_queue.sync_to_sheet(ws, col_idx)
+        return {}
+
+    workers = max(1, min(max_workers or get_drain_workers(), available))
+    _episode_workers = workers
+    logger.info(f"🗃️ QUEUE MODE: {available} task pending, {workers} tập song song.")
+    sync_lock = threading.Lock()
+
+    def _sync_back():
+        # Ghi trạng thái lên Sheet theo lô; lỗi mạng -> để lần đồng bộ sau
+        with sync_lock:
+            try:
+                task_queue.sync_to_sheet(ws, col_idx)
+            except Exception as e:
+                logger.warning(f"⚠️ Không đồng bộ được trạng thái lên Sheet: {e}")
+
+    def _worker():
+        owner = default_owner()
+        outcomes = {}
+        while not _stop_event.is_set():
+            claimed = task_queue.claim(owner)
+            if not claimed:
+                break
+            # row_idx chỉ là gợi ý: trạng thái được ghi lại theo ID tập khi đồng bộ
+            episode_id, row_idx, row = claimed
+            _sync_back()  # Sheet hiện PROCESSING ngay khi nhận
+            # worksheet=None: trạng thái trên Sheet do hàng đợi đồng bộ, không ghi trực tiếp;
+            # tiến độ ghi qua reporter riêng, khóa theo ID tập
+            task = build_task(row, row_idx, col_idx, None)
+            task["reporter"] = (progress, episode_id)
+            with task_queue.lease(episode_id, owner):
+                status = run_episode(processes, task, episode_id, progress)
+            task_queue.complete(episode_id, status, owner)
+            _sync_back()
+            outcomes[episode_id] = status
+        return outcomes
+
+    # Cột Status do hàng đợi đồng bộ -> reporter này chỉ ghi cột Progress
+    progress = get_reporter(ws, None, read_header, update_cells, find_rows=episode_rows)
+    outcomes = {}
+    try:
+        with episode_pool(workers, progress) as processes, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="episode") as pool:
+            for fut in as_completed([pool.submit(_worker) for _ in range(workers)]):
+                outcomes.update(fut.result())
+    finally:
+        close_reporters()
+
+    _sync_back()
+    done = sum(1 for v in outcomes.values() if v == 'DONE')
+    logger.info(f"🏁 QUEUE XONG: {done}/{len(outcomes)} tập thành công.")
+    return outcomes
+
+
+# =========================================================
+#  CHẾ ĐỘ DAEMON: CHẠY THƯỜNG TRỰC, GIỮ "ẤM" CLIENT / ASSET GIỮA CÁC TẬP
+# =========================================================
+def write_health(state):
+    try:
+        os.makedirs(os.path.dirname(DAEMON_HEALTH_FILE), exist_ok=True)
+        tmp_path = DAEMON_HEALTH_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, DAEMON_HEALTH_FILE)
+    except Exception as e:
+        logger.warning(f"⚠️ Không ghi được health file: {e}")
+
+
+def check_health(poll_seconds=DAEMON_POLL_SECONDS):
+    """
+    Health check cho supervisor (systemd / docker HEALTHCHECK): 0 nếu daemon còn sống,
+    1 nếu không có heartbeat hoặc heartbeat quá cũ (> 3 chu kỳ poll).
+    Heartbeat chỉ cập nhật giữa các lần poll -> khi đang xử lý tập chỉ kiểm tra process còn sống.
+    """
+    try:
+        with open(DAEMON_HEALTH_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as e:
+        logger.error(f"❌ Không đọc được health file: {e}")
+        return 1
+
+    age = datetime.now().timestamp() - state.get("heartbeat_ts", 0)
+    if state.get("status") == "stopped":
+        logger.error("❌ Daemon đã dừng.")
+        return 1
+    try:
+        os.kill(state.get("pid", 0), 0)
+    except (OSError, TypeError):
+        logger.error(f"❌ Process daemon (pid {state.get('pid')}) không còn chạy.")
+        return 1
+    if age > 3 * max(poll_seconds, 1) + 60 and state.get("status") != "processing":
+        logger.error(f"❌ Heartbeat quá cũ ({age:.0f}s).")
+        return 1
+    logger.info(f"✅ Daemon OK (pid {state.get('pid')}, heartbeat {age:.0f}s trước, {state.get('done', 0)} tập xong).")
+    return 0
+
+
+def run_daemon(max_workers=None, poll_seconds=DAEMON_POLL_SECONDS, use_queue=None):
+    """
+    Poll Sheet mỗi `poll_seconds` giây và drain các dòng pending trong cùng 1 process,
+    nên OpenAI client, credential + discovery document YouTube, nhạc/SFX đã decode,
+    font và ảnh overlay chỉ phải nạp 1 lần.
+    SIGTERM/SIGINT: chờ các tập đang chạy xong rồi thoát (dòng chưa nhận vẫn 'pending').
+    """
+    def _request_stop(signum, _frame):
+        if not _stop_event.is_set():
+            logger.info(f"🛑 Nhận tín hiệu {signal.Signals(signum).name}: chờ các tập đang chạy xong rồi dừng...")
+        _stop_event.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    state = {
+        "pid": os.getpid(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "status": "idle",
+        "polls": 0, "done": 0, "failed": 0,
+        "last_error": None,
+    }
+
+    def _beat(status):
+        state["status"] = status
+        state["heartbeat_ts"] = datetime.now().timestamp()
+        state["heartbeat_at"] = datetime.now().isoformat(timespec="seconds")
+        write_health(state)
+
+    logger.info(f"😈 DAEMON MODE: poll mỗi {poll_seconds}s (pid {os.getpid()}).")
+    while not _stop_event.is_set():
+        _beat("processing")
+        try:
+            outcomes = drain(max_workers, use_queue)
+            state["done"] += sum(1 for v in outcomes.values() if v == 'DONE')
+            state["failed"] += sum(1 for v in outcomes.values() if v == 'FAILED')
+            state["last_error"] = None
+        except Exception as e:
+            # Lỗi 1 lần poll (mạng, Sheet...) không làm chết daemon
+            logger.error(f"❌ [DAEMON] Lỗi khi poll: {e}", exc_info=True)
+            state["last_error"] = str(e)
+        state["polls"] += 1
+        _beat("idle")
+        _stop_event.wait(poll_seconds)
+
+    _beat("stopped")
+    logger.info("👋 Daemon đã dừng.")
+
+
+# =========================================================
+#  LUỒNG CHÍNH (MAIN PIPELINE)
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Podcast Cinematic Pipeline")
+    parser.add_argument("--drain", action="store_true", help="Xử lý hết các dòng 'pending' trong 1 lần chạy")
+    parser.add_argument("--daemon", action="store_true", help="Chạy thường trực, poll Sheet định kỳ")
+    parser.add_argument("--health", action="store_true", help="Kiểm tra heartbeat của daemon (exit code 0/1)")
+    parser.add_argument("--poll", type=int, default=DAEMON_POLL_SECONDS, help="Chu kỳ poll (giây) ở chế độ --daemon")
+    parser.add_argument("--workers", type=int, default=None, help="Số tập chạy song song ở chế độ --drain / --daemon")
+    parser.add_argument("--queue", action="store_true", default=USE_TASK_QUEUE,
+                        help="Nhận task qua hàng đợi SQLite có lease (an toàn khi nhiều worker chạy cùng lúc)")
+    args = parser.parse_args()
+
+    if args.health:
+        sys.exit(check_health(args.poll))
+
+    setup_environment()
+
+    if args.daemon:
+        run_daemon(args.workers, args.poll, args.queue)
+        return
+
+    if args.drain or args.queue:
+        drain(args.workers, args.queue)
+        return
+    
+    # 1. Lấy nhiệm vụ từ Google Sheet
+    task = fetch_content()
+    if not task:
+        logger.info("💤 Không có nhiệm vụ 'pending'. Hệ thống nghỉ.")
+        return
+
+    process_task(task)
+    close_reporters()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,47 @@
+# === scripts/llm_cache.py ===
+import os
+import logging
+from disk_cache import DiskCache, make_key
+
+logger = logging.getLogger(__name__)
+
+# Tắt cache bằng LLM_CACHE=0 (VD: muốn GPT viết lại nội dung mới)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+# Giới hạn dung lượng cache response (mặc định 200MB ~ vài chục nghìn response)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 ** 2)))
+
+_cache = DiskCache("llm", LLM_CACHE_MAX_BYTES)
+
+
+def lookup(key_inputs, use_cache=True):
+    """Response đã lưu cho khóa này, hoặc None."""
+    if not (LLM_CACHE_ENABLED and use_cache):
+        return None
+    meta = _cache.get(make_key("chat", key_inputs))
+    if meta and isinstance(meta.get("value"), str):
+        logger.info("♻️ [LLM CACHE] Dùng lại response đã lưu")
+        return meta["value"]
+    return None
+
+
+def store(key_inputs, content, use_cache=True):
+    # Không lưu response rỗng (lỗi / bị cắt)
+    if LLM_CACHE_ENABLED and use_cache and content:
+        _cache.put(make_key("chat", key_inputs), value=content)
+
+
+def cached_completion(key_inputs, func, use_cache=True):
+    """
+    Trả về response đã lưu cho cùng khóa (model, prompt, temperature, response_format, backend),
+    ngược lại gọi func() rồi lưu kết quả. use_cache=False: luôn gọi mạng, không đọc/ghi cache.
+    """
+    cached = lookup(key_inputs, use_cache)
+    if cached is not None:
+        return cached
+    content = func()
+    store(key_inputs, content, use_cache)
+    return content
+
+
+def llm_cache_stats():
+    return _cache.stats()
@@ -0,0 +1,208 @@
+# === scripts/profiler.py ===
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Run / stage hiện tại (contextvars -> đi theo từng thread của stage graph)
+_current_run = contextvars.ContextVar("profiler_run", default=None)
+_current_stage = contextvars.ContextVar("profiler_stage", default=None)
+
+# Chu kỳ lấy mẫu RSS (giây)
+RSS_SAMPLE_INTERVAL = 0.25
+
+
+# =========================================================
+# 📏 HÀM ĐO TÀI NGUYÊN (LINUX /proc, CÓ FALLBACK)
+# =========================================================
+def _current_rss_mb():
+    """RSS hiện tại của process (MB)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except Exception:
+        # Fallback: high-water mark của cả process (ru_maxrss tính bằng KB trên Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _thread_io():
+    """Số byte đọc/ghi đĩa của thread hiện tại (0 nếu hệ điều hành không hỗ trợ)."""
+    stats = {"read_bytes": 0, "write_bytes": 0}
+    for path in ("/proc/thread-self/io", "/proc/self/io"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in stats:
+                        stats[key] = int(value)
+            return stats
+        except Exception:
+            continue
+    return stats
+
+
+def _children_cpu():
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+# =========================================================
+# 📊 PROFILER CHO 1 LẦN CHẠY PIPELINE
+# =========================================================
+class RunProfiler:
+    """
+    Ghi lại cho từng stage: wall time, CPU time, RSS đỉnh, byte đọc/ghi,
+    độ trễ + số lần retry của các API bên ngoài. Xuất 1 file JSON khi kết thúc.
+
+    Ghi chú: cpu_s / io là của thread chạy stage; children_cpu_s là CPU của các
+    process con (ffmpeg...) kết thúc trong lúc stage chạy; peak_rss_mb là RSS của
+    cả process lấy mẫu trong lúc stage chạy (các stage song song dùng chung process).
+    """
+    def __init__(self, run_id):
+        self.run_id = str(run_id)
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.meta = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+        self._sampler.start()
+
+    def _sample_rss(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = _current_rss_mb()
+            with self._lock:
+                for record in self._active.values():
+                    record["peak_rss_mb"] = max(record["peak_rss_mb"], round(rss, 1))
+
+    @contextmanager
+    def stage(self, name):
+        record = {
+            "wall_s": 0.0, "cpu_s": 0.0, "children_cpu_s": 0.0,
+            "peak_rss_mb": round(_current_rss_mb(), 1),
+            "read_bytes": 0, "write_bytes": 0,
+            "ok": True, "api": {},
+        }
+        key = object()
+        with self._lock:
+            self._active[key] = record
+            self.stages[name] = record
+
+        io_start = _thread_io()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        children_start = _children_cpu()
+        token = _current_stage.set(record)
+        try:
+            yield record
+        except BaseException:
+            record["ok"] = False
+            raise
+        finally:
+            _current_stage.reset(token)
+            io_end = _thread_io()
+            record["wall_s"] = round(time.perf_counter() - wall_start, 3)
+            record["cpu_s"] = round(time.thread_time() - cpu_start, 3)
+            record["children_cpu_s"] = round(_children_cpu() - children_start, 3)
+            record["read_bytes"] = io_end["read_bytes"] - io_start["read_bytes"]
+            record["write_bytes"] = io_end["write_bytes"] - io_start["write_bytes"]
+            with self._lock:
+                self._active.pop(key, None)
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], round(_current_rss_mb(), 1))
+
+    def record_api(self, service, latency_s, ok=True, retry=False):
+        record = _current_stage.get()
+        with self._lock:
+            api = record["api"] if record is not None else self.meta.setdefault("api_outside_stages", {})
+            entry = api.setdefault(service, {
+                "calls": 0, "errors": 0, "retries": 0, "total_latency_s": 0.0, "max_latency_s": 0.0
+            })
+            entry["calls"] += 1
+            entry["errors"] += 0 if ok else 1
+            entry["retries"] += 1 if retry else 0
+            entry["total_latency_s"] = round(entry["total_latency_s"] + latency_s, 3)
+            entry["max_latency_s"] = round(max(entry["max_latency_s"], latency_s), 3)
+
+    def add_stage_records(self, records, prefix=""):
+        """Gộp số liệu stage đo ở process khác (VD: process render shorts)."""
+        with self._lock:
+            for name, record in (records or {}).items():
+                self.stages[f"{prefix}{name}"] = record
+
+    def report(self):
+        self._stop.set()
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "wall_s": round(time.perf_counter() - self._t0, 3),
+                "process": {
+                    "cpu_s": round(usage_self.ru_utime + usage_self.ru_stime, 3),
+                    "children_cpu_s": round(usage_children.ru_utime + usage_children.ru_stime, 3),
+                    "max_rss_mb": round(usage_self.ru_maxrss / 1024, 1),
+                    "children_max_rss_mb": round(usage_children.ru_maxrss / 1024, 1),
+                },
+                "meta": self.meta,
+                "stages": self.stages,
+            }
+
+    def write_report(self, output_path):
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+            logger.info(f"📊 Đã ghi báo cáo hiệu năng: {output_path}")
+            return output_path
+        except Exception as e:
+            logger.warning(f"⚠️ Không ghi được báo cáo hiệu năng: {e}")
+            return None
+
+
+# =========================================================
+# 🔌 API DÙNG TRONG CÁC MODULE (KHÔNG CÓ RUN -> KHÔNG LÀM GÌ)
+# =========================================================
+def start_run(run_id):
+    """Tạo profiler cho lần chạy hiện tại (gắn vào context hiện tại)."""
+    profiler = RunProfiler(run_id)
+    _current_run.set(profiler)
+    return profiler
+
+
+def current_run():
+    return _current_run.get()
+
+
+@contextmanager
+def stage(name):
+    profiler = _current_run.get()
+    if profiler is None:
+        yield None
+        return
+    with profiler.stage(name) as record:
+        yield record
+
+
+@contextmanager
+def api_call(service, retry=False):
+    """Đo độ trễ 1 lần gọi API bên ngoài. retry=True nếu đây là lần thử lại."""
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        profiler = _current_run.get()
+        if profiler is not None:
+            profiler.record_api(service, time.perf_counter() - start, ok=ok, retry=retry)
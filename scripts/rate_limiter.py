@@ -0,0 +1,215 @@
+# === scripts/rate_limiter.py ===
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình mặc định cho từng backend: (request/giây, số request đồng thời tối đa)
+# Ghi đè bằng env: LIMIT_EDGE_TTS_RPS=6, LIMIT_OPENAI_CHAT_MAX_CONCURRENCY=4...
+DEFAULT_LIMITS = {
+    "openai.chat": (5.0, 8),
+    "openai.images": (1.0, 2),
+    "openai.tts": (3.0, 4),
+    "edge_tts": (4.0, 4),
+}
+FALLBACK_LIMIT = (2.0, 2)
+
+# Chờ tối đa sau 1 lần bị 429 (giây)
+MAX_BACKOFF_SECONDS = 30.0
+# Chu kỳ kiểm tra lại khi chờ ở chế độ async (không dùng primitive gắn với 1 event loop)
+ASYNC_POLL_SECONDS = 0.05
+
+
+def _env_limit(name, key, default, cast):
+    env_name = f"LIMIT_{name.upper().replace('.', '_')}_{key}"
+    return cast(os.getenv(env_name, default))
+
+
+def is_throttle_error(exc):
+    """Nhận diện lỗi bị giới hạn tốc độ (HTTP 429) từ OpenAI SDK, aiohttp (Edge TTS) hoặc backend giả."""
+    for obj in (exc, getattr(exc, "response", None)):
+        if getattr(obj, "status_code", None) == 429 or getattr(obj, "status", None) == 429:
+            return True
+    text = str(exc)
+    return "429" in text or "Too Many Requests" in text or "rate limit" in text.lower()
+
+
+def _retry_after(exc):
+    """Giá trị header Retry-After (giây) nếu server có gửi."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Bộ giới hạn cho 1 backend, dùng chung giữa mọi thread / event loop trong process:
+    - Token bucket giới hạn tốc độ (request/giây)
+    - Giới hạn số request đồng thời kiểu AIMD: mỗi request thành công tăng cộng (+1/limit),
+      bị 429 thì giảm nhân (x0.5) và tạm dừng cả backend (backoff lũy thừa / Retry-After),
+      lỗi khác hoặc độ trễ tăng vọt thì giảm nhẹ (x0.9).
+    """
+    def __init__(self, name, rate, max_concurrency, min_concurrency=1):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max(min_concurrency, max_concurrency // 2 or 1))
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.latency_ewma = None
+        self.latency_floor = None
+        self.counts = {"ok": 0, "errors": 0, "throttled": 0, "waited_s": 0.0}
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    # =========================================================
+    # 🎟️ XIN / TRẢ SLOT
+    # =========================================================
+    def _try_acquire(self):
+        """Trả về 0 nếu lấy được slot, ngược lại số giây nên chờ trước khi thử lại. Gọi khi đang giữ lock."""
+        now = time.monotonic()
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.25
+        if self.tokens < 1.0:
+            return (1.0 - self.tokens) / self.rate
+        self.tokens -= 1.0
+        self.in_flight += 1
+        return 0
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if not wait:
+                    break
+                self._cond.wait(wait)
+            self.counts["waited_s"] = round(self.counts["waited_s"] + time.monotonic() - start, 3)
+
+    async def acquire_async(self):
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                wait = self._try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(min(wait, ASYNC_POLL_SECONDS))
+        with self._lock:
+            self.counts["waited_s"] = round(self.counts["waited_s"] + time.monotonic() - start, 3)
+
+    def release(self, latency=None, error=None):
+        with self._cond:
+            self.in_flight -= 1
+            if error is not None and is_throttle_error(error):
+                self._on_throttle(error)
+            elif error is not None:
+                self.counts["errors"] += 1
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                self._on_success(latency)
+            self._cond.notify_all()
+
+    def _on_success(self, latency):
+        self.counts["ok"] += 1
+        self.consecutive_throttles = 0
+        # Tăng cộng: khoảng +1 slot sau mỗi "vòng" request thành công
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+        self.rate = min(self.max_rate, self.rate * 1.05)
+        if latency is None:
+            return
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self.latency_floor = latency if self.latency_floor is None else min(self.latency_floor * 1.01, latency)
+        # Độ trễ gấp 3 lần mức nền -> server đang quá tải, giảm nhẹ trước khi bị 429
+        if self.latency_ewma > 3 * self.latency_floor and self.limit > self.min_concurrency:
+            self.limit = max(self.min_concurrency, self.limit * 0.9)
+
+    def _on_throttle(self, error):
+        self.counts["throttled"] += 1
+        self.consecutive_throttles += 1
+        self.limit = max(self.min_concurrency, self.limit * 0.5)
+        self.rate = max(self.max_rate * 0.1, self.rate * 0.5)
+        backoff = _retry_after(error)
+        if backoff is None:
+            backoff = min(MAX_BACKOFF_SECONDS, 2 ** (self.consecutive_throttles - 1)) * random.uniform(0.8, 1.2)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+        logger.warning(
+            f"🚦 [{self.name}] Bị giới hạn tốc độ (429): tạm dừng {backoff:.1f}s, "
+            f"đồng thời {self.limit:.1f}, {self.rate:.2f} req/s"
+        )
+
+    # =========================================================
+    # 🧰 CONTEXT MANAGER (SYNC / ASYNC)
+    # =========================================================
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(error=e)
+            raise
+        except BaseException:
+            # Bị hủy (hedging / timeout): trả slot, không tính là lỗi của server
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+            raise
+        self.release(latency=time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, limit=round(self.limit, 2), rate=round(self.rate, 2))
+
+
+# =========================================================
+# 🔌 REGISTRY: 1 LIMITER / BACKEND / PROCESS
+# =========================================================
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate, concurrency = DEFAULT_LIMITS.get(name, FALLBACK_LIMIT)
+            limiter = _limiters[name] = AdaptiveLimiter(
+                name,
+                rate=_env_limit(name, "RPS", rate, float),
+                max_concurrency=_env_limit(name, "MAX_CONCURRENCY", concurrency, int),
+            )
+        return limiter
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
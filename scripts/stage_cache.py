@@ -0,0 +1,88 @@
+# === scripts/stage_cache.py ===
+import os
+import shutil
+import logging
+from utils import PROJECT_ROOT
+from disk_cache import DiskCache, make_key
+
+logger = logging.getLogger(__name__)
+
+# Tắt cache bằng STAGE_CACHE=0 (VD: muốn ép tạo lại toàn bộ)
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE", "1") != "0"
+# Giới hạn dung lượng cache artifact (mặc định 5GB)
+STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+_cache = DiskCache("stages", STAGE_CACHE_MAX_BYTES)
+
+
+def _collect_files(value, found):
+    """Tìm mọi đường dẫn file (trong thư mục dự án) nằm trong output của stage."""
+    if isinstance(value, str):
+        if os.path.isabs(value) and os.path.isfile(value) and value.startswith(PROJECT_ROOT + os.sep):
+            found.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_files(v, found)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_files(v, found)
+    return found
+
+
+def _rebase(value, old_root):
+    """Đổi đường dẫn tuyệt đối sang thư mục dự án hiện tại (cache có thể tạo ở checkout khác)."""
+    if isinstance(value, str):
+        if old_root and old_root != PROJECT_ROOT and value.startswith(old_root + os.sep):
+            return os.path.join(PROJECT_ROOT, os.path.relpath(value, old_root))
+        return value
+    if isinstance(value, dict):
+        return {k: _rebase(v, old_root) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_rebase(v, old_root) for v in value]
+    return value
+
+
+def _is_cacheable(value):
+    # Không cache kết quả lỗi (None / False / "FAILED" / rỗng)
+    return bool(value) and value != "FAILED"
+
+
+def run_cached(stage_name, key_inputs, func):
+    """
+    Chạy 1 stage có cache theo nội dung input.
+    - key_inputs: mọi thứ quyết định output (text_hash, prompt, cấu hình giọng, hash assets...)
+    - func: hàm không tham số tạo output (đường dẫn / dict / list chứa đường dẫn)
+
+    Nếu khóa đã có trong cache và hợp lệ: khôi phục các file output về đúng vị trí và
+    trả về kết quả cũ ngay, không gọi lại API / render.
+    """
+    if not STAGE_CACHE_ENABLED:
+        return func()
+
+    key = make_key(stage_name, key_inputs)
+    meta = _cache.get(key)
+    if meta:
+        try:
+            cached = meta["value"]
+            for blob, rel_path in cached["paths"].items():
+                target = os.path.join(PROJECT_ROOT, rel_path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(_cache.blob_path(key, blob), target)
+            logger.info(f"♻️ [CACHE] Dùng lại kết quả stage '{stage_name}' ({key[:10]})")
+            return _rebase(cached["result"], cached.get("root"))
+        except Exception as e:
+            logger.warning(f"⚠️ [CACHE] Không khôi phục được '{stage_name}', chạy lại: {e}")
+
+    value = func()
+
+    if _is_cacheable(value):
+        files = _collect_files(value, [])
+        blobs = {f"f{i}": path for i, path in enumerate(dict.fromkeys(files))}
+        paths = {blob: os.path.relpath(path, PROJECT_ROOT) for blob, path in blobs.items()}
+        _cache.put(key, value={"result": value, "paths": paths, "root": PROJECT_ROOT}, files=blobs)
+
+    return value
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,123 @@
+# === scripts/stage_graph.py ===
+import logging
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import profiler
+
+logger = logging.getLogger(__name__)
+
+# Số stage tối đa chạy song song (phần lớn là chờ I/O: GPT, DALL-E, TTS, upload)
+DEFAULT_STAGE_WORKERS = 4
+
+
+class Stage:
+    """
+    Một bước trong pipeline.
+    - name: Tên duy nhất của stage
+    - func: Hàm nhận dict `results` (output của các stage phụ thuộc) và trả về output
+    - deps: Danh sách tên các stage phải hoàn thành trước
+    """
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+# =========================================================
+# 🔍 KIỂM TRA ĐỒ THỊ (TRÙNG TÊN / THIẾU PHỤ THUỘC / VÒNG LẶP)
+# =========================================================
+def _validate(stages):
+    names = [s.name for s in stages]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Trùng tên stage: {names}")
+
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        for d in s.deps:
+            if d not in by_name:
+                raise ValueError(f"Stage '{s.name}' phụ thuộc stage không tồn tại: '{d}'")
+
+    # Phát hiện vòng lặp bằng cách "gỡ" dần các stage không còn phụ thuộc
+    remaining = {s.name: set(s.deps) for s in stages}
+    while remaining:
+        ready = [n for n, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Đồ thị stage có vòng lặp: {sorted(remaining)}")
+        for n in ready:
+            del remaining[n]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+# =========================================================
+# 🚀 HÀM CHÍNH: CHẠY ĐỒ THỊ STAGE SONG SONG
+# =========================================================
+def run_stage_graph(stages, max_workers=DEFAULT_STAGE_WORKERS):
+    """
+    Chạy các stage theo đồ thị phụ thuộc. Stage nào đủ input sẽ chạy ngay,
+    các stage độc lập chạy song song trên thread pool.
+
+    Stage ném Exception -> ghi vào `errors`, các stage phụ thuộc bị bỏ qua.
+    Stage trả về None KHÔNG bị coi là lỗi (stage sau tự quyết định xử lý).
+
+    Trả về: (results, errors) - hai dict theo tên stage.
+    """
+    _validate(stages)
+
+    pending = {s.name: s for s in stages}
+    results = {}
+    errors = {}
+    running = {}
+
+    def _skip_dependents():
+        # Lan truyền lỗi: stage nào phụ thuộc stage lỗi/bị bỏ qua thì bỏ qua luôn
+        changed = True
+        while changed:
+            changed = False
+            for name, s in list(pending.items()):
+                failed = [d for d in s.deps if d in errors]
+                if failed:
+                    errors[name] = RuntimeError(f"Bỏ qua do stage '{failed[0]}' lỗi")
+                    logger.warning(f"⏭️ [STAGE {name}] Bỏ qua (phụ thuộc '{failed[0]}' lỗi).")
+                    del pending[name]
+                    changed = True
+
+    def _run(stage, inputs):
+        start = time.perf_counter()
+        logger.info(f"▶️ [STAGE {stage.name}] Bắt đầu...")
+        with profiler.stage(stage.name):
+            output = stage.func(inputs)
+        logger.info(f"✅ [STAGE {stage.name}] Xong sau {time.perf_counter() - start:.1f}s")
+        return output
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        while pending or running:
+            # 1. Khởi chạy mọi stage đã đủ phụ thuộc
+            for name, s in list(pending.items()):
+                if all(d in results for d in s.deps):
+                    inputs = {d: results[d] for d in s.deps}
+                    # Chạy trong bản sao context để stage thấy profiler / trạng thái của tập hiện tại
+                    ctx = contextvars.copy_context()
+                    running[pool.submit(ctx.run, _run, s, inputs)] = name
+                    del pending[name]
+
+            if not running:
+                # Không còn gì chạy được (các stage còn lại đều phụ thuộc stage lỗi)
+                _skip_dependents()
+                if pending:
+                    raise RuntimeError(f"Stage bị kẹt: {sorted(pending)}")
+                break
+
+            # 2. Chờ ít nhất 1 stage xong
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    logger.error(f"❌ [STAGE {name}] Lỗi: {e}", exc_info=True)
+                    errors[name] = e
+            _skip_dependents()
+
+    return results, errors
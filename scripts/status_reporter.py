@@ -0,0 +1,258 @@
+# === scripts/status_reporter.py ===
+import os
+import time
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Khoảng cách tối thiểu giữa 2 lần ghi Sheet (giây) -> giới hạn quota Sheets API
+STATUS_FLUSH_SECONDS = float(os.getenv("STATUS_FLUSH_SECONDS", "5"))
+# Cột tiến độ (nếu Sheet không có cột này -> bỏ qua tiến độ, ô Status chỉ giữ PROCESSING/DONE/FAILED)
+PROGRESS_COLUMN = "Progress"
+FINAL_STATUSES = ("DONE", "FAILED")
+
+# (reporter, khóa dòng) của tập đang chạy -> các module sâu bên trong (TTS, render) báo tiến độ
+_current = contextvars.ContextVar("status_reporter", default=None)
+
+_reporters = {}
+_reporters_lock = threading.Lock()
+
+
+class StatusReporter:
+    """
+    Ghi trạng thái / tiến độ lên Sheet theo kiểu write-behind:
+    - set_status() / set_progress() chỉ cập nhật bộ nhớ rồi trả về ngay (không gọi mạng)
+    - thread nền gộp mọi thay đổi (chỉ giữ giá trị mới nhất của mỗi dòng) và ghi
+      bằng 1 batch_update, tối đa 1 lần mỗi `min_interval` giây
+    - ô Status chỉ chứa đúng giá trị trạng thái (các bước khác so khớp chính xác),
+      tiến độ chỉ ghi vào cột Progress riêng nếu Sheet có cột đó
+
+    Không phụ thuộc lớp Sheets: read_header(ws) / update_cells(ws, [(row, col, value)])
+    do nơi gọi truyền vào (module TTS / render chỉ cần report_progress, không kéo theo gspread).
+    - status_col=None: chỉ ghi tiến độ (VD: hàng đợi SQLite tự đồng bộ cột Status)
+    - find_rows(ws, keys) -> {key: row}: khóa không phải số dòng (VD: ID tập), dò lại dòng trước mỗi lần ghi
+    """
+    def __init__(self, ws, status_col, read_header, update_cells, find_rows=None,
+                 min_interval=STATUS_FLUSH_SECONDS):
+        self.ws = ws
+        self.status_col = status_col
+        self.read_header = read_header
+        self.update_cells = update_cells
+        self.find_rows = find_rows
+        self.min_interval = min_interval
+        self._status = {}
+        self._progress = {}
+        self._dirty = set()
+        self._writing = False
+        self._urgent = False
+        self._closed = False
+        self._last_flush = 0.0
+        self._progress_col = None
+        self._written_status = {}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="status-reporter", daemon=True)
+        self._thread.start()
+
+    # =========================================================
+    # 📝 API PHÍA PIPELINE (KHÔNG BAO GIỜ CHẶN)
+    # =========================================================
+    def set_status(self, row_idx, status):
+        with self._cond:
+            self._status[row_idx] = status
+            if status in FINAL_STATUSES:
+                # Tập đã xong -> ghi sớm, không chờ hết chu kỳ
+                self._urgent = True
+            self._dirty.add(row_idx)
+            self._cond.notify_all()
+
+    def set_progress(self, row_idx, label, text):
+        with self._cond:
+            progress = self._progress.setdefault(row_idx, {})
+            if progress.get(label) == text:
+                return
+            progress[label] = text
+            self._dirty.add(row_idx)
+            self._cond.notify_all()
+
+    def flush(self, timeout=30):
+        """Chờ mọi thay đổi đang đệm được ghi lên Sheet (dùng khi kết thúc lần chạy)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            while (self._dirty or self._writing) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+
+    def close(self, timeout=30):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    # =========================================================
+    # 🔄 THREAD NỀN: GỘP + GHI THEO LÔ
+    # =========================================================
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty:
+                    return
+                # Giới hạn tốc độ ghi (trừ khi có trạng thái cuối / flush() đang chờ)
+                deadline = self._last_flush + self.min_interval
+                while not self._urgent and not self._closed and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                rows = sorted(self._dirty)
+                self._dirty.clear()
+                self._urgent = False
+                self._writing = True
+                snapshot = {
+                    row: (self._status.get(row), dict(self._progress.get(row, {})))
+                    for row in rows
+                }
+
+            try:
+                self._write(snapshot)
+            except Exception as e:
+                logger.warning(f"⚠️ Không ghi được trạng thái lên Sheet (sẽ thử lại): {e}")
+                with self._cond:
+                    # Giá trị mới nhất vẫn nằm trong bộ nhớ -> chỉ cần đánh dấu lại
+                    if not self._closed:
+                        self._dirty.update(rows)
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._last_flush = time.monotonic()
+                    self._cond.notify_all()
+
+    def _write(self, snapshot):
+        if self._progress_col is None:
+            header = self.read_header(self.ws)
+            self._progress_col = header.index(PROGRESS_COLUMN) + 1 if PROGRESS_COLUMN in header else 0
+        if not self._progress_col and not self.status_col:
+            return
+
+        rows = self.find_rows(self.ws, list(snapshot)) if self.find_rows else {key: key for key in snapshot}
+        updates = []
+        for key, (status, progress) in snapshot.items():
+            row = rows.get(key)
+            if row is None:
+                continue
+            progress_text = " | ".join(f"{label} {text}" for label, text in progress.items())
+            # Chỉ ghi lại ô Status khi trạng thái đổi (tiến độ đổi không đụng tới ô này)
+            if self.status_col and status and self._written_status.get(key) != status:
+                updates.append((row, self.status_col, status))
+            if self._progress_col:
+                updates.append((row, self._progress_col, progress_text))
+        self.update_cells(self.ws, updates)
+        for key, (status, _) in snapshot.items():
+            if status:
+                self._written_status[key] = status
+
+
+class ForwardingReporter:
+    """
+    Reporter dùng trong process con (mỗi tập 1 process): chỉ đẩy sự kiện vào `events`
+    (multiprocessing queue), process cha chuyển tiếp sang reporter thật bằng forward_events().
+    """
+    def __init__(self, events):
+        self.events = events
+
+    def set_status(self, key, status):
+        self.events.put(("set_status", key, status))
+
+    def set_progress(self, key, label, text):
+        self.events.put(("set_progress", key, label, text))
+
+
+def forward_events(events, reporter):
+    """Vòng lặp ở process cha: chuyển sự kiện từ các ForwardingReporter sang `reporter` tới khi nhận None."""
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        method, key, *args = event
+        try:
+            getattr(reporter, method)(key, *args)
+        except Exception as e:
+            logger.warning(f"⚠️ Không chuyển được trạng thái từ process con: {e}")
+
+
+# =========================================================
+# 🔌 API DÙNG TRONG CÁC MODULE
+# =========================================================
+def get_reporter(ws, status_col, read_header, update_cells, find_rows=None):
+    """
+    1 reporter (1 thread nền) cho mỗi worksheet + cột Status, dùng chung giữa các tập song song.
+    Sống tới khi close_all() được gọi.
+    """
+    key = (id(ws), status_col)
+    with _reporters_lock:
+        reporter = _reporters.get(key)
+        if reporter is None:
+            reporter = _reporters[key] = StatusReporter(ws, status_col, read_header, update_cells, find_rows)
+        return reporter
+
+
+def flush_all(timeout=30):
+    with _reporters_lock:
+        reporters = list(_reporters.values())
+    for reporter in reporters:
+        reporter.flush(timeout)
+
+
+def close_all(timeout=30):
+    """
+    Ghi nốt rồi dừng mọi reporter và bỏ khỏi registry (gọi khi kết thúc 1 lần drain):
+    mỗi lần poll mở worksheet mới -> không để thread nền / client gspread cũ tồn đọng.
+    """
+    with _reporters_lock:
+        reporters = list(_reporters.values())
+        _reporters.clear()
+    for reporter in reporters:
+        reporter.close(timeout)
+
+
+def bind(reporter, key):
+    """Gắn tập hiện tại (khóa dòng: số dòng hoặc ID tập) vào context (các stage chạy trong bản sao context sẽ thấy)."""
+    return _current.set((reporter, key) if reporter else None)
+
+
+def report_progress(label, text):
+    """Báo tiến độ của tập hiện tại, VD: report_progress("TTS", "12/40"). Không có reporter -> bỏ qua."""
+    current = _current.get()
+    if current is not None:
+        reporter, row_idx = current
+        reporter.set_progress(row_idx, label, text)
+
+
+def render_progress_logger(label="render"):
+    """
+    Logger proglog cho moviepy write_videofile(logger=...): báo % frame đã render.
+    Không có reporter -> 'bar' (thanh tiến độ mặc định của moviepy).
+    """
+    current = _current.get()
+    if current is None:
+        return "bar"
+
+    from proglog import ProgressBarLogger
+
+    class _RenderProgress(ProgressBarLogger):
+        last_pct = -1
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # Bar 't' = frame video; bar 'chunk' = audio (bỏ qua)
+            if bar != "t" or attr != "index":
+                return
+            total = self.bars[bar].get("total") or 0
+            pct = int(100 * value / total) if total else 0
+            if pct != self.last_pct:
+                self.last_pct = pct
+                reporter, row_idx = current
+                reporter.set_progress(row_idx, label, f"{pct}%")
+
+    return _RenderProgress()
@@ -0,0 +1,282 @@
+# === scripts/task_queue.py ===
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from utils import get_path
+from fetch_content import read_header, get_status_col, list_pending_rows, read_id_rows, read_rows, update_cells
+
+logger = logging.getLogger(__name__)
+
+# File SQLite của hàng đợi (đặt trên volume chung nếu nhiều máy cùng dùng;
+# lưu ý: khóa SQLite không tin cậy trên NFS -> chỉ dùng volume cục bộ / bind mount)
+TASK_QUEUE_DB = os.getenv("TASK_QUEUE_DB", get_path("data", "task_queue.sqlite3"))
+# Thời hạn lease (giây): worker chết quá thời hạn này -> task được trả lại hàng đợi
+LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "600"))
+# Số lần nhận tối đa 1 task (lease hết hạn liên tục = worker crash) trước khi đánh dấu FAILED
+MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+# Trạng thái local -> giá trị ghi lên cột Status của Sheet
+SHEET_STATUS = {"leased": "PROCESSING", "done": "DONE", "failed": "FAILED"}
+
+# Khóa theo ID tập: số dòng trên Sheet đổi khi có người chèn / xóa dòng nên chỉ là gợi ý (row_idx),
+# được dò lại theo cột ID mỗi lần đồng bộ.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episode_tasks (
+    episode_id    TEXT PRIMARY KEY,
+    row_idx       INTEGER NOT NULL,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    lease_owner   TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    synced        INTEGER NOT NULL DEFAULT 1,
+    updated_at    REAL
+);
+CREATE INDEX IF NOT EXISTS idx_episode_tasks_status ON episode_tasks(status, row_idx);
+"""
+
+
+def default_owner():
+    """Định danh worker: host:pid:thread (duy nhất giữa các process / thread)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class TaskQueue:
+    """
+    Hàng đợi task cục bộ (SQLite) phản chiếu Google Sheet, mỗi tập 1 task (khóa theo ID).
+    - sync_from_sheet(): nạp các dòng 'pending' mới từ Sheet (đọc theo lô)
+    - claim(): nhận task bằng lease có hạn (BEGIN IMMEDIATE -> không 2 worker nào nhận trùng)
+    - heartbeat() / lease(): gia hạn lease khi tập còn đang chạy
+    - complete(): ghi trạng thái cuối; sync_to_sheet() đẩy các thay đổi lên Sheet theo lô
+    """
+    def __init__(self, path=TASK_QUEUE_DB, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Mỗi thao tác 1 kết nối riêng -> an toàn giữa các thread / process
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            # Giữ khóa ghi ngay từ đầu: đọc-rồi-ghi là nguyên tử giữa các worker
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # =========================================================
+    # 🔄 ĐỒNG BỘ SHEET -> SQLITE
+    # =========================================================
+    def sync_from_sheet(self, ws):
+        """
+        Nạp các dòng 'pending' trên Sheet chưa có trong hàng đợi (hoặc được đặt lại 'pending'
+        sau khi đã xong). Dòng đang 'pending' ở local nhưng trên Sheet đã đổi trạng thái
+        (sửa tay) -> bỏ khỏi hàng đợi. Trả về số task mới.
+        """
+        header = read_header(ws)
+        status_col = get_status_col(ws, header)
+        pending_rows = list_pending_rows(ws, status_col)
+        row_to_id = {row: eid for eid, rows in read_id_rows(ws, header).items() for row in rows}
+
+        # ID tập -> dòng hiện tại (dòng pending không có ID / trùng ID -> không nhận được)
+        pending_ids = {}
+        for row_idx in pending_rows:
+            episode_id = row_to_id.get(row_idx)
+            if not episode_id:
+                logger.warning(f"⚠️ [QUEUE] Dòng {row_idx} đang 'pending' nhưng không có ID -> bỏ qua.")
+            elif episode_id in pending_ids:
+                logger.warning(f"⚠️ [QUEUE] ID {episode_id} bị trùng ở dòng {pending_ids[episode_id]} và {row_idx} -> chỉ nhận dòng đầu.")
+            else:
+                pending_ids[episode_id] = row_idx
+
+        with self._connect() as conn:
+            known = {r["episode_id"]: r["status"] for r in conn.execute("SELECT episode_id, status FROM episode_tasks")}
+
+        # Tập mới, hoặc tập đã xong/đã đồng bộ nhưng bị đặt lại 'pending' trên Sheet
+        to_fetch = [row for eid, row in pending_ids.items() if known.get(eid) in (None, "done", "failed", "cancelled")]
+        rows = read_rows(ws, to_fetch, header)
+
+        now = time.time()
+        added = 0
+        with self._transaction() as conn:
+            for row_idx, row in rows.items():
+                cur = conn.execute(
+                    """INSERT INTO episode_tasks (episode_id, row_idx, payload, status, attempts, synced, updated_at)
+                       VALUES (?, ?, ?, 'pending', 0, 1, ?)
+                       ON CONFLICT(episode_id) DO UPDATE SET
+                           row_idx=excluded.row_idx, payload=excluded.payload, status='pending',
+                           lease_owner=NULL, lease_expires=NULL, attempts=0, synced=1, updated_at=excluded.updated_at
+                       WHERE episode_tasks.status IN ('done', 'failed', 'cancelled') AND episode_tasks.synced = 1""",
+                    (row_to_id[row_idx], row_idx, json.dumps(row, ensure_ascii=False, default=str), now)
+                )
+                added += cur.rowcount
+            # Cập nhật gợi ý số dòng (Sheet có thể đã bị chèn / xóa dòng)
+            conn.executemany(
+                "UPDATE episode_tasks SET row_idx=? WHERE episode_id=? AND row_idx<>?",
+                [(row, eid, row) for eid, row in pending_ids.items()]
+            )
+            # Local còn 'pending' nhưng Sheet không còn -> hủy
+            for episode_id, status in known.items():
+                if status == "pending" and episode_id not in pending_ids:
+                    conn.execute(
+                        "UPDATE episode_tasks SET status='cancelled', updated_at=? WHERE episode_id=? AND status='pending'",
+                        (now, episode_id)
+                    )
+
+        logger.info(f"🗃️ [QUEUE] Đồng bộ từ Sheet: {len(pending_rows)} dòng pending, {added} task mới.")
+        return added
+
+    # =========================================================
+    # 🔒 NHẬN TASK BẰNG LEASE
+    # =========================================================
+    def claim(self, owner=None):
+        """
+        Nhận task 'pending' đầu tiên (hoặc task có lease đã hết hạn). Trả về
+        (episode_id, row_idx, row_dict) hoặc None nếu hàng đợi trống (row_idx chỉ là gợi ý).
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        with self._transaction() as conn:
+            # Task hết lease quá số lần cho phép -> FAILED (tránh crash lặp vô hạn)
+            conn.execute(
+                """UPDATE episode_tasks SET status='failed', synced=0, lease_owner=NULL, updated_at=?
+                   WHERE status='leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                """SELECT episode_id, row_idx, payload, status, lease_owner FROM episode_tasks
+                   WHERE status='pending' OR (status='leased' AND lease_expires < ?)
+                   ORDER BY row_idx LIMIT 1""",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "leased":
+                logger.warning(f"⚠️ [QUEUE] Lease của tập {row['episode_id']} ({row['lease_owner']}) đã hết hạn -> nhận lại.")
+            conn.execute(
+                """UPDATE episode_tasks SET status='leased', lease_owner=?, lease_expires=?,
+                       attempts=attempts+1, synced=0, updated_at=?
+                   WHERE episode_id=?""",
+                (owner, now + self.lease_seconds, now, row["episode_id"])
+            )
+        logger.info(f"🔒 [QUEUE] {owner} nhận tập {row['episode_id']} (dòng {row['row_idx']}).")
+        return row["episode_id"], row["row_idx"], json.loads(row["payload"])
+
+    def heartbeat(self, episode_id, owner=None):
+        """Gia hạn lease. False nếu lease đã mất (hết hạn và bị worker khác nhận)."""
+        owner = owner or default_owner()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE episode_tasks SET lease_expires=? WHERE episode_id=? AND status='leased' AND lease_owner=?",
+                (time.time() + self.lease_seconds, episode_id, owner)
+            )
+        if not cur.rowcount:
+            logger.warning(f"⚠️ [QUEUE] Mất lease tập {episode_id} ({owner}).")
+        return bool(cur.rowcount)
+
+    @contextmanager
+    def lease(self, episode_id, owner=None):
+        """Giữ lease trong lúc xử lý: thread nền gia hạn mỗi 1/3 thời hạn lease."""
+        owner = owner or default_owner()
+        stop = threading.Event()
+
+        def _keep_alive():
+            while not stop.wait(max(1, self.lease_seconds / 3)):
+                try:
+                    if not self.heartbeat(episode_id, owner):
+                        return
+                except Exception as e:
+                    logger.warning(f"⚠️ [QUEUE] Heartbeat lỗi (tập {episode_id}): {e}")
+
+        thread = threading.Thread(target=_keep_alive, name=f"lease-{episode_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, episode_id, status, owner=None):
+        """Ghi trạng thái cuối ('DONE' / 'FAILED'), chờ đồng bộ lên Sheet."""
+        owner = owner or default_owner()
+        local_status = "done" if str(status).upper() == "DONE" else "failed"
+        with self._transaction() as conn:
+            cur = conn.execute(
+                """UPDATE episode_tasks SET status=?, lease_owner=NULL, lease_expires=NULL, synced=0, updated_at=?
+                   WHERE episode_id=? AND lease_owner=?""",
+                (local_status, time.time(), episode_id, owner)
+            )
+        if not cur.rowcount:
+            logger.warning(f"⚠️ [QUEUE] Tập {episode_id} không còn thuộc {owner} -> bỏ qua kết quả {status}.")
+        return bool(cur.rowcount)
+
+    # =========================================================
+    # 🔄 ĐỒNG BỘ SQLITE -> SHEET (1 REQUEST CHO MỌI THAY ĐỔI)
+    # =========================================================
+    def sync_to_sheet(self, ws, status_col=None):
+        """
+        Đẩy trạng thái các task chưa đồng bộ lên Sheet bằng 1 batch_update. Trả về số ô đã ghi.
+        Dòng đích được dò lại theo cột ID ngay trước khi ghi (Sheet có thể đã bị chèn / xóa dòng);
+        row_idx đã lưu chỉ dùng để chọn khi 1 ID xuất hiện ở nhiều dòng.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT episode_id, row_idx, status, updated_at FROM episode_tasks
+                   WHERE synced=0 AND status IN ('leased', 'done', 'failed')"""
+            ).fetchall()
+        if not rows:
+            return 0
+
+        header = read_header(ws)
+        status_col = status_col or get_status_col(ws, header)
+        id_rows = read_id_rows(ws, header)
+
+        updates, targets = [], {}
+        for r in rows:
+            candidates = id_rows.get(r["episode_id"], [])
+            if not candidates:
+                # Dòng của tập đã bị xóa khỏi Sheet -> không còn chỗ để ghi
+                logger.warning(f"⚠️ [QUEUE] Không tìm thấy ID {r['episode_id']} trên Sheet -> bỏ qua trạng thái {r['status']}.")
+                continue
+            target = r["row_idx"] if r["row_idx"] in candidates else candidates[0]
+            if target != r["row_idx"]:
+                logger.info(f"🗃️ [QUEUE] Tập {r['episode_id']} đã chuyển từ dòng {r['row_idx']} sang dòng {target}.")
+            targets[r["episode_id"]] = target
+            updates.append((target, status_col, SHEET_STATUS[r["status"]]))
+        update_cells(ws, updates)
+
+        # Chỉ đánh dấu đã đồng bộ nếu trạng thái không đổi trong lúc ghi Sheet
+        with self._transaction() as conn:
+            for r in rows:
+                conn.execute(
+                    """UPDATE episode_tasks SET synced=1, row_idx=?
+                       WHERE episode_id=? AND status=? AND updated_at=?""",
+                    (targets.get(r["episode_id"], r["row_idx"]), r["episode_id"], r["status"], r["updated_at"])
+                )
+        logger.info(f"🗃️ [QUEUE] Đã đồng bộ {len(updates)} trạng thái lên Sheet.")
+        return len(updates)
+
+    def stats(self):
+        with self._connect() as conn:
+            return {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM episode_tasks GROUP BY status")}
@@ -0,0 +1,44 @@
+# === scripts/tts_cache.py ===
+import os
+import shutil
+import logging
+from disk_cache import DiskCache, make_key
+
+logger = logging.getLogger(__name__)
+
+# Tắt cache bằng TTS_CHUNK_CACHE=0 (VD: muốn đọc lại với giọng ngẫu nhiên khác)
+TTS_CHUNK_CACHE_ENABLED = os.getenv("TTS_CHUNK_CACHE", "1") != "0"
+# Giới hạn dung lượng cache audio từng đoạn (mặc định 1GB ~ vài nghìn đoạn mp3)
+TTS_CHUNK_CACHE_MAX_BYTES = int(os.getenv("TTS_CHUNK_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+_cache = DiskCache("tts_chunks", TTS_CHUNK_CACHE_MAX_BYTES)
+
+
+def chunk_key(text, signature):
+    """Khóa theo nội dung: text đoạn (đã làm sạch) + backend / giọng / tốc độ đọc."""
+    return make_key("tts_chunk", signature, text)
+
+
+def fetch(key, output_path):
+    """Chép audio đã lưu ra output_path. Trúng cache -> dict thông tin đi kèm, ngược lại None."""
+    if not TTS_CHUNK_CACHE_ENABLED:
+        return None
+    meta = _cache.get(key)
+    if not meta:
+        return None
+    try:
+        shutil.copyfile(_cache.blob_path(key, "audio.mp3"), output_path)
+        return meta.get("value") or {}
+    except OSError as e:
+        logger.warning(f"⚠️ [TTS CACHE] Không chép được audio đã lưu: {e}")
+        return None
+
+
+def store(key, audio_path, info=None):
+    """info: thông tin đi kèm audio (VD: tốc độ backend đã áp dụng)."""
+    if TTS_CHUNK_CACHE_ENABLED and os.path.exists(audio_path):
+        _cache.put(key, value=info, files={"audio.mp3": audio_path})
+
+
+def tts_cache_stats():
+    return _cache.stats()
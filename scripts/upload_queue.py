@@ -0,0 +1,76 @@
+# === scripts/upload_queue.py ===
+import logging
+import queue
+import threading
+import contextvars
+import profiler
+import backends
+from utils import lazy_import
+from stage_cache import run_cached
+from disk_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# googleapiclient chỉ được import khi có video cần upload
+upload_video = lazy_import("upload_youtube", "upload_video")
+
+_STOP = object()
+
+
+class UploadQueue:
+    """
+    Hàng đợi upload YouTube chạy nền trên thread riêng.
+    Pipeline chỉ cần submit() rồi tiếp tục render, cuối cùng gọi drain()
+    để chờ upload xong và lấy kết quả từng video.
+    """
+    def __init__(self, name="uploads"):
+        self.name = name
+        self._queue = queue.Queue()
+        self._results = {}
+        self._lock = threading.Lock()
+        # Worker chạy trong context của tập đã tạo hàng đợi (để ghi số liệu vào đúng profiler)
+        ctx = contextvars.copy_context()
+        self._thread = threading.Thread(target=ctx.run, args=(self._worker,), name=f"{name}-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, label, video_path, metadata, thumbnail_path=None, publish_at=None):
+        """Đưa 1 video vào hàng đợi. label: tên hiển thị trong báo cáo (VD: 'long', 'short_1')."""
+        logger.info(f"📤 [UPLOAD QUEUE] Xếp hàng: {label} ({self._queue.qsize()} đang chờ)")
+        self._queue.put((label, video_path, metadata, thumbnail_path, publish_at))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            label, video_path, metadata, thumbnail_path, publish_at = item
+            try:
+                # Video đã upload ở lần chạy trước (cùng nội dung) -> trả về video ID cũ
+                with profiler.stage(f"upload_queue/{label}"):
+                    result = run_cached(
+                        "upload",
+                        # Video ID giả (FAKE_SERVICES=youtube) không bao giờ được trả cho lần chạy thật
+                        [file_digest(video_path), metadata, file_digest(thumbnail_path), backends.use_fake("youtube")],
+                        lambda: upload_video(video_path, metadata, thumbnail_path=thumbnail_path, publish_at=publish_at)
+                    )
+            except Exception as e:
+                logger.error(f"❌ [UPLOAD QUEUE] {label} Crash: {e}", exc_info=True)
+                result = "FAILED"
+            with self._lock:
+                self._results[label] = result
+            self._queue.task_done()
+
+    def drain(self):
+        """Chờ mọi upload xong, dừng worker và trả về {label: video_id hoặc 'FAILED'}."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        with self._lock:
+            results = dict(self._results)
+
+        for label, result in results.items():
+            if result == "FAILED" or not result:
+                logger.error(f"❌ [UPLOAD QUEUE] {label}: THẤT BẠI")
+            else:
+                logger.info(f"✅ [UPLOAD QUEUE] {label}: {result}")
+        return results
@@ -4,11 +4,10 @@ import pickle
 import logging
 import time
 import random
+import threading
 from datetime import datetime, timezone
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
-from googleapiclient.errors import HttpError
+import profiler
+import backends
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -20,12 +19,48 @@ MAX_DESCRIPTION_LENGTH = 4900
 # Các scope cần thiết
 SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 
+# Giữ "ấm" giữa các tập (daemon mode): credential đã nạp + discovery document.
+# Service vẫn tạo mới mỗi lần gọi (httplib2 không an toàn khi dùng chung giữa các thread).
+_warm = {"creds": None, "discovery": None}
+_warm_lock = threading.Lock()
+
+def _load_discovery_document():
+    """Discovery document tĩnh của YouTube v3 (đi kèm googleapiclient), chỉ đọc 1 lần."""
+    if _warm["discovery"] is None:
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+            _warm["discovery"] = get_static_doc("youtube", "v3") or ""
+        except Exception:
+            _warm["discovery"] = ""
+    return _warm["discovery"]
+
 def get_authenticated_service():
     """Xác thực với YouTube API bằng token.pickle"""
-    creds = None
-    
+    # Endpoint giả lập (PIPELINE_BACKEND=fake / FAKE_SERVICES=youtube)
+    if backends.use_fake("youtube"):
+        return backends.FakeYouTube()
+
+    # googleapiclient chỉ import khi upload thật (chạy giả lập / offline không cần cài)
+    from googleapiclient.discovery import build, build_from_document
+
+    with _warm_lock:
+        creds = _load_credentials()
+        if not creds:
+            return None
+        discovery = _load_discovery_document()
+
+    if discovery:
+        return build_from_document(discovery, credentials=creds)
+    return build("youtube", "v3", credentials=creds)
+
+def _load_credentials():
+    # Credential còn hạn từ lần trước -> dùng lại, không đọc file / refresh
+    creds = _warm["creds"]
+    if creds and creds.valid:
+        return creds
+
     # 1. Tìm file token
-    if os.path.exists("token.pickle"):
+    if not creds and os.path.exists("token.pickle"):
         with open("token.pickle", "rb") as f:
             creds = pickle.load(f)
             
@@ -34,6 +69,7 @@ def get_authenticated_service():
         if creds and creds.expired and creds.refresh_token:
             logger.info("🔄 Đang làm mới Token YouTube...")
             try:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
                 # Lưu lại token mới nếu môi trường cho phép ghi (Local)
                 # Trên GitHub Actions thì không lưu lại được vĩnh viễn, nhưng dùng cho session này ok
@@ -46,7 +82,22 @@ def get_authenticated_service():
             logger.error("❌ Không tìm thấy token hợp lệ. Hãy chạy script lấy token ở local trước.")
             return None
 
-    return build("youtube", "v3", credentials=creds)
+    _warm["creds"] = creds
+    return creds
+
+def _media_upload(youtube, path, **kwargs):
+    # Endpoint giả lập tự tạo media body, không cần googleapiclient
+    if isinstance(youtube, backends.FakeYouTube):
+        return youtube.media_upload(path, **kwargs)
+    from googleapiclient.http import MediaFileUpload
+    return MediaFileUpload(path, **kwargs)
+
+def _is_http_error(exc):
+    try:
+        from googleapiclient.errors import HttpError
+    except ImportError:
+        return False
+    return isinstance(exc, HttpError)
 
 def upload_video(video_path, episode_data, thumbnail_path=None, publish_at=None):
     """
@@ -108,7 +159,7 @@ def upload_video(video_path, episode_data, thumbnail_path=None, publish_at=None)
         logger.info(f"🚀 Bắt đầu upload: {title}")
         
         # Chunk size -1 để thư viện tự động chọn, resumable=True để upload file lớn ổn định
-        media = MediaFileUpload(video_path, chunksize=-1, resumable=True)
+        media = _media_upload(youtube, video_path, chunksize=-1, resumable=True)
         
         request = youtube.videos().insert(
             part="snippet,status",
@@ -118,13 +169,14 @@ def upload_video(video_path, episode_data, thumbnail_path=None, publish_at=None)
 
         # Vòng lặp upload để hiện tiến trình
         response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                # Chỉ log mỗi 20% để đỡ spam log
-                if progress % 20 == 0:
-                    logger.info(f"   Upload... {progress}%")
+        with profiler.api_call("youtube.upload"):
+            while response is None:
+                status, response = request.next_chunk()
+                if status:
+                    progress = int(status.progress() * 100)
+                    # Chỉ log mỗi 20% để đỡ spam log
+                    if progress % 20 == 0:
+                        logger.info(f"   Upload... {progress}%")
 
         video_id = response.get("id")
         logger.info(f"✅ UPLOAD THÀNH CÔNG! Video ID: {video_id}")
@@ -133,24 +185,24 @@ def upload_video(video_path, episode_data, thumbnail_path=None, publish_at=None)
         if thumbnail_path and os.path.exists(thumbnail_path):
             try:
                 logger.info(f"🖼️ Đang upload thumbnail...")
-                youtube.thumbnails().set(
-                    videoId=video_id,
-                    media_body=MediaFileUpload(thumbnail_path)
-                ).execute()
+                with profiler.api_call("youtube.thumbnail"):
+                    youtube.thumbnails().set(
+                        videoId=video_id,
+                        media_body=_media_upload(youtube, thumbnail_path)
+                    ).execute()
                 logger.info("✅ Thumbnail đã cập nhật.")
             except Exception as e:
                 logger.warning(f"⚠️ Lỗi upload thumbnail (Video vẫn OK): {e}")
 
         return video_id
 
-    except HttpError as e:
-        # Xử lý lỗi Quota hoặc lỗi mạng
-        if e.resp.status == 403 and "quotaExceeded" in str(e):
-            logger.critical("❌ FATAL: Hết hạn ngạch (Quota) YouTube hôm nay!")
-        else:
-            logger.error(f"❌ YouTube API Error: {e}")
-        return "FAILED"
-        
     except Exception as e:
+        if _is_http_error(e):
+            # Xử lý lỗi Quota hoặc lỗi mạng
+            if e.resp.status == 403 and "quotaExceeded" in str(e):
+                logger.critical("❌ FATAL: Hết hạn ngạch (Quota) YouTube hôm nay!")
+            else:
+                logger.error(f"❌ YouTube API Error: {e}")
+            return "FAILED"
         logger.error(f"❌ Lỗi Upload không xác định: {e}", exc_info=True)
         return "FAILED"
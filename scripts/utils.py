@@ -1,6 +1,7 @@
 # ===scripts/utils.py (Đã Tối Ưu)===
 import os
 import logging
+import importlib
 import shutil # Import mới cho cleanup
 
 # Thiết lập logger (tùy chọn, cần được cấu hình ở file chính)
@@ -22,7 +23,8 @@ def setup_environment():
         'assets/intro_outro', 'assets/background_music',
         'assets/temp', 
         'outputs/audio', 'outputs/video', 'outputs/shorts',
-        'outputs/thumbnails' # <-- ĐÃ THÊM THƯ MỤC THUMBNAILS
+        'outputs/thumbnails', # <-- ĐÃ THÊM THƯ MỤC THUMBNAILS
+        'outputs/reports'     # Báo cáo hiệu năng (JSON) của từng lần chạy
     ]
     
     for d in required_dirs:
@@ -30,8 +32,26 @@ def setup_environment():
         
     logger.info(f"✅ Cấu trúc thư mục dự án đã sẵn sàng tại: {PROJECT_ROOT}")
 
+def lazy_import(module_name, attr, optional=False):
+    """
+    Trả về hàm gọi tới module_name.attr nhưng chỉ import module ở lần gọi đầu tiên
+    (moviepy, googleapiclient, pydub... tốn vài giây để import).
+    optional=True: thiếu module -> log cảnh báo và trả về None thay vì ném ImportError.
+    """
+    def _call(*args, **kwargs):
+        try:
+            func = getattr(importlib.import_module(module_name), attr)
+        except ImportError as e:
+            if not optional:
+                raise
+            logger.warning(f"⚠️ Module '{module_name}' chưa được cài đặt đầy đủ: {e}")
+            return None
+        return func(*args, **kwargs)
+    _call.__name__ = attr
+    return _call
+
 # --- HÀM DỌN DẸP (CLEANUP) MỚI ---
-def cleanup_temp_files(episode_id: str, text_hash: str):
+def cleanup_temp_files(episode_id: str, text_hash: str = None):
     """
     Xóa các file tạm liên quan đến episode đã hoàn thành.
     """
@@ -39,10 +59,12 @@ def cleanup_temp_files(episode_id: str, text_hash: str):
         # FIX LỖI: Chuyển đổi ID sang chuỗi để tránh lỗi startswith(int)
         episode_id_str = str(episode_id) 
 
-        # 1. Xóa các file trung gian (TTS chunks, ảnh AI raw, hybrid BG)
+        # 1. Xóa các file trung gian (TTS chunks + .words.json, overlay char_blend, hybrid BG)
         temp_dir = get_path("assets", "temp")
         for f in os.listdir(temp_dir):
-            if f.startswith(episode_id_str) or f.startswith("char_blend_mix") or f.startswith("img_clip"):
+            # Mọi file trung gian đều đặt tên "ID_..." -> so khớp "ID_" để không xóa nhầm file
+            # của tập khác đang chạy song song (VD: ID 1 và 12)
+            if f.startswith(f"{episode_id_str}_"):
                 os.remove(os.path.join(temp_dir, f))
         
         # 2. Xóa các file output trung gian (Audio Mix, Thumb)
@@ -51,10 +73,17 @@ def cleanup_temp_files(episode_id: str, text_hash: str):
 
         thumb_out = get_path("outputs", "thumbnails", f"{episode_id_str}_thumb.jpg")
         if os.path.exists(thumb_out): os.remove(thumb_out)
+
+        # File alignment (.align.json) đi kèm audio TTS: chỉ cần lúc cắt Shorts (stage cache giữ bản sao)
+        audio_dir = get_path("data", "audio")
+        if os.path.isdir(audio_dir):
+            for f in os.listdir(audio_dir):
+                if f.startswith(f"{episode_id_str}_") and f.endswith(".align.json"):
+                    os.remove(os.path.join(audio_dir, f))
         
         # 3. Xóa thư mục Assets/Hash (chứa ảnh AI đã tải và script)
-        asset_folder = get_path('assets', text_hash)
-        if os.path.exists(asset_folder):
+        asset_folder = get_path('assets', text_hash) if text_hash else None
+        if asset_folder and os.path.exists(asset_folder):
             if os.listdir(asset_folder):
                  shutil.rmtree(asset_folder, ignore_errors=True) 
 